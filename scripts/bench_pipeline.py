@@ -0,0 +1,205 @@
+#!/usr/bin/env python3
+r"""
+Benchmark de las etapas de migración sobre datos sintéticos.
+
+Uso:
+  python scripts/bench_pipeline.py --workdir bench --scale 10 --out bench/report.json
+  python scripts/bench_pipeline.py --workdir bench --scale 10 --out bench/report2.json --compare bench/report.json
+
+Genera los CSV con `synth_data.py` (misma semilla = mismos datos) y corre cada
+etapa como un proceso aparte, en este orden:
+
+  generate_csv, generate_csv_headerless, create_sqlite_and_import,
+  import_headerless_csvs, generate_d1_insert_batches, generate_dump,
+  prepare_d1_sql
+
+Por etapa se guarda el tiempo total, filas/s, bytes/s y el pico de memoria
+residente (RSS) del proceso. Los bytes son los CSV leídos en las importaciones,
+el SQL escrito en las exportaciones y el dump leído en `prepare_d1_sql`. El
+pico de RSS sale de `os.wait4` y no está disponible en Windows.
+
+El reporte JSON tiene siempre las mismas claves para poder compararlo entre
+corridas; `--compare BASE.json` imprime la razón contra un reporte anterior.
+Los argumentos tras `--` se pasan a los importadores (p.ej. `-- --workers 4`).
+"""
+import argparse
+import json
+import os
+import platform
+import shutil
+import sqlite3
+import subprocess
+import sys
+import time
+from datetime import datetime, timezone
+
+SCRIPTS_DIR = os.path.dirname(os.path.abspath(__file__))
+REPO_DIR = os.path.dirname(SCRIPTS_DIR)
+
+
+def dir_bytes(path, suffixes=('.sql', '.csv')):
+    if os.path.isfile(path):
+        return os.path.getsize(path)
+    total = 0
+    for name in os.listdir(path):
+        full = os.path.join(path, name)
+        if os.path.isfile(full) and name.endswith(suffixes):
+            total += os.path.getsize(full)
+    return total
+
+
+def run_stage(name, argv, log_path):
+    """Corre un script de scripts/ y devuelve (segundos, pico RSS en MB o None, código de salida)."""
+    cmd = [sys.executable, os.path.join(SCRIPTS_DIR, argv[0])] + argv[1:]
+    print(f'[{name}] ' + ' '.join(cmd[1:]))
+    with open(log_path, 'w', encoding='utf-8') as log:
+        started = time.perf_counter()
+        proc = subprocess.Popen(cmd, stdout=log, stderr=subprocess.STDOUT, cwd=REPO_DIR)
+        if hasattr(os, 'wait4'):
+            _, status, usage = os.wait4(proc.pid, 0)
+            elapsed = time.perf_counter() - started
+            # ru_maxrss is KiB on Linux and bytes on macOS
+            rss = usage.ru_maxrss / (1024 * 1024 if sys.platform == 'darwin' else 1024)
+            code = os.waitstatus_to_exitcode(status)
+            proc.returncode = code
+        else:
+            code = proc.wait()
+            elapsed = time.perf_counter() - started
+            rss = None
+    return elapsed, rss, code
+
+
+def stage_result(name, argv, elapsed, rss, code, rows, nbytes, log_path):
+    return {
+        'stage': name,
+        'command': ' '.join(argv),
+        'returncode': code,
+        'wall_s': round(elapsed, 4),
+        'rows': rows,
+        'rows_per_s': round(rows / elapsed, 1) if elapsed else None,
+        'bytes': nbytes,
+        'bytes_per_s': round(nbytes / elapsed, 1) if elapsed else None,
+        'peak_rss_mb': round(rss, 1) if rss is not None else None,
+        'log': log_path,
+    }
+
+
+def create_empty_db(path, schema):
+    if os.path.exists(path):
+        os.remove(path)
+    conn = sqlite3.connect(path)
+    with open(schema, 'r', encoding='utf-8') as f:
+        conn.executescript(f.read())
+    conn.close()
+
+
+def compare(report, base_path):
+    with open(base_path, 'r', encoding='utf-8') as f:
+        base = {s['stage']: s for s in json.load(f)['stages']}
+    print(f'--- comparado con {base_path} (>1 = más rápido / menos memoria ahora)')
+    for s in report['stages']:
+        b = base.get(s['stage'])
+        if not b:
+            continue
+        speed = b['wall_s'] / s['wall_s'] if s['wall_s'] else float('nan')
+        line = f"{s['stage']:>28}: tiempo x{speed:.2f}"
+        if s['peak_rss_mb'] and b.get('peak_rss_mb'):
+            line += f", RSS x{b['peak_rss_mb'] / s['peak_rss_mb']:.2f}"
+        print(line)
+
+
+def main():
+    argv = sys.argv[1:]
+    extra = []
+    if '--' in argv:
+        extra = argv[argv.index('--') + 1:]
+        argv = argv[:argv.index('--')]
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--workdir', default='bench', help='Carpeta de trabajo (se crea)')
+    parser.add_argument('--seed', type=int, default=1)
+    parser.add_argument('--scale', type=float, default=1.0, help='Tamaño de los datos (ver synth_data.py)')
+    parser.add_argument('--schema', default=os.path.join(REPO_DIR, 'd1_schema.sql'))
+    parser.add_argument('--out', help='Reporte JSON (por defecto <workdir>/report.json)')
+    parser.add_argument('--compare', metavar='BASE_JSON', help='Reporte anterior para comparar')
+    parser.add_argument('--keep', action='store_true', help='Conservar los archivos generados')
+    args = parser.parse_args(argv)
+
+    work = os.path.abspath(args.workdir)
+    os.makedirs(work, exist_ok=True)
+    csv_h = os.path.join(work, 'csv')
+    csv_n = os.path.join(work, 'csv_headerless')
+    db_h = os.path.join(work, 'import.sqlite')
+    db_n = os.path.join(work, 'import_headerless.sqlite')
+    parts = os.path.join(work, 'parts')
+    dump = os.path.join(work, 'data_dump.sql')
+    clean = os.path.join(work, 'data_dump_clean.sql')
+    for d in (csv_h, csv_n, parts):
+        shutil.rmtree(d, ignore_errors=True)
+    if os.path.exists(db_h):
+        os.remove(db_h)
+    create_empty_db(db_n, args.schema)
+
+    synth = ['synth_data.py', '--seed', str(args.seed), '--scale', str(args.scale)]
+    stages = [
+        ('generate_csv', synth + ['--outdir', csv_h], lambda: dir_bytes(csv_h)),
+        ('generate_csv_headerless', synth + ['--outdir', csv_n, '--no-header'], lambda: dir_bytes(csv_n)),
+        ('create_sqlite_and_import',
+         ['create_sqlite_and_import.py', '--db', db_h, '--schema', args.schema, '--csv-dir', csv_h] + extra,
+         lambda: dir_bytes(csv_h)),
+        ('import_headerless_csvs', ['import_headerless_csvs.py', '--db', db_n, '--csv-dir', csv_n] + extra,
+         lambda: dir_bytes(csv_n)),
+        ('generate_d1_insert_batches',
+         ['generate_d1_insert_batches.py', '--db', db_h, '--outdir', parts, '--multi-row', '--batch-size', '0',
+          '--max-bytes', '5000000'], lambda: dir_bytes(parts)),
+        ('generate_dump', ['generate_dump.py', '--db', db_h, '--out', dump], lambda: dir_bytes(dump)),
+        ('prepare_d1_sql', ['prepare_d1_sql.py', '--in', dump, '--out', clean], lambda: dir_bytes(dump)),
+    ]
+
+    results = []
+    rows = None
+    for name, stage_argv, measure in stages:
+        log_path = os.path.join(work, f'{name}.log')
+        elapsed, rss, code = run_stage(name, stage_argv, log_path)
+        if rows is None and name == 'generate_csv' and code == 0:
+            with open(os.path.join(csv_h, 'synth.json'), 'r', encoding='utf-8') as f:
+                rows = json.load(f)['rows']
+        nbytes = measure() if code == 0 else 0
+        result = stage_result(name, stage_argv, elapsed, rss, code, rows or 0, nbytes, log_path)
+        results.append(result)
+        rss_txt = f"{result['peak_rss_mb']} MB" if result['peak_rss_mb'] is not None else 'n/d'
+        print(f"  {elapsed:.2f}s, {result['rows_per_s']:,} filas/s, "
+              f"{result['bytes_per_s'] / 1e6:.1f} MB/s, RSS {rss_txt}" + ('' if code == 0 else f' (código {code})'))
+        if code != 0:
+            print(f'  etapa fallida, ver {log_path}; se detiene el benchmark')
+            break
+
+    report = {
+        'created': datetime.now(timezone.utc).isoformat(timespec='seconds'),
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'sqlite': sqlite3.sqlite_version,
+        'seed': args.seed,
+        'scale': args.scale,
+        'rows': rows or 0,
+        'extra_args': extra,
+        'stages': results,
+    }
+    out = args.out or os.path.join(work, 'report.json')
+    with open(out, 'w', encoding='utf-8') as f:
+        json.dump(report, f, indent=2)
+        f.write('\n')
+    print(f'Reporte escrito en {out}')
+    if args.compare:
+        compare(report, args.compare)
+    if not args.keep:
+        for d in (csv_h, csv_n, parts):
+            shutil.rmtree(d, ignore_errors=True)
+        for p in (db_h, db_n, os.path.splitext(db_n)[0] + '_rejects.csv', dump, clean):
+            if os.path.exists(p):
+                os.remove(p)
+    if any(r['returncode'] != 0 for r in results):
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -7,14 +7,49 @@ Uso:
 
 El script no requiere sqlite3.exe; usa la librería estándar `sqlite3` de Python.
 Hace match de columnas de forma case-insensitive y mapea nombres comunes (p.ej. clerkid -> clerkId).
+
+Cada CSV se lee una sola vez y se inserta en bloques de `--chunk-size` filas,
+cada uno en su propia transacción, así que la memoria no crece con el archivo.
+Con `--workers N` los archivos (y los rangos de bytes de los archivos grandes)
+se parsean en N procesos y esta conexión queda como único escritor.
+
+`--fast-load` está pensado para construir un `sag_d1.sqlite` nuevo: carga sin
+journal, sin fsync y sin FK, crea los índices del esquema al final, corre un
+`PRAGMA foreign_key_check`, ANALYZE y luego `PRAGMA optimize` (o VACUUM con
+`--finalize vacuum`). Sale con código 1 si hay violaciones de FK.
+
+`--checkpoint` guarda, en la misma transacción de cada bloque, el offset del
+archivo hasta donde se importó (ver `import_checkpoint.py`); si la carga se
+corta, `--resume` con la misma BD y carpeta retoma desde ahí sin duplicar filas
+ni reparsear lo ya importado. Con `--fast-load` se usa WAL en lugar de
+journal OFF para que un corte no deje la BD corrupta.
+
+Los valores se convierten al tipo de cada columna antes del INSERT
+(`value_types.py`: enteros, reales, celdas vacías a NULL/DEFAULT y, con
+`--timestamps iso`, fechas al formato del Worker); al final se informa por
+columna cuántos no se pudieron convertir. `--no-convert` deja todo como texto.
+`--json-policy minify` guarda las columnas JSON parseadas y minificadas
+(`json_codec.py`) y al final informa cuántos valores no eran JSON válido.
+
+`--stats`/`--profile` miden las fases read, convert, insert y finalize (ver
+`instrument.py`).
 """
 import sqlite3
 import csv
 import argparse
 import os
 import sys
+import time
+from functools import partial
 from glob import glob
 
+import instrument
+from csv_parallel import header_end, imap_ordered, iter_record_chunks, parse_range, plan_ranges
+from import_checkpoint import (drop_checkpoints, ensure_checkpoint_table, has_checkpoints, resume_point,
+                               write_checkpoint)
+from json_codec import JsonCodec
+from value_types import TIMESTAMP_POLICIES, failures_summary, row_stages
+
 
 COMMON_HEADER_MAP = {
     'clerkid': 'clerkId',
@@ -24,6 +59,11 @@ COMMON_HEADER_MAP = {
     'updatedat': 'updatedAt'
 }
 
+# Filas por executemany/transacción; acota la memoria al importar CSV grandes
+DEFAULT_CHUNK_SIZE = 5000
+# cache_size usado en --fast-load (MB)
+FAST_LOAD_CACHE_MB = 256
+
 
 def normalize_header(h):
     key = h.strip()
@@ -39,11 +79,92 @@ def get_table_columns(conn, table):
     return cols
 
 
-def insert_csv(conn, table, csv_path):
+def map_header_to_columns(conn, table, header):
+    """Resuelve una sola vez qué posición del CSV va a qué columna de la tabla.
+
+    Devuelve (insert_cols, indexes): nombres reales de columna y la posición
+    de cada una en las filas del CSV. Las cabeceras desconocidas se omiten.
+    """
+    # Map headers to actual table columns (case-insensitive)
+    table_cols = get_table_columns(conn, table)
+    table_cols_lower = {c.lower(): c for c in table_cols}
+
+    insert_cols = []
+    indexes = []
+    for i, h in enumerate(header):
+        mapped = table_cols_lower.get(normalize_header(h).lower())
+        if mapped:
+            insert_cols.append(mapped)
+            indexes.append(i)
+    return insert_cols, indexes
+
+
+def pick_columns(indexes, width, row):
+    """Toma de una fila del CSV solo las posiciones mapeadas; None para líneas en blanco."""
+    # skip blank lines (csv.reader yields [] for them)
+    if not row:
+        return None
+    if len(row) < width:
+        row = row + [None] * (width - len(row))
+    return [row[i] for i in indexes]
+
+
+def record_columns(indexes, width, line_no, row):
+    """`pick_columns` con la firma `row_fn(line_no, row)` de csv_parallel (el número de línea no se usa)."""
+    return pick_columns(indexes, width, row)
+
+
+def iter_row_chunks(reader, indexes, chunk_size):
+    """Agrupa las filas del CSV en listas de a lo sumo `chunk_size` valores mapeados."""
+    width = max(indexes) + 1
+    chunk = []
+    for r in reader:
+        vals = pick_columns(indexes, width, r)
+        if vals is None:
+            continue
+        chunk.append(vals)
+        if len(chunk) >= chunk_size:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
+
+
+def build_insert_sql(table, insert_cols):
+    placeholders = ','.join('?' for _ in insert_cols)
+    col_list = ','.join(f'[{c}]' for c in insert_cols)
+    return f'INSERT INTO [{table}] ({col_list}) VALUES ({placeholders})'
+
+
+def write_chunk(conn, sql, chunk):
+    """Inserta un bloque de filas en su propia transacción."""
+    if not conn.in_transaction:
+        conn.execute('BEGIN')
+    try:
+        conn.executemany(sql, chunk)
+    except Exception:
+        conn.rollback()
+        raise
+    conn.commit()
+    return len(chunk)
+
+
+def report(table, csv_path, count, started):
+    elapsed = time.perf_counter() - started
+    rate = count / elapsed if elapsed > 0 else 0.0
+    print(f"Inserted {count} rows into {table} from {csv_path} ({elapsed:.2f}s, {rate:,.0f} rows/s)")
+
+
+def insert_csv(conn, table, csv_path, chunk_size=DEFAULT_CHUNK_SIZE, stages=None):
     if not os.path.exists(csv_path):
         print(f"CSV not found: {csv_path}")
         return 0
-    # Read header
+
+    stats = instrument.current()
+    started = time.perf_counter()
+    count = 0
+    # Single pass: header and rows come from the same reader, and rows are
+    # pushed in fixed-size chunks so memory stays flat regardless of file size.
     with open(csv_path, newline='', encoding='utf8') as f:
         reader = csv.reader(f)
         try:
@@ -52,53 +173,205 @@ def insert_csv(conn, table, csv_path):
             print(f"Empty CSV: {csv_path}")
             return 0
 
-    header_norm = [normalize_header(h) for h in header]
+        insert_cols, indexes = map_header_to_columns(conn, table, header)
+        if not insert_cols:
+            print(f"No matching columns for {csv_path} in table {table}")
+            return 0
 
-    # Map headers to actual table columns (case-insensitive)
-    table_cols = get_table_columns(conn, table)
-    table_cols_lower = {c.lower(): c for c in table_cols}
+        sql = build_insert_sql(table, insert_cols)
+        prepare = stages(conn, table, insert_cols) if stages else None
+        for chunk in stats.timed_iter('read', iter_row_chunks(reader, indexes, chunk_size)):
+            if prepare:
+                with stats.phase('convert'):
+                    prepare(chunk)
+            with stats.phase('insert'):
+                count += write_chunk(conn, sql, chunk)
+
+    stats.add(rows=count, bytes_read=os.path.getsize(csv_path))
+    report(table, csv_path, count, started)
+    return count
 
-    mapped_cols = []
-    for h in header_norm:
-        low = h.lower()
-        if low in table_cols_lower:
-            mapped_cols.append(table_cols_lower[low])
-        else:
-            # skip unknown columns
-            mapped_cols.append(None)
 
-    insert_cols = [c for c in mapped_cols if c is not None]
+def insert_csv_checkpointed(conn, table, csv_path, chunk_size=DEFAULT_CHUNK_SIZE, resume=False, stages=None):
+    """Como `insert_csv`, pero cada bloque confirma también su checkpoint y se puede reanudar."""
+    if not os.path.exists(csv_path):
+        print(f"CSV not found: {csv_path}")
+        return 0
+    cp, fingerprint = resume_point(conn, csv_path, resume)
+    if cp and cp['done']:
+        print(f"Already imported {cp['rows']} rows into {table} from {csv_path}, skipping")
+        return 0
+    header = read_header(csv_path)
+    if not header:
+        print(f"Empty CSV: {csv_path}")
+        return 0
+    insert_cols, indexes = map_header_to_columns(conn, table, header)
     if not insert_cols:
         print(f"No matching columns for {csv_path} in table {table}")
         return 0
 
-    placeholders = ','.join('?' for _ in insert_cols)
-    col_list = ','.join(f'[{c}]' for c in insert_cols)
-    sql = f'INSERT INTO [{table}] ({col_list}) VALUES ({placeholders})'
+    if cp:
+        offset, line, count = cp['offset'], cp['line'], cp['rows']
+        print(f"Resuming {csv_path} at line {line + 1} ({count} rows already imported)")
+    else:
+        (offset, line), count = header_end(csv_path), 0
+    stats = instrument.current()
+    started = time.perf_counter()
+    resumed_from = count
+    first_offset = offset
+    sql = build_insert_sql(table, insert_cols)
+    row_fn = partial(record_columns, indexes, max(indexes) + 1)
+    prepare = stages(conn, table, insert_cols) if stages else None
+    for chunk, offset, line in stats.timed_iter('read', iter_record_chunks(csv_path, offset, line, chunk_size, row_fn)):
+        if prepare:
+            with stats.phase('convert'):
+                prepare(chunk)
+        with stats.phase('insert'):
+            if not conn.in_transaction:
+                conn.execute('BEGIN')
+            try:
+                conn.executemany(sql, chunk)
+                count += len(chunk)
+                write_checkpoint(conn, csv_path, table, fingerprint, offset, line, count)
+            except Exception:
+                conn.rollback()
+                raise
+            conn.commit()
+    write_checkpoint(conn, csv_path, table, fingerprint, offset, line, count, done=True)
+    conn.commit()
+    stats.add(rows=count - resumed_from, bytes_read=offset - first_offset)
+    report(table, csv_path, count - resumed_from, started)
+    return count - resumed_from
 
-    count = 0
+
+def read_header(csv_path):
     with open(csv_path, newline='', encoding='utf8') as f:
-        reader = csv.DictReader(f)
-        rows = []
-        for r in reader:
-            vals = []
-            for h in header_norm:
-                low = h.lower()
-                mapped = None
-                if low in table_cols_lower:
-                    mapped = table_cols_lower[low]
-                # Only include if mapped
-                if mapped:
-                    val = r.get(h) if h in r else r.get(h.strip())
-                    vals.append(val)
-            if vals:
-                rows.append(vals)
-        if rows:
-            conn.executemany(sql, rows)
-            conn.commit()
-            count = len(rows)
-    print(f"Inserted {count} rows into {table} from {csv_path}")
-    return count
+        return next(csv.reader(f), None)
+
+
+def import_parallel(conn, files, chunk_size=DEFAULT_CHUNK_SIZE, workers=2, stages=None):
+    """Importa `files` parseando rangos de bytes en un pool de procesos.
+
+    Este proceso es el único escritor: recibe las filas ya mapeadas en el
+    orden de los archivos y las inserta en bloques de `chunk_size`.
+    """
+    tasks = []
+    targets = {}
+    for fp in files:
+        table = table_from_filename(fp)
+        header = read_header(fp)
+        if not header:
+            print(f"Empty CSV: {fp}")
+            continue
+        insert_cols, indexes = map_header_to_columns(conn, table, header)
+        if not insert_cols:
+            print(f"No matching columns for {fp} in table {table}")
+            continue
+        targets[fp] = (table, build_insert_sql(table, insert_cols),
+                       stages(conn, table, insert_cols) if stages else None)
+        row_fn = partial(record_columns, indexes, max(indexes) + 1)
+        for start, end, first_line in plan_ranges(fp, skip_header=True):
+            tasks.append((fp, start, end, first_line, row_fn))
+
+    stats = instrument.current()
+    total = 0
+    counts = {fp: 0 for fp in targets}
+    started = time.perf_counter()
+    # 'read' here is the time spent waiting for the workers' parsed ranges
+    for task, rows in stats.timed_iter('read', imap_ordered(parse_range, tasks, workers)):
+        fp = task[0]
+        _, sql, prepare = targets[fp]
+        if prepare:
+            # In the writer, so one JSON cache and one set of counters covers every range
+            with stats.phase('convert'):
+                prepare(rows)
+        with stats.phase('insert'):
+            for i in range(0, len(rows), chunk_size):
+                counts[fp] += write_chunk(conn, sql, rows[i:i + chunk_size])
+        stats.add(bytes_read=task[2] - task[1])
+    for fp, count in counts.items():
+        print(f"Inserted {count} rows into {targets[fp][0]} from {fp}")
+        total += count
+    stats.add(rows=total)
+    report('all tables', f'{len(counts)} file(s)', total, started)
+    return total
+
+
+def split_schema(sql):
+    """Separa el esquema en (sentencias, índices) para crear los índices después de la carga.
+
+    Los `PRAGMA foreign_keys` del esquema se descartan: en modo fast-load las
+    FK se verifican una sola vez al final con `PRAGMA foreign_key_check`.
+    """
+    statements = []
+    indexes = []
+    buf = ''
+    for line in sql.splitlines(keepends=True):
+        buf += line
+        if not sqlite3.complete_statement(buf):
+            continue
+        stmt = buf.strip()
+        buf = ''
+        body = '\n'.join(l for l in stmt.splitlines() if not l.lstrip().startswith('--')).strip()
+        head = body.upper()
+        if head.startswith('PRAGMA FOREIGN_KEYS'):
+            continue
+        if head.startswith('CREATE INDEX') or head.startswith('CREATE UNIQUE INDEX'):
+            indexes.append(stmt)
+        else:
+            statements.append(stmt)
+    if buf.strip():
+        statements.append(buf.strip())
+    return statements, indexes
+
+
+def begin_fast_load(conn, cache_mb=FAST_LOAD_CACHE_MB, journal='OFF'):
+    """PRAGMAs de carga masiva: sin journal, sin fsync, caché grande y sin FK.
+
+    `journal='WAL'` para cargas reanudables: sin journal, un corte a mitad de
+    una transacción puede dejar la BD corrupta; con WAL sin fsync un proceso
+    que muere no pierde los bloques ya confirmados.
+    """
+    conn.execute(f'PRAGMA journal_mode = {journal}')
+    conn.execute('PRAGMA synchronous = OFF')
+    conn.execute(f'PRAGMA cache_size = -{cache_mb * 1024}')
+    conn.execute('PRAGMA temp_store = MEMORY')
+    conn.execute('PRAGMA foreign_keys = OFF')
+
+
+def finish_fast_load(conn, indexes, finalize='optimize'):
+    """Crea los índices diferidos, verifica FK, ANALYZE y VACUUM/optimize.
+
+    Devuelve la cantidad de violaciones de FK encontradas.
+    """
+    for stmt in indexes:
+        conn.execute(stmt)
+    conn.commit()
+    if indexes:
+        print(f'Created {len(indexes)} deferred index(es)')
+
+    violations = conn.execute('PRAGMA foreign_key_check').fetchall()
+    if violations:
+        summary = {}
+        for table, _rowid, parent, _fkid in violations:
+            summary[(table, parent)] = summary.get((table, parent), 0) + 1
+        for (table, parent), n in sorted(summary.items()):
+            print(f'FK violation: {n} row(s) in {table} reference missing {parent}')
+    else:
+        print('foreign_key_check: OK')
+
+    conn.execute('ANALYZE')
+    conn.commit()
+    # Restore durable settings before the final rewrite
+    conn.execute('PRAGMA synchronous = FULL')
+    conn.execute('PRAGMA journal_mode = DELETE')
+    if finalize == 'vacuum':
+        conn.execute('VACUUM')
+    else:
+        conn.execute('PRAGMA optimize')
+    conn.execute('PRAGMA foreign_keys = ON')
+    print(f'ANALYZE + {finalize} done')
+    return len(violations)
 
 
 def find_csv_files(csv_dir):
@@ -121,7 +394,26 @@ def main():
     parser.add_argument('--db', required=True, help='SQLite DB path to create/use')
     parser.add_argument('--schema', required=True, help='Path to d1_schema.sql')
     parser.add_argument('--csv-dir', required=True, help='Directory containing CSVs')
+    parser.add_argument('--chunk-size', type=int, default=DEFAULT_CHUNK_SIZE, help='Rows per executemany/transaction')
+    parser.add_argument('--workers', type=int, default=0, help='Parse CSVs in N processes with a single writer (0 = serial)')
+    parser.add_argument('--fast-load', action='store_true', help='Bulk-load a fresh DB: no journal/sync/FK during load, indexes after data')
+    parser.add_argument('--finalize', choices=['optimize', 'vacuum'], default='optimize', help='Final step after ANALYZE in --fast-load mode')
+    parser.add_argument('--checkpoint', action='store_true', help='Record per-file progress with each chunk so the import can be resumed')
+    parser.add_argument('--resume', action='store_true', help='Continue an interrupted --checkpoint import (implies --checkpoint)')
+    parser.add_argument('--keep-checkpoints', action='store_true', help='Keep the checkpoint table after a complete import')
+    parser.add_argument('--json-policy', choices=['raw', 'minify'], default='raw', help='Store JSON columns as read or parsed and minified (see json_codec.py)')
+    parser.add_argument('--no-convert', action='store_true', help='Insert CSV values as text and let SQLite affinity convert them')
+    parser.add_argument('--timestamps', choices=TIMESTAMP_POLICIES, default='keep', help="'iso' rewrites *At columns as UTC ISO-8601 like the Worker writes them")
+    instrument.add_arguments(parser)
     args = parser.parse_args()
+    stats = instrument.current()
+    codec = JsonCodec() if args.json_policy == 'minify' else None
+    failures = {}
+    stages = partial(row_stages, codec=codec, convert=not args.no_convert, timestamps=args.timestamps,
+                     failures=failures)
+    checkpoint = args.checkpoint or args.resume
+    if checkpoint and args.workers > 0:
+        parser.error('--checkpoint/--resume import files serially; drop --workers')
 
     if not os.path.exists(args.schema):
         print('Schema file not found:', args.schema)
@@ -130,23 +422,72 @@ def main():
     conn = sqlite3.connect(args.db)
     with open(args.schema, 'r', encoding='utf8') as f:
         sql = f.read()
-    conn.executescript(sql)
-    print(f"Created/updated DB {args.db} using schema {args.schema}")
+    # A resumed import already created the schema (the tables are not IF NOT EXISTS)
+    resuming = checkpoint and has_checkpoints(conn)
+    if resuming and not args.resume:
+        raise SystemExit(f'{args.db} has an unfinished checkpointed import; use --resume to continue it')
+    if args.resume and not resuming and conn.execute(
+            "SELECT 1 FROM sqlite_master WHERE type='table' AND name NOT LIKE 'sqlite_%'").fetchone():
+        # The checkpoint table is dropped when an import completes: the tables exist but there is nothing to resume
+        print(f'Nothing to resume: {args.db} already holds a completed import')
+        conn.close()
+        return
+    deferred_indexes = []
+    if args.fast_load:
+        begin_fast_load(conn, journal='WAL' if checkpoint else 'OFF')
+        statements, deferred_indexes = split_schema(sql)
+        if not resuming:
+            for stmt in statements:
+                conn.execute(stmt)
+        conn.commit()
+    elif not resuming:
+        conn.executescript(sql)
+    if resuming:
+        print(f"Resuming import into {args.db}")
+    else:
+        print(f"Created/updated DB {args.db} using schema {args.schema}")
+    if checkpoint:
+        ensure_checkpoint_table(conn)
 
     files = find_csv_files(args.csv_dir)
     if not files:
         print('No CSV files found in', args.csv_dir)
         sys.exit(0)
 
-    total = 0
-    for fp in files:
-        table = table_from_filename(fp)
-        print('Importing', fp, '-> table', table)
-        total += insert_csv(conn, table, fp)
+    with stats.profiled():
+        if args.workers > 0:
+            total = import_parallel(conn, files, chunk_size=args.chunk_size, workers=args.workers, stages=stages)
+        else:
+            total = 0
+            for fp in files:
+                table = table_from_filename(fp)
+                print('Importing', fp, '-> table', table)
+                if checkpoint:
+                    total += insert_csv_checkpointed(conn, table, fp, chunk_size=args.chunk_size, resume=args.resume,
+                                                     stages=stages)
+                else:
+                    total += insert_csv(conn, table, fp, chunk_size=args.chunk_size, stages=stages)
 
     print(f'Total rows inserted: {total}')
+    if not args.no_convert:
+        print(failures_summary(failures))
+        stats.count('conversion_failures', sum(failures.values()))
+    if codec:
+        print(codec.summary())
+        stats.count('json_malformed', sum(codec.malformed.values()))
+    if checkpoint and not args.keep_checkpoints:
+        # Every file finished: the bookkeeping table must not reach the D1 exports
+        drop_checkpoints(conn)
+    violations = 0
+    if args.fast_load:
+        with stats.phase('finalize'):
+            violations = finish_fast_load(conn, deferred_indexes, finalize=args.finalize)
+        stats.count('fk_violations', violations)
     conn.close()
+    if violations:
+        sys.exit(1)
 
 
 if __name__ == '__main__':
-    main()
+    with instrument.session('create_sqlite_and_import'):
+        main()
@@ -0,0 +1,146 @@
+#!/usr/bin/env python3
+"""
+Utilidades para parsear CSV en paralelo con un único escritor SQLite.
+
+Lo usan `create_sqlite_and_import.py` e `import_headerless_csvs.py` con `--workers N`:
+cada archivo se divide en rangos de bytes que terminan en fin de registro,
+un pool de procesos parsea/convierte cada rango y el proceso principal
+(la única conexión SQLite) inserta los resultados en orden.
+
+`iter_record_chunks` recorre un archivo en serie desde un offset dado; lo usan
+las importaciones con checkpoint (`import_checkpoint.py`) para reanudar.
+"""
+import csv
+import io
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+
+# Tamaño objetivo de cada rango que parsea un worker
+DEFAULT_RANGE_BYTES = 8 * 1024 * 1024
+SCAN_BLOCK = 1024 * 1024
+
+
+def plan_ranges(path, target_bytes=DEFAULT_RANGE_BYTES, skip_header=False):
+    """Divide `path` en rangos de bytes que terminan en fin de registro CSV.
+
+    Solo corta en un salto de línea fuera de comillas (número de '"' par desde
+    el inicio), así un campo con saltos de línea (p.ej. JSON multilínea) nunca
+    queda partido entre dos rangos. Con `skip_header` el primer registro se omite.
+
+    Devuelve una lista de (start, end, first_line), donde first_line es la
+    cantidad de líneas físicas anteriores a `start`.
+    """
+    ranges = []
+    start = start_line = 0
+    header_pending = skip_header
+    want = 1 if skip_header else target_bytes
+    offset = lines = 0
+    odd = False
+    with open(path, 'rb') as f:
+        while True:
+            block = f.read(SCAN_BLOCK)
+            if not block:
+                break
+            end = offset + len(block)
+            cursor = 0
+            while start + want <= end:
+                idx = block.find(b'\n', max(cursor, start + want - 1 - offset))
+                if idx == -1:
+                    break
+                odd ^= block.count(b'"', cursor, idx) & 1
+                lines += block.count(b'\n', cursor, idx + 1)
+                cursor = idx + 1
+                if odd:
+                    continue
+                cut = offset + cursor
+                if header_pending:
+                    header_pending = False
+                    want = target_bytes
+                else:
+                    ranges.append((start, cut, start_line))
+                start, start_line = cut, lines
+            odd ^= block.count(b'"', cursor) & 1
+            lines += block.count(b'\n', cursor)
+            offset = end
+    if offset > start and not header_pending:
+        ranges.append((start, offset, start_line))
+    return ranges
+
+
+def parse_range(path, start, end, first_line, row_fn):
+    """Parsea el rango [start, end) de `path` y aplica `row_fn(line_no, row)` a cada registro.
+
+    Los registros para los que `row_fn` devuelve None se descartan.
+    """
+    with open(path, 'rb') as f:
+        f.seek(start)
+        data = f.read(end - start)
+    return parse_bytes(data, first_line, row_fn)
+
+
+def parse_bytes(data, first_line, row_fn):
+    """Parsea registros CSV completos en `data` (bytes) como `parse_range`."""
+    reader = csv.reader(io.StringIO(data.decode('utf8'), newline=''))
+    out = []
+    for row in reader:
+        value = row_fn(first_line + reader.line_num, row)
+        if value is not None:
+            out.append(value)
+    return out
+
+
+def iter_record_chunks(path, start, first_line, chunk_records, row_fn):
+    """Lee `path` desde el byte `start` y produce (filas, offset, líneas) cada `chunk_records` registros.
+
+    `offset` y `líneas` indican dónde empieza el registro siguiente (siempre un
+    fin de registro, con el mismo criterio de comillas que `plan_ranges`), así
+    que se pueden guardar para retomar la lectura exactamente ahí.
+    """
+    with open(path, 'rb') as f:
+        f.seek(start)
+        buf = []
+        records = 0
+        odd = False
+        offset, lines = start, first_line
+        chunk_line = first_line
+        for line in f:
+            buf.append(line)
+            offset += len(line)
+            lines += line.count(b'\n')
+            odd ^= line.count(b'"') & 1
+            if odd:
+                continue
+            records += 1
+            if records >= chunk_records:
+                yield parse_bytes(b''.join(buf), chunk_line, row_fn), offset, lines
+                buf = []
+                records = 0
+                chunk_line = lines
+        if buf:
+            yield parse_bytes(b''.join(buf), chunk_line, row_fn), offset, lines
+
+
+def header_end(path):
+    """(offset, líneas) justo después del primer registro (la cabecera) de `path`."""
+    for _rows, offset, lines in iter_record_chunks(path, 0, 0, 1, lambda line_no, row: None):
+        return offset, lines
+    return 0, 0
+
+
+def imap_ordered(fn, tasks, workers, max_pending=None):
+    """Ejecuta `fn(*task)` en un pool de procesos y produce (task, resultado) en orden.
+
+    A lo sumo `max_pending` tareas quedan en vuelo: si el escritor va más lento
+    que los workers, el pool espera en lugar de acumular resultados en memoria.
+    """
+    max_pending = max_pending or workers * 2
+    with ProcessPoolExecutor(max_workers=workers) as ex:
+        pending = deque()
+        for task in tasks:
+            pending.append((task, ex.submit(fn, *task)))
+            if len(pending) >= max_pending:
+                t, fut = pending.popleft()
+                yield t, fut.result()
+        while pending:
+            t, fut = pending.popleft()
+            yield t, fut.result()
@@ -0,0 +1,124 @@
+#!/usr/bin/env python3
+"""
+Exportación por cambios de contenido para tablas sin `updatedAt`.
+
+CourseBlocks, Enrollments y QuizResults no tienen marca de tiempo, así que
+`d1_delta.py` no ve sus ediciones. Aquí se guarda, en un archivo SQLite aparte
+(el manifest), un hash de 8 bytes del contenido de cada fila por `id`. Cada
+corrida recorre la tabla y el manifest ordenados por `id` (merge join, por
+bloques con fetchmany) y produce solo las filas nuevas o cambiadas y los `id`
+que ya no existen. Los cambios al manifest se acumulan en tablas temporales y
+se aplican con `commit()` una vez escrita la salida.
+"""
+import hashlib
+import sqlite3
+
+from sql_render import iter_rows
+
+# Filas por executemany al registrar hashes pendientes
+HASH_CHUNK = 5000
+# ids por sentencia DELETE ... WHERE id IN (...)
+DELETE_CHUNK = 500
+
+_END = object()
+
+
+def row_hash(row):
+    return hashlib.blake2b(repr(row).encode('utf-8'), digest_size=8).digest()
+
+
+class HashManifest:
+    """Manifest de hashes por fila guardado en un archivo SQLite."""
+
+    def __init__(self, path):
+        self.path = path
+        self.conn = sqlite3.connect(path)
+        self.conn.execute(
+            'CREATE TABLE IF NOT EXISTS row_hashes ('
+            ' tbl TEXT NOT NULL, id INTEGER NOT NULL, h BLOB NOT NULL,'
+            ' PRIMARY KEY (tbl, id)) WITHOUT ROWID')
+        self.conn.execute('CREATE TEMP TABLE pending_upserts (tbl TEXT, id INTEGER, h BLOB)')
+        self.conn.execute('CREATE TEMP TABLE pending_deletes (tbl TEXT, id INTEGER)')
+        self.stats = {}
+
+    def _stored(self, table):
+        cur = self.conn.cursor()
+        cur.execute('SELECT id, h FROM row_hashes WHERE tbl = ? ORDER BY id', (table,))
+        return iter_rows(cur)
+
+    def changed_rows(self, src, table, cols):
+        """Produce las filas (con `cols`, que debe incluir `id`) nuevas o cambiadas de `table`.
+
+        Los `id` presentes en el manifest pero no en la tabla quedan registrados
+        como borrados; se leen después con `deleted_ids`.
+        """
+        if 'id' not in cols:
+            raise ValueError(f'{table}: changed_rows needs the id column among {cols}')
+        key = cols.index('id')
+        cur = src.cursor()
+        cur.execute(f"SELECT {', '.join(cols)} FROM '{table}' ORDER BY id")
+        stored = self._stored(table)
+        old = next(stored, _END)
+        upserts = []
+        deletes = []
+        counts = {'inserted': 0, 'updated': 0, 'deleted': 0, 'unchanged': 0}
+        for row in iter_rows(cur):
+            rid = row[key]
+            while old is not _END and old[0] < rid:
+                deletes.append((table, old[0]))
+                old = next(stored, _END)
+                if len(deletes) >= HASH_CHUNK:
+                    self._flush(upserts, deletes, counts)
+            h = row_hash(row)
+            if old is not _END and old[0] == rid:
+                same = old[1] == h
+                old = next(stored, _END)
+                if same:
+                    counts['unchanged'] += 1
+                    continue
+                counts['updated'] += 1
+            else:
+                counts['inserted'] += 1
+            upserts.append((table, rid, h))
+            if len(upserts) >= HASH_CHUNK:
+                self._flush(upserts, deletes, counts)
+            yield row
+        while old is not _END:
+            deletes.append((table, old[0]))
+            old = next(stored, _END)
+            if len(deletes) >= HASH_CHUNK:
+                self._flush(upserts, deletes, counts)
+        self._flush(upserts, deletes, counts)
+        self.stats[table] = counts
+
+    def _flush(self, upserts, deletes, counts):
+        self.conn.executemany('INSERT INTO pending_upserts VALUES (?, ?, ?)', upserts)
+        self.conn.executemany('INSERT INTO pending_deletes VALUES (?, ?)', deletes)
+        counts['deleted'] += len(deletes)
+        upserts.clear()
+        deletes.clear()
+
+    def deleted_ids(self, table, size=DELETE_CHUNK):
+        """Produce listas de hasta `size` ids borrados de `table` (tras `changed_rows`)."""
+        cur = self.conn.cursor()
+        cur.execute('SELECT id FROM pending_deletes WHERE tbl = ? ORDER BY id', (table,))
+        while True:
+            rows = cur.fetchmany(size)
+            if not rows:
+                return
+            yield [r[0] for r in rows]
+
+    def commit(self):
+        """Aplica los hashes pendientes al manifest."""
+        self.conn.execute('INSERT OR REPLACE INTO row_hashes SELECT tbl, id, h FROM pending_upserts')
+        self.conn.execute('DELETE FROM row_hashes WHERE (tbl, id) IN (SELECT tbl, id FROM pending_deletes)')
+        self.conn.execute('DELETE FROM pending_upserts')
+        self.conn.execute('DELETE FROM pending_deletes')
+        self.conn.commit()
+
+    def close(self):
+        self.conn.close()
+
+
+def delete_statement(table, ids):
+    return f'DELETE FROM "{table}" WHERE "id" IN ({", ".join(str(i) for i in ids)});'
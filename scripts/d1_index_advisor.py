@@ -0,0 +1,292 @@
+#!/usr/bin/env python3
+"""
+Asesor de índices a partir de las consultas reales del Worker.
+
+Uso:
+  python scripts/d1_index_advisor.py --db sag_d1.sqlite --scale 1000 --out scripts/recommended_indexes.sql
+
+Extrae el SQL de cada `env.SAG_DB.prepare('...')` de
+`cloudflare_worker/src/index.js` y lo reproduce sobre una copia en memoria de
+la BD (el archivo original no se modifica). Con `--scale N` la copia se
+multiplica N veces antes de medir: ids, `courseId`/`quizBlockId` se desplazan y
+los `clerkId` llevan sufijo, así las claves siguen siendo únicas y las
+referencias siguen apuntando a filas existentes.
+
+Para cada consulta con filtro se mira `EXPLAIN QUERY PLAN`; las que recorren la
+tabla completa (`SCAN`) o necesitan un B-tree temporal para el ORDER BY reciben
+un índice candidato con las columnas de igualdad seguidas de las del ORDER BY.
+Si la consulta lista columnas concretas (no `SELECT *`) se agregan al final y
+el índice queda cubriente para esa consulta; con `SELECT *` no, porque
+duplicaría la tabla, y el índice solo sirve para buscar. Los candidatos que
+son prefijo de otro se descartan.
+
+Un candidato solo se recomienda si, ya creado, el plan de alguna consulta lo
+usa (`USING INDEX <nombre>` o `USING COVERING INDEX <nombre>`). Con pocas filas
+el planificador puede preferir seguir recorriendo la tabla: esos quedan
+comentados como no verificados en la migración; conviene repetir con un
+`--scale` mayor.
+
+Los parámetros `?` se llenan con valores reales muestreados de la columna
+comparada. Cada consulta se ejecuta `--repeat` veces antes y después de crear
+los índices (las escrituras dentro de una transacción que se revierte) y la
+migración resultante lleva la latencia media de ambas corridas en comentarios.
+"""
+import argparse
+import os
+import re
+import sqlite3
+import time
+
+DEFAULT_WORKER = 'cloudflare_worker/src/index.js'
+DEFAULT_REPEAT = 200
+# Valores distintos muestreados por columna para llenar los `?`
+SAMPLE_SIZE = 50
+
+PREPARE_RE = re.compile(r"""\.prepare\(\s*(?:'((?:[^'\\]|\\.)*)'|"((?:[^"\\]|\\.)*)"|`([^`]*)`)""")
+TABLE_RE = re.compile(r'\b(?:FROM|UPDATE|INTO)\s+["`\[]?(\w+)', re.IGNORECASE)
+PARAM_COL_RE = re.compile(r'["`\[]?(\w+)["`\]]?\s*(?:=|<>|!=|<=|>=|<|>|LIKE)\s*\?', re.IGNORECASE)
+WHERE_RE = re.compile(r'\bWHERE\b(.*?)(?:\bORDER\s+BY\b|\bGROUP\s+BY\b|\bLIMIT\b|$)', re.IGNORECASE | re.DOTALL)
+EQ_RE = re.compile(r'["`\[]?(\w+)["`\]]?\s*=\s*\?')
+ORDER_RE = re.compile(r'\bORDER\s+BY\b(.*?)(?:\bLIMIT\b|$)', re.IGNORECASE | re.DOTALL)
+SELECT_COLS_RE = re.compile(r'^\s*SELECT\s+(.*?)\s+FROM\b', re.IGNORECASE | re.DOTALL)
+
+# Cómo desplazar las columnas clave al multiplicar la BD con --scale
+SCALE_OFFSETS = {'id': None, 'courseId': 'Courses', 'quizBlockId': 'CourseBlocks'}
+SCALE_SUFFIXES = ('clerkId', 'creatorClerkId')
+
+
+def extract_queries(js_path):
+    """(línea, sql) de cada `prepare(...)` con SQL literal, sin repetir."""
+    src = open(js_path, 'r', encoding='utf-8').read()
+    seen = set()
+    queries = []
+    for m in PREPARE_RE.finditer(src):
+        sql = ' '.join(next(g for g in m.groups() if g is not None).split())
+        if sql in seen:
+            continue
+        seen.add(sql)
+        queries.append((src.count('\n', 0, m.start()) + 1, sql))
+    return queries
+
+
+def statement_table(sql):
+    m = TABLE_RE.search(sql)
+    return m.group(1) if m else None
+
+
+def index_columns(conn, sql):
+    """Columnas del índice que serviría a `sql`, o None si no hay filtro por igualdad simple."""
+    where = WHERE_RE.search(sql)
+    if not where or re.search(r'\bOR\b', where.group(1), re.IGNORECASE):
+        return None
+    cols = []
+    for c in EQ_RE.findall(where.group(1)):
+        if c not in cols:
+            cols.append(c)
+    if not cols:
+        return None
+    order = ORDER_RE.search(sql)
+    if order:
+        for term in order.group(1).split(','):
+            c = re.sub(r'\s+(ASC|DESC)\s*$', '', term.strip(), flags=re.IGNORECASE).strip('"`[] ')
+            if c and c not in cols:
+                cols.append(c)
+    select = SELECT_COLS_RE.match(sql)
+    if select and select.group(1).strip() != '*':
+        table = statement_table(sql)
+        rowid_alias = [r[1] for r in conn.execute(f"PRAGMA table_info('{table}')") if r[5] == 1 and r[2].upper() == 'INTEGER']
+        for c in (c.strip().strip('"`[]') for c in select.group(1).split(',')):
+            # The INTEGER PRIMARY KEY is the rowid, every index already carries it
+            if c not in cols and c not in rowid_alias:
+                cols.append(c)
+    return cols
+
+
+def query_plan(conn, sql, params):
+    return [r[3] for r in conn.execute('EXPLAIN QUERY PLAN ' + sql, params)]
+
+
+def plan_problems(plan):
+    """Pasos del plan que indican recorrido completo u ordenamiento temporal."""
+    return [d for d in plan if (d.startswith('SCAN ') and ' USING ' not in d) or 'TEMP B-TREE' in d]
+
+
+def sample_values(conn, table, col):
+    try:
+        rows = conn.execute(f'SELECT DISTINCT "{col}" FROM "{table}" WHERE "{col}" IS NOT NULL LIMIT {SAMPLE_SIZE}')
+        return [r[0] for r in rows] or [None]
+    except sqlite3.OperationalError:
+        return [None]
+
+
+def param_sets(conn, sql):
+    """Lista de tuplas de parámetros para ejecutar `sql` con valores reales."""
+    table = statement_table(sql)
+    n = sql.count('?')
+    cols = PARAM_COL_RE.findall(sql)
+    if len(cols) != n:
+        # INSERT ... VALUES (?, ...) and LIMIT ?: bind the sampled columns in order, NULL for the rest
+        cols = [None] * n
+    samples = [sample_values(conn, table, c) if c else [None] for c in cols]
+    width = max((len(s) for s in samples), default=1)
+    return [tuple(s[i % len(s)] for s in samples) for i in range(width)]
+
+
+def time_query(conn, sql, params_list, repeat):
+    """Latencia media en ms; las escrituras se revierten en cada ejecución."""
+    is_read = sql.lstrip().upper().startswith('SELECT')
+    elapsed = 0.0
+    for i in range(repeat):
+        params = params_list[i % len(params_list)]
+        if not is_read:
+            conn.execute('BEGIN')
+        started = time.perf_counter()
+        try:
+            conn.execute(sql, params).fetchall()
+        except sqlite3.Error:
+            pass
+        elapsed += time.perf_counter() - started
+        if not is_read:
+            conn.execute('ROLLBACK')
+    return elapsed / repeat * 1000
+
+
+def scale_database(conn, factor):
+    """Multiplica cada tabla `factor` veces manteniendo claves únicas y referencias válidas."""
+    tables = [r[0] for r in conn.execute(
+        "SELECT name FROM sqlite_master WHERE type='table' AND name NOT LIKE 'sqlite_%' ORDER BY name")]
+    max_ids = {t: conn.execute(f'SELECT COALESCE(MAX(id), 0) FROM "{t}"').fetchone()[0]
+               for t in tables if 'id' in [r[1] for r in conn.execute(f"PRAGMA table_info('{t}')")]}
+    for k in range(1, factor):
+        for t in tables:
+            cols = [r[1] for r in conn.execute(f"PRAGMA table_info('{t}')")]
+            exprs = []
+            for c in cols:
+                if c in SCALE_OFFSETS and (SCALE_OFFSETS[c] or t) in max_ids:
+                    exprs.append(f'"{c}" + {k * max_ids[SCALE_OFFSETS[c] or t]}')
+                elif c in SCALE_SUFFIXES:
+                    exprs.append(f"\"{c}\" || '#{k}'")
+                elif c == 'email':
+                    exprs.append(f"'{k}.' || \"{c}\"")
+                else:
+                    exprs.append(f'"{c}"')
+            col_sql = ', '.join(f'"{c}"' for c in cols)
+            conn.execute(f'INSERT INTO "{t}" ({col_sql}) SELECT {", ".join(exprs)} FROM "{t}" WHERE rowid <= ?',
+                         (max_ids.get(t) or conn.execute(f'SELECT COUNT(*) FROM "{t}"').fetchone()[0],))
+    conn.commit()
+
+
+def drop_prefix_indexes(indexes):
+    """Quita los índices cuyas columnas son prefijo de otro índice de la misma tabla."""
+    kept = []
+    for table, cols in indexes:
+        covered = any(t == table and len(c) > len(cols) and c[:len(cols)] == cols for t, c in indexes)
+        if not covered and (table, cols) not in kept:
+            kept.append((table, cols))
+    return kept
+
+
+def index_name(table, cols):
+    return f"idx_{table}_{'_'.join(cols)}"
+
+
+def uses_index(plan, name):
+    pattern = re.compile(rf'\bUSING (?:COVERING )?INDEX {re.escape(name)}\b')
+    return any(pattern.search(step) for step in plan)
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--db', default='sag_d1.sqlite', help='Ruta al archivo sqlite')
+    parser.add_argument('--worker', default=DEFAULT_WORKER, help='Fuente del Worker con las consultas')
+    parser.add_argument('--scale', type=int, default=1, help='Multiplicar los datos N veces antes de medir')
+    parser.add_argument('--repeat', type=int, default=DEFAULT_REPEAT, help='Ejecuciones por consulta al medir')
+    parser.add_argument('--out', default='scripts/recommended_indexes.sql', help='Migración SQL de salida')
+    args = parser.parse_args()
+
+    for path in (args.db, args.worker):
+        if not os.path.exists(path):
+            raise SystemExit(f"No se encontró '{path}'.")
+
+    queries = extract_queries(args.worker)
+    print(f'{len(queries)} consultas en {args.worker}')
+
+    # Work on an in-memory copy: scaling and trial indexes never touch the real DB
+    src = sqlite3.connect(args.db)
+    conn = sqlite3.connect(':memory:', isolation_level=None)
+    src.backup(conn)
+    src.close()
+    if args.scale > 1:
+        conn.execute('BEGIN')
+        scale_database(conn, args.scale)
+        print(f'BD multiplicada x{args.scale}: ' + ', '.join(
+            f"{t}={conn.execute(f'SELECT COUNT(*) FROM {t}').fetchone()[0]}"
+            for (t,) in conn.execute("SELECT name FROM sqlite_master WHERE type='table' AND name NOT LIKE 'sqlite_%'")))
+    conn.execute('ANALYZE')
+
+    report = []
+    wanted = []
+    for line, sql in queries:
+        params_list = param_sets(conn, sql)
+        try:
+            plan = query_plan(conn, sql, params_list[0])
+        except sqlite3.Error as e:
+            print(f'  línea {line}: no se pudo analizar ({e}): {sql}')
+            continue
+        problems = plan_problems(plan)
+        cols = index_columns(conn, sql) if problems else None
+        entry = {'line': line, 'sql': sql, 'params': params_list, 'problems': problems, 'cols': cols}
+        if cols:
+            entry['before'] = time_query(conn, sql, params_list, args.repeat)
+            wanted.append((statement_table(sql), cols))
+        report.append(entry)
+
+    indexes = drop_prefix_indexes(wanted)
+    for table, cols in indexes:
+        conn.execute(f'CREATE INDEX IF NOT EXISTS "{index_name(table, cols)}" ON "{table}" '
+                     f'({", ".join(chr(34) + c + chr(34) for c in cols)})')
+    conn.execute('ANALYZE')
+
+    print('---')
+    for entry in report:
+        if not entry['problems']:
+            continue
+        print(f"línea {entry['line']}: {entry['sql']}")
+        print('  plan: ' + '; '.join(entry['problems']))
+        if not entry['cols']:
+            print('  sin recomendación (sin filtro por igualdad simple)')
+            continue
+        entry['after'] = time_query(conn, entry['sql'], entry['params'], args.repeat)
+        entry['plan_after'] = query_plan(conn, entry['sql'], entry['params'][0])
+        print('  después: ' + '; '.join(entry['plan_after']))
+        print(f"  {entry['before']:.4f} ms -> {entry['after']:.4f} ms")
+    conn.close()
+
+    if not indexes:
+        print('No hay índices que recomendar.')
+        return
+    plans = [entry['plan_after'] for entry in report if entry.get('plan_after')]
+    verified = [(t, cols) for t, cols in indexes if any(uses_index(p, index_name(t, cols)) for p in plans)]
+    unverified = [ix for ix in indexes if ix not in verified]
+    for table, cols in unverified:
+        print(f'{index_name(table, cols)}: ningún plan lo usa con estos datos; sin verificar '
+              f'(repetir con --scale mayor, ahora x{args.scale})')
+    lines = [f'-- {os.path.basename(args.out)} - índices recomendados para las consultas de {args.worker}',
+             f'-- medido sobre {os.path.basename(args.db)} x{args.scale}, {args.repeat} ejecuciones por consulta (ms media)']
+    for entry in report:
+        if entry.get('after') is not None:
+            lines.append(f"-- línea {entry['line']}: {entry['before']:.4f} ms -> {entry['after']:.4f} ms  {entry['sql']}")
+    for table, cols in verified:
+        lines.append(f'CREATE INDEX IF NOT EXISTS {index_name(table, cols)} ON {table} ({", ".join(cols)});')
+    if unverified:
+        lines.append(f'-- sin verificar (ningún plan los usó con x{args.scale}; repetir con --scale mayor):')
+        for table, cols in unverified:
+            lines.append(f'-- CREATE INDEX IF NOT EXISTS {index_name(table, cols)} ON {table} ({", ".join(cols)});')
+    with open(args.out, 'w', encoding='utf-8') as f:
+        f.write('\n'.join(lines) + '\n')
+    print(f'Escrito {args.out} con {len(verified)} índice(s)' +
+          (f' y {len(unverified)} sin verificar' if unverified else ''))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,218 @@
+#!/usr/bin/env python3
+r"""
+Aplica localmente los archivos parte generados para D1 sobre un SQLite que
+hace de D1, para validarlos y medirlos antes de subirlos.
+
+Uso:
+  python scripts/d1_local_apply.py --manifest scripts/out/manifest.json
+  python scripts/d1_local_apply.py --manifest scripts/out_tables/manifest.json --db /tmp/d1_local.sqlite --report apply.json
+  python scripts/d1_local_apply.py data_dump_clean_part_001.sql data_dump_clean_part_002.sql
+
+Crea el esquema desde `d1_schema.sql` en una BD nueva (en memoria por
+defecto) y aplica los archivos en el orden del manifest: por olas (`waves`) si
+las tiene, si no en el orden de `parts`; sin manifest, en el orden dado. Las
+FK quedan activas, como en D1.
+
+Cada sentencia se revisa contra límites al estilo de D1 antes de ejecutarla:
+tamaño en bytes (`--max-statement-bytes`, 100 KB), parámetros `?`
+(`--max-params`, 100), sentencias por archivo (`--max-statements`, 0 = sin
+límite) y control de transacciones (BEGIN/COMMIT/SAVEPOINT), que D1 no
+acepta en archivos. Se informa el tiempo de cada archivo, las filas por tabla
+al final y las sentencias más lentas. Sale con código 1 si hubo errores o
+límites superados, para poder usarlo en CI.
+
+`--stats`/`--profile` (ver `instrument.py`) miden las fases schema, read
+(lexer) y apply, y cuentan errores, límites y violaciones de FK.
+"""
+import argparse
+import heapq
+import json
+import os
+import re
+import sqlite3
+import sys
+import time
+
+import instrument
+from generate_d1_insert_batches import D1_MAX_STATEMENT_BYTES
+from prepare_d1_sql import iter_statements
+
+# Parámetros enlazados por consulta en D1
+D1_MAX_BOUND_PARAMS = 100
+# Sentencias más lentas que se informan
+DEFAULT_TOP = 10
+
+TRANSACTION_RE = re.compile(r'^\s*(BEGIN|COMMIT|END|ROLLBACK|SAVEPOINT|RELEASE)\b', re.IGNORECASE)
+_LITERAL_RE = re.compile(r"'(?:[^']|'')*'|\"(?:[^\"]|\"\")*\"")
+
+
+def count_params(stmt):
+    """Parámetros `?` fuera de literales."""
+    return _LITERAL_RE.sub('', stmt).count('?')
+
+
+def load_file_order(manifest_path):
+    """Lista de (ola, ruta) en el orden en que se deben aplicar los archivos del manifest."""
+    with open(manifest_path, 'r', encoding='utf-8') as f:
+        manifest = json.load(f)
+    base = os.path.dirname(os.path.abspath(manifest_path))
+    if manifest.get('waves'):
+        return [(w['wave'], os.path.join(base, name)) for w in manifest['waves'] for name in w['files']]
+    return [(None, os.path.join(base, p['file'])) for p in manifest['parts']]
+
+
+def check_limits(stmt, size, limits):
+    problems = []
+    if limits['max_statement_bytes'] and size > limits['max_statement_bytes']:
+        problems.append(f"sentencia de {size} bytes (límite {limits['max_statement_bytes']})")
+    if limits['max_params']:
+        n = count_params(stmt)
+        if n > limits['max_params']:
+            problems.append(f"{n} parámetros (límite {limits['max_params']})")
+    if TRANSACTION_RE.match(stmt):
+        problems.append('control de transacción no soportado en D1')
+    return problems
+
+
+def snippet(stmt, width=120):
+    s = ' '.join(stmt.split())
+    return s if len(s) <= width else s[:width - 3] + '...'
+
+
+def apply_file(conn, path, limits, slowest, top):
+    """Ejecuta las sentencias de `path` una a una; devuelve el resumen del archivo."""
+    stats = instrument.current()
+    result = {'file': os.path.basename(path), 'bytes': os.path.getsize(path), 'statements': 0,
+              'seconds': 0.0, 'errors': [], 'limits': []}
+    with open(path, 'r', encoding='utf-8') as f:
+        for idx, stmt in enumerate(stats.timed_iter('read', iter_statements(f)), 1):
+            size = len(stmt.encode('utf-8'))
+            for problem in check_limits(stmt, size, limits):
+                result['limits'].append({'statement': idx, 'problem': problem, 'sql': snippet(stmt)})
+            started = time.perf_counter()
+            with stats.phase('apply'):
+                try:
+                    conn.execute(stmt)
+                except sqlite3.Error as e:
+                    result['errors'].append({'statement': idx, 'error': str(e), 'sql': snippet(stmt)})
+            elapsed = time.perf_counter() - started
+            result['seconds'] += elapsed
+            result['statements'] += 1
+            entry = (elapsed, result['file'], idx, snippet(stmt))
+            if len(slowest) < top:
+                heapq.heappush(slowest, entry)
+            elif elapsed > slowest[0][0]:
+                heapq.heapreplace(slowest, entry)
+    if limits['max_statements'] and result['statements'] > limits['max_statements']:
+        result['limits'].append({'statement': None, 'problem':
+                                 f"{result['statements']} sentencias (límite {limits['max_statements']})", 'sql': ''})
+    if conn.in_transaction:
+        # A file that leaves a transaction open would leak into the next one
+        conn.execute('COMMIT')
+        result['errors'].append({'statement': None, 'error': 'el archivo deja una transacción abierta', 'sql': ''})
+    stats.add(bytes_read=result['bytes'])
+    return result
+
+
+def table_counts(conn):
+    tables = [r[0] for r in conn.execute(
+        "SELECT name FROM sqlite_master WHERE type='table' AND name NOT LIKE 'sqlite_%' ORDER BY name")]
+    return {t: conn.execute(f'SELECT COUNT(*) FROM "{t}"').fetchone()[0] for t in tables}
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('files', nargs='*', help='Archivos SQL a aplicar en orden (si no hay --manifest)')
+    parser.add_argument('--manifest', help='manifest.json de generate_d1_insert_batches/inserts_per_table/prepare_d1_sql')
+    parser.add_argument('--schema', default='d1_schema.sql', help='Esquema a crear antes de aplicar')
+    parser.add_argument('--db', default=':memory:', help='BD de prueba (se recrea; por defecto en memoria)')
+    parser.add_argument('--max-statement-bytes', type=int, default=D1_MAX_STATEMENT_BYTES)
+    parser.add_argument('--max-params', type=int, default=D1_MAX_BOUND_PARAMS)
+    parser.add_argument('--max-statements', type=int, default=0, help='Máximo de sentencias por archivo (0 = sin límite)')
+    parser.add_argument('--top', type=int, default=DEFAULT_TOP, help='Cuántas sentencias lentas informar')
+    parser.add_argument('--report', help='Escribir el resultado como JSON')
+    instrument.add_arguments(parser)
+    args = parser.parse_args()
+    stats = instrument.current()
+
+    if args.manifest:
+        order = load_file_order(args.manifest)
+    elif args.files:
+        order = [(None, p) for p in args.files]
+    else:
+        parser.error('indica --manifest o una lista de archivos')
+    missing = [p for _, p in order if not os.path.exists(p)]
+    if missing:
+        raise SystemExit('No se encontraron: ' + ', '.join(missing))
+
+    if args.db != ':memory:' and os.path.exists(args.db):
+        os.remove(args.db)
+    conn = sqlite3.connect(args.db, isolation_level=None)
+    with stats.phase('schema'), open(args.schema, 'r', encoding='utf-8') as f:
+        conn.executescript(f.read())
+    conn.execute('PRAGMA foreign_keys = ON')
+
+    limits = {'max_statement_bytes': args.max_statement_bytes, 'max_params': args.max_params,
+              'max_statements': args.max_statements}
+    slowest = []
+    files = []
+    started = time.perf_counter()
+    for wave, path in order:
+        with stats.profiled():
+            result = apply_file(conn, path, limits, slowest, args.top)
+        result['wave'] = wave
+        files.append(result)
+        flags = ''
+        if result['errors']:
+            flags += f", {len(result['errors'])} error(es)"
+        if result['limits']:
+            flags += f", {len(result['limits'])} límite(s) superado(s)"
+        prefix = f'[ola {wave}] ' if wave is not None else ''
+        print(f"{prefix}{result['file']}: {result['statements']} sentencias, {result['bytes']} bytes, "
+              f"{result['seconds']:.3f}s{flags}")
+    total_seconds = time.perf_counter() - started
+    counts = table_counts(conn)
+    fk_violations = len(conn.execute('PRAGMA foreign_key_check').fetchall())
+    conn.close()
+
+    print('--- filas por tabla')
+    for t, n in counts.items():
+        print(f'  {t}: {n}')
+    print(f'--- {len(slowest)} sentencias más lentas')
+    for elapsed, name, idx, sql in sorted(slowest, reverse=True):
+        print(f'  {elapsed * 1000:.2f} ms  {name}#{idx}  {sql}')
+    n_errors = sum(len(r['errors']) for r in files)
+    n_limits = sum(len(r['limits']) for r in files)
+    stats.add(rows=sum(counts.values()))
+    stats.count('errors', n_errors)
+    stats.count('limits', n_limits)
+    stats.count('fk_violations', fk_violations)
+    for r in files:
+        for e in r['errors']:
+            print(f"ERROR {r['file']}#{e['statement']}: {e['error']}  {e['sql']}")
+        for e in r['limits']:
+            print(f"LÍMITE {r['file']}#{e['statement']}: {e['problem']}  {e['sql']}")
+    if fk_violations:
+        print(f'foreign_key_check: {fk_violations} violación(es)')
+    print(f'Total: {len(files)} archivos en {total_seconds:.3f}s, {n_errors} error(es), {n_limits} límite(s) superado(s)')
+
+    if args.report:
+        report = {
+            'files': files,
+            'tables': counts,
+            'slowest': [{'seconds': round(e, 6), 'file': n, 'statement': i, 'sql': s}
+                        for e, n, i, s in sorted(slowest, reverse=True)],
+            'fk_violations': fk_violations,
+            'total_seconds': round(total_seconds, 4),
+        }
+        with open(args.report, 'w', encoding='utf-8') as f:
+            json.dump(report, f, indent=2, ensure_ascii=False)
+            f.write('\n')
+        print('Reporte escrito en', args.report)
+    if n_errors or n_limits or fk_violations:
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    with instrument.session('d1_local_apply'):
+        main()
@@ -0,0 +1,101 @@
+#!/usr/bin/env python3
+"""
+Orden de tablas por dependencias de FK y olas (waves) de aplicación en paralelo.
+
+El grafo se arma con `PRAGMA foreign_key_list`: una tabla depende de cada tabla
+que referencia (las autorreferencias se ignoran). `fk_levels` ordena las tablas
+topológicamente por niveles: el nivel 0 no referencia a nadie, el nivel N solo
+referencia tablas de niveles menores. Todas las tablas de un nivel son
+independientes entre sí, así que sus archivos parte pueden aplicarse a la vez;
+los niveles se aplican en orden.
+
+Uso (ver el orden calculado):
+  python scripts/d1_order.py --db sag_d1.sqlite
+"""
+import argparse
+import json
+import os
+import sqlite3
+
+
+def table_names(conn):
+    return [r[0] for r in conn.execute(
+        "SELECT name FROM sqlite_master WHERE type='table' AND name NOT LIKE 'sqlite_%' ORDER BY name")]
+
+
+def fk_parents(conn, table):
+    """Tablas referenciadas por las FK declaradas de `table`, sin repetir."""
+    parents = []
+    for fk in conn.execute(f"PRAGMA foreign_key_list('{table}')").fetchall():
+        if fk[2] != table and fk[2] not in parents:
+            parents.append(fk[2])
+    return parents
+
+
+def fk_levels(conn, tables=None):
+    """Agrupa `tables` (todas si es None) en niveles topológicos por FK.
+
+    Dentro de cada nivel se respeta el orden de `tables`. Las FK hacia tablas
+    fuera de la lista no cuentan. Lanza ValueError si hay un ciclo.
+    """
+    if tables is None:
+        tables = table_names(conn)
+    selected = set(tables)
+    pending = {t: {p for p in fk_parents(conn, t) if p in selected} for t in tables}
+    levels = []
+    done = set()
+    while pending:
+        level = [t for t in tables if t in pending and pending[t] <= done]
+        if not level:
+            raise ValueError('foreign key cycle between: ' + ', '.join(sorted(pending)))
+        for t in level:
+            del pending[t]
+        done.update(level)
+        levels.append(level)
+    return levels
+
+
+def build_waves(levels, parts, reverse=False, first_wave=1):
+    """Reparte `parts` (dicts de PartWriter con 'file' y 'tables') en olas por nivel.
+
+    Cada parte va a la ola del nivel más alto de sus tablas; con `reverse` el
+    orden de las olas se invierte (para DELETEs: hijas antes que padres).
+    Devuelve [{'wave', 'tables', 'files'}] sin olas vacías, numeradas desde `first_wave`.
+    """
+    level_of = {t: i for i, level in enumerate(levels) for t in level}
+    by_level = {}
+    for part in parts:
+        lvl = max((level_of.get(t, 0) for t in part['tables']), default=0)
+        by_level.setdefault(lvl, []).append(part)
+    order = sorted(by_level, reverse=reverse)
+    waves = []
+    for lvl in order:
+        tables = []
+        for part in by_level[lvl]:
+            for t in part['tables']:
+                if t not in tables:
+                    tables.append(t)
+        waves.append({'wave': first_wave + len(waves), 'tables': tables, 'files': [p['file'] for p in by_level[lvl]]})
+    return waves
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--db', default='sag_d1.sqlite', help='Ruta al archivo sqlite')
+    parser.add_argument('--tables', nargs='*', help='Limitar a estas tablas')
+    args = parser.parse_args()
+
+    if not os.path.exists(args.db):
+        raise SystemExit(f"No se encontró la BD en '{args.db}'.")
+    conn = sqlite3.connect(args.db)
+    try:
+        levels = fk_levels(conn, args.tables or None)
+    except ValueError as e:
+        raise SystemExit(f'No se puede ordenar: {e}')
+    finally:
+        conn.close()
+    print(json.dumps(levels, indent=2))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,311 @@
+#!/usr/bin/env python3
+r"""
+Verificación de paridad entre dos BD SQLite por rangos de `id`, sin comparar
+fila por fila lo que ya coincide.
+
+Uso:
+  python scripts/d1_parity.py --source sag_d1.sqlite --target /tmp/d1_local.sqlite
+  python scripts/d1_parity.py --source sag_d1.sqlite --target copia.sqlite --repair repair.sql --report parity.json
+
+`--target` es la BD que debería ser igual a `--source`: la que deja
+`d1_local_apply.py --db`, una copia exportada de D1 o cualquier otra. Ambas se
+abren en solo lectura.
+
+Cada fila tiene un hash de 8 bytes de su contenido (`d1_changes.row_hash`) y el
+hash de un rango de `id` es la suma (módulo 2^64) de los hashes de sus filas,
+calculada dentro de SQLite con una función de agregado. Así el hash de un
+rango es la combinación de los de sus subrangos, como en un árbol de Merkle,
+y cualquier nodo se puede pedir con una sola consulta. Por tabla:
+
+1. se comparan la raíz (`count(*)` y hash de todo el rango de `id`) de las dos BD;
+   si coinciden, la tabla está verificada con una consulta de cada lado
+2. si no, el rango se parte en `--fanout` subrangos con un solo `GROUP BY` por
+   BD y se baja solo por los que difieren
+3. un rango con a lo sumo `--leaf-rows` filas se lee de las dos BD y se
+   comparan los hashes de cada fila
+
+El resultado son los `id` exactos que faltan en el destino, los que sobran y
+los que tienen otro contenido (o tipo de dato: 1 y 1.0 no son iguales). Con
+`--repair` se escribe el SQL que lleva el destino al estado del origen: UPSERTs
+(`ON CONFLICT(id) DO UPDATE`) de padres a hijas y luego DELETEs de hijas a
+padres; los literales salen de `quote()` de SQLite, así que son exactos. Sale
+con código 1 si hay diferencias, para poder usarlo en CI.
+
+Una tabla que falta en una de las dos BD o que tiene otras columnas cuenta
+como diferencia (sale con código 1 y va al reporte en `schema`), pero no entra
+en `--repair`: eso se corrige con el esquema. Solo se comparan por rangos las
+tablas con `id` INTEGER; las demás se listan como no verificadas (`unverified`
+en el reporte) y no cambian el código de salida.
+`--stats`/`--profile`: ver `instrument.py` (fases hash y diff).
+"""
+import argparse
+import json
+import sys
+
+import instrument
+from d1_changes import DELETE_CHUNK, delete_statement, row_hash
+from d1_delta import ID_COLUMN, upsert_clause
+from d1_order import fk_levels, table_names
+from sqlite_snapshot import open_readonly
+
+DEFAULT_FANOUT = 16
+DEFAULT_LEAF_ROWS = 256
+# ids por consulta al leer las filas a reparar (debajo del límite de parámetros de SQLite)
+FETCH_IDS = 500
+# ids por tipo de diferencia que se listan en consola (el reporte JSON los trae todos)
+PRINT_IDS = 20
+
+_MASK = (1 << 64) - 1
+
+
+class RangeHash:
+    """Agregado SQLite `parity_hash(col, ...)`: suma módulo 2^64 de los hashes de fila."""
+
+    def __init__(self):
+        self.h = 0
+
+    def step(self, *row):
+        self.h = (self.h + int.from_bytes(row_hash(row), 'big')) & _MASK
+
+    def finalize(self):
+        return f'{self.h:016x}'
+
+
+def open_db(path):
+    conn = open_readonly(path)
+    conn.create_aggregate('parity_hash', -1, RangeHash)
+    return conn
+
+
+def table_columns(conn, table):
+    return [c[1] for c in conn.execute(f"PRAGMA table_info('{table}')").fetchall()]
+
+
+def has_integer_id(conn, table):
+    return any(c[1] == ID_COLUMN and 'INT' in (c[2] or '').upper()
+               for c in conn.execute(f"PRAGMA table_info('{table}')").fetchall())
+
+
+class TableParity:
+    """Compara `table` entre `source` y `target` bajando por los rangos de id que difieren."""
+
+    def __init__(self, source, target, table, cols, fanout=DEFAULT_FANOUT, leaf_rows=DEFAULT_LEAF_ROWS):
+        self.source = source
+        self.target = target
+        self.table = table
+        self.cols = cols
+        self.fanout = max(2, fanout)
+        self.leaf_rows = max(1, leaf_rows)
+        self.col_sql = ', '.join(f'"{c}"' for c in cols)
+        self.queries = 0
+        self.rows = 0
+        self.missing = []
+        self.extra = []
+        self.changed = []
+
+    def _bounds(self):
+        lo = hi = None
+        for conn in (self.source, self.target):
+            a, b = conn.execute(f'SELECT min("{ID_COLUMN}"), max("{ID_COLUMN}") FROM "{self.table}"').fetchone()
+            self.queries += 1
+            if a is not None:
+                lo = a if lo is None else min(lo, a)
+                hi = b if hi is None else max(hi, b)
+        return lo, hi
+
+    def _node(self, conn, lo, hi):
+        self.queries += 1
+        return conn.execute(f'SELECT count(*), parity_hash({self.col_sql}) FROM "{self.table}" '
+                            f'WHERE "{ID_COLUMN}" >= ? AND "{ID_COLUMN}" < ?', (lo, hi)).fetchone()
+
+    def _children(self, conn, lo, hi):
+        """{subrango: (filas, hash)} de los subrangos no vacíos de [lo, hi), en una consulta."""
+        self.queries += 1
+        cur = conn.execute(
+            f'SELECT ("{ID_COLUMN}" - ?) * ? / ? AS b, count(*), parity_hash({self.col_sql}) FROM "{self.table}" '
+            f'WHERE "{ID_COLUMN}" >= ? AND "{ID_COLUMN}" < ? GROUP BY b', (lo, self.fanout, hi - lo, lo, hi))
+        return {b: (n, h) for b, n, h in cur}
+
+    def _child_range(self, lo, hi, b):
+        # Inverse of b = (id - lo) * fanout // width: the ids of bucket b start at ceil(b * width / fanout)
+        width = hi - lo
+        return lo - (-b * width // self.fanout), lo - (-(b + 1) * width // self.fanout)
+
+    def _rows(self, conn, lo, hi):
+        self.queries += 1
+        return conn.execute(f'SELECT {self.col_sql} FROM "{self.table}" '
+                            f'WHERE "{ID_COLUMN}" >= ? AND "{ID_COLUMN}" < ?', (lo, hi)).fetchall()
+
+    def _diff_leaf(self, lo, hi):
+        key = self.cols.index(ID_COLUMN)
+        want = {r[key]: row_hash(r) for r in self._rows(self.source, lo, hi)}
+        have = {r[key]: row_hash(r) for r in self._rows(self.target, lo, hi)}
+        for rid, h in want.items():
+            if rid not in have:
+                self.missing.append(rid)
+            elif have[rid] != h:
+                self.changed.append(rid)
+        self.extra.extend(rid for rid in have if rid not in want)
+
+    def run(self):
+        stats = instrument.current()
+        lo, hi = self._bounds()
+        if lo is None:
+            return self
+        hi += 1
+        with stats.phase('hash'):
+            root = (self._node(self.source, lo, hi), self._node(self.target, lo, hi))
+        self.rows = root[0][0]
+        # Ranges whose (count, hash) differ, each with the nodes already fetched for it
+        pending = [(lo, hi, root)]
+        while pending:
+            lo, hi, nodes = pending.pop()
+            if nodes[0] == nodes[1]:
+                continue
+            if max(nodes[0][0], nodes[1][0]) <= self.leaf_rows or hi - lo <= self.fanout:
+                with stats.phase('diff'):
+                    self._diff_leaf(lo, hi)
+                continue
+            with stats.phase('hash'):
+                want = self._children(self.source, lo, hi)
+                have = self._children(self.target, lo, hi)
+            empty = (0, RangeHash().finalize())
+            for b in sorted(set(want) | set(have), reverse=True):
+                if want.get(b, empty) != have.get(b, empty):
+                    a, z = self._child_range(lo, hi, b)
+                    pending.append((a, z, (want.get(b, empty), have.get(b, empty))))
+        self.missing.sort()
+        self.extra.sort()
+        self.changed.sort()
+        return self
+
+    @property
+    def ok(self):
+        return not (self.missing or self.extra or self.changed)
+
+    def upserts(self):
+        """UPSERTs con las filas del origen que faltan o difieren en el destino (literales de `quote()`)."""
+        ids = sorted(self.missing + self.changed)
+        literal = " || ',' || ".join(f'quote("{c}")' for c in self.cols)
+        prefix = f'INSERT INTO "{self.table}" ({self.col_sql}) VALUES '
+        suffix = upsert_clause(self.cols)
+        for i in range(0, len(ids), FETCH_IDS):
+            chunk = ids[i:i + FETCH_IDS]
+            cur = self.source.execute(
+                f'SELECT {literal} FROM "{self.table}" WHERE "{ID_COLUMN}" IN ({", ".join("?" * len(chunk))}) '
+                f'ORDER BY "{ID_COLUMN}"', chunk)
+            for (values,) in cur:
+                yield f'{prefix}({values}){suffix};'
+
+    def deletes(self):
+        for i in range(0, len(self.extra), DELETE_CHUNK):
+            yield delete_statement(self.table, self.extra[i:i + DELETE_CHUNK])
+
+    def report(self):
+        return {'table': self.table, 'rows': self.rows, 'queries': self.queries, 'ok': self.ok,
+                'missing': self.missing, 'extra': self.extra, 'changed': self.changed}
+
+
+def format_ids(ids):
+    shown = ', '.join(str(i) for i in ids[:PRINT_IDS])
+    return shown + (f', ... (+{len(ids) - PRINT_IDS})' if len(ids) > PRINT_IDS else '')
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--source', default='sag_d1.sqlite', help='BD de referencia')
+    parser.add_argument('--target', required=True, help='BD a verificar (p.ej. la de d1_local_apply.py --db)')
+    parser.add_argument('--tables', nargs='*', help='Tablas a comparar (por defecto todas las del origen)')
+    parser.add_argument('--fanout', type=int, default=DEFAULT_FANOUT, help='Subrangos por nivel del árbol')
+    parser.add_argument('--leaf-rows', type=int, default=DEFAULT_LEAF_ROWS, help='Filas de un rango que se compara fila por fila')
+    parser.add_argument('--repair', metavar='PATH', help='Escribir el SQL que lleva el destino al estado del origen')
+    parser.add_argument('--report', metavar='PATH', help='Escribir el resultado (con todos los ids) como JSON')
+    instrument.add_arguments(parser)
+    args = parser.parse_args()
+    stats = instrument.current()
+
+    source = open_db(args.source)
+    target = open_db(args.target)
+    tables = args.tables or table_names(source)
+    source_tables = set(table_names(source))
+    target_tables = set(table_names(target))
+    # (tabla, motivo): schema differences count as mismatches, unverified tables are only reported
+    schema = []
+    unverified = []
+    checked = []
+    for t in tables:
+        if t not in source_tables:
+            schema.append((t, 'no existe en el origen'))
+        elif t not in target_tables:
+            schema.append((t, 'no existe en el destino'))
+        elif table_columns(source, t) != table_columns(target, t):
+            schema.append((t, 'las columnas difieren'))
+        elif not has_integer_id(source, t):
+            unverified.append((t, f'sin columna {ID_COLUMN} INTEGER'))
+        else:
+            checked.append(t)
+    if not args.tables:
+        for t in sorted(target_tables - source_tables):
+            schema.append((t, 'no existe en el origen'))
+    try:
+        levels = fk_levels(source, checked)
+    except ValueError as e:
+        raise SystemExit(f'No se pueden ordenar las tablas por FK: {e}')
+
+    results = []
+    with stats.profiled():
+        for t in [t for level in levels for t in level]:
+            r = TableParity(source, target, t, table_columns(source, t), args.fanout, args.leaf_rows).run()
+            results.append(r)
+            stats.add(rows=r.rows)
+            stats.count('range_queries', r.queries)
+            if r.ok:
+                print(f'{t}: OK ({r.rows} filas, {r.queries} consultas)')
+                continue
+            print(f'{t}: {len(r.missing)} faltan, {len(r.extra)} sobran, {len(r.changed)} distintas '
+                  f'({r.rows} filas, {r.queries} consultas)')
+            for label, ids in (('faltan', r.missing), ('sobran', r.extra), ('distintas', r.changed)):
+                if ids:
+                    print(f'  {label}: {format_ids(ids)}')
+    for t, reason in schema:
+        print(f'{t}: DIFERENTE ({reason})')
+    for t, reason in unverified:
+        print(f'{t}: NO VERIFICADA ({reason})')
+
+    bad = [r for r in results if not r.ok]
+    stats.count('mismatched_ids', sum(len(r.missing) + len(r.extra) + len(r.changed) for r in bad))
+    if args.repair:
+        statements = 0
+        with open(args.repair, 'w', encoding='utf-8') as f:
+            # Parents before children for the upserts, children before parents for the deletes
+            for r in bad:
+                for stmt in r.upserts():
+                    f.write(stmt + '\n')
+                    statements += 1
+            for r in reversed(bad):
+                for stmt in r.deletes():
+                    f.write(stmt + '\n')
+                    statements += 1
+        print(f'Reparación escrita en {args.repair} ({statements} sentencias)')
+    source.close()
+    target.close()
+
+    if args.report:
+        report = {'source': args.source, 'target': args.target, 'ok': not (bad or schema),
+                  'tables': [r.report() for r in results],
+                  'schema': [{'table': t, 'reason': reason} for t, reason in schema],
+                  'unverified': [{'table': t, 'reason': reason} for t, reason in unverified]}
+        with open(args.report, 'w', encoding='utf-8') as f:
+            json.dump(report, f, indent=2, ensure_ascii=False)
+            f.write('\n')
+        print('Reporte escrito en', args.report)
+    problems = len(bad) + len(schema)
+    note = f' ({len(unverified)} tabla(s) no verificada(s))' if unverified else ''
+    print(f"Paridad: {'OK' if not problems else f'{problems} tabla(s) con diferencias'}{note}")
+    if problems:
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    with instrument.session('d1_parity'):
+        main()
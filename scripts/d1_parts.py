@@ -0,0 +1,119 @@
+#!/usr/bin/env python3
+"""
+Escritor de archivos parte para D1 con presupuesto de bytes.
+
+Lo usan `generate_d1_insert_batches.py` y `prepare_d1_sql.py`: las sentencias se
+escriben en `<nombre>_NNN.sql` y se abre la parte siguiente cuando la actual
+llegaría a `max_bytes` (o a `max_statements`). Al cerrar se puede escribir un
+manifest JSON con bytes, sentencias, filas insertadas, filas borradas y
+tablas de cada parte, y
+opcionalmente las olas de aplicación en paralelo (ver `d1_order.py`).
+"""
+import json
+import os
+import re
+
+INSERT_TABLE_RE = re.compile(r'^\s*INSERT\s+(?:OR\s+\w+\s+)?INTO\s+["\[`]?([^"\]`\s(]+)', re.IGNORECASE)
+
+
+def insert_table(stmt):
+    """Tabla destino de un INSERT, o None si la sentencia no es un INSERT."""
+    m = INSERT_TABLE_RE.match(stmt)
+    return m.group(1) if m else None
+
+
+class PartWriter:
+    """Escribe sentencias en partes rotando por tamaño en bytes y/o cantidad de sentencias.
+
+    `name_fmt` recibe el número de parte (p.ej. 'inserts_part_{:03d}.sql').
+    `header_lines`/`footer_lines` se escriben en cada parte y cuentan para el
+    presupuesto, igual que el comentario `-- <archivo>` inicial si `name_comment`.
+    Una sentencia que por sí sola supera `max_bytes` va sola en su parte.
+    0 desactiva cada límite.
+    """
+
+    def __init__(self, outdir, name_fmt, max_bytes=0, max_statements=0, header_lines=(), footer_lines=(),
+                 name_comment=True):
+        self.outdir = outdir
+        self.name_fmt = name_fmt
+        self.max_bytes = max_bytes
+        self.max_statements = max_statements
+        self.header_lines = list(header_lines)
+        self.name_comment = name_comment
+        self.footer = ''.join(line + '\n' for line in footer_lines).encode('utf-8')
+        self.parts = []
+        self._f = None
+        self._part = None
+
+    def _open(self):
+        idx = len(self.parts) + 1
+        name = self.name_fmt.format(idx)
+        self._f = open(os.path.join(self.outdir, name), 'wb')
+        self._part = {'file': name, 'bytes': 0, 'statements': 0, 'rows': 0, 'deleted': 0, 'tables': {}}
+        self.parts.append(self._part)
+        lines = ([f'-- {name}'] if self.name_comment else []) + self.header_lines
+        header = ''.join(line + '\n' for line in lines).encode('utf-8')
+        self._f.write(header)
+        self._part['bytes'] += len(header)
+
+    def _close_part(self):
+        if self._f is None:
+            return
+        self._f.write(self.footer)
+        self._part['bytes'] += len(self.footer)
+        self._f.close()
+        self._f = None
+
+    def write(self, stmt, table=None, rows=None, deleted=0):
+        """Agrega una sentencia; `table` y `rows` se deducen del INSERT si no se indican.
+
+        Un DELETE pasa `rows=0` y las filas que borra en `deleted`.
+        """
+        data = (stmt.rstrip() + '\n').encode('utf-8')
+        part = self._part
+        if part is not None and part['statements'] and (
+                (self.max_bytes and part['bytes'] + len(data) + len(self.footer) > self.max_bytes)
+                or (self.max_statements and part['statements'] >= self.max_statements)):
+            self._close_part()
+        if self._f is None:
+            self._open()
+            part = self._part
+        self._f.write(data)
+        if table is None:
+            table = insert_table(stmt)
+        if rows is None:
+            rows = 1 if table else 0
+        part['bytes'] += len(data)
+        part['statements'] += 1
+        part['rows'] += rows
+        part['deleted'] += deleted
+        if table:
+            part['tables'][table] = part['tables'].get(table, 0) + rows
+
+    def rotate(self):
+        """Cierra la parte actual; la próxima sentencia abre una nueva."""
+        self._close_part()
+
+    def close(self):
+        self._close_part()
+        return self.parts
+
+    def write_manifest(self, path, waves=None):
+        return write_manifest(path, self.parts, waves)
+
+
+def write_manifest(path, parts, waves=None):
+    """Escribe el manifest JSON de `parts` y, si se indican, sus olas de aplicación."""
+    manifest = {
+        'parts': parts,
+        'total_bytes': sum(p['bytes'] for p in parts),
+        'total_statements': sum(p['statements'] for p in parts),
+        'total_rows': sum(p['rows'] for p in parts),
+        'total_deleted': sum(p.get('deleted', 0) for p in parts),
+    }
+    if waves is not None:
+        manifest['waves'] = waves
+    with open(path, 'w', encoding='utf-8') as f:
+        json.dump(manifest, f, indent=2, ensure_ascii=False)
+        f.write('\n')
+    return manifest
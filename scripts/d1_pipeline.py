@@ -0,0 +1,213 @@
+#!/usr/bin/env python3
+r"""
+Migración de punta a punta en un solo proceso: CSV -> partes SQL para D1, sin
+archivos intermedios.
+
+Uso:
+  python scripts/d1_pipeline.py --schema d1_schema.sql --csv-dir "C:/Users/jctib/Downloads/db" --outdir scripts/out
+  python scripts/d1_pipeline.py --csv-dir synth/csv --outdir out --multi-row --max-bytes 900000 --db sag_d1.sqlite
+
+Hace en una pasada lo que hoy hace la cadena `create_sqlite_and_import.py` ->
+`generate_dump.py` -> `prepare_d1_sql.py` (o `generate_d1_insert_batches.py
+--no-transactions`), donde cada paso vuelve a leer y escribir todos los datos.
+Cada CSV se lee por bloques de `--chunk-size` filas; cada bloque se convierte
+al tipo de cada columna (`value_types.py`), se renderiza como INSERT
+(`sql_render.py`, con `--json-policy`) y va directo a las partes
+(`d1_parts.PartWriter`, cortadas por `--batch-size` sentencias y/o
+`--max-bytes`), con `manifest.json` y olas como `generate_d1_insert_batches.py`.
+
+Las etapas son generadores encadenados: cada una pide el bloque siguiente a la
+anterior recién cuando terminó con el actual, así que en memoria hay a lo sumo
+un bloque de filas y la sentencia que se está armando, sin importar el tamaño
+de los CSV. Las tablas van en orden de FK y una parte nunca mezcla niveles.
+
+El esquema se carga en una BD en memoria, que solo se usa para los tipos, las
+columnas JSON y el orden de FK. Los artefactos intermedios se escriben solo si
+se piden:
+
+- `--db PATH`: inserta además cada bloque en una BD SQLite nueva (como
+  `create_sqlite_and_import.py`, con las FK activas)
+- `--sql PATH`: escribe además todas las sentencias en un único archivo (como
+  `data_dump_clean.sql`)
+
+Si los CSV traen todas las columnas, las partes son idénticas byte a byte a
+las de `create_sqlite_and_import.py` seguido de `generate_d1_insert_batches.py
+--no-transactions` con las mismas opciones, salvo el INSERT de
+`sqlite_sequence` (los contadores AUTOINCREMENT), que D1 actualiza solo al
+insertar las filas con su id. Si faltan columnas, los INSERT llevan solo las
+del CSV y D1 aplica los DEFAULT.
+
+`--stats`/`--profile`: ver `instrument.py` (fases read, convert, insert,
+render y write).
+"""
+import argparse
+import csv
+import os
+import sqlite3
+
+import instrument
+from create_sqlite_and_import import (DEFAULT_CHUNK_SIZE, build_insert_sql, find_csv_files, iter_row_chunks,
+                                      map_header_to_columns, table_from_filename, write_chunk)
+from d1_order import build_waves, fk_levels
+from d1_parts import PartWriter
+from generate_d1_insert_batches import D1_MAX_STATEMENT_BYTES, pack_values
+from json_codec import JsonCodec
+from sql_render import JSON_POLICIES, compile_row_encoder
+from value_types import TIMESTAMP_POLICIES, failures_summary, row_stages
+
+
+def iter_csv_chunks(conn, table, csv_path, chunk_size=DEFAULT_CHUNK_SIZE):
+    """Produce primero las columnas de `table` que trae el CSV y luego bloques de filas en ese orden."""
+    with open(csv_path, newline='', encoding='utf8') as f:
+        reader = csv.reader(f)
+        header = next(reader, None)
+        cols, indexes = map_header_to_columns(conn, table, header) if header else ([], [])
+        yield cols
+        if cols:
+            yield from iter_row_chunks(reader, indexes, chunk_size)
+
+
+def table_statements(conn, table, csv_path, chunk_size=DEFAULT_CHUNK_SIZE, multi_row=False,
+                     max_statement_bytes=D1_MAX_STATEMENT_BYTES, max_values=0, json_policy='collapse', codec=None,
+                     timestamps='keep', failures=None, staging=None):
+    """Produce (sentencia, filas) para las filas de `csv_path`, leyendo el CSV a medida que se consumen.
+
+    Con `staging` (una conexión) cada bloque se inserta también ahí antes de renderizarse.
+    """
+    stats = instrument.current()
+    chunks = iter_csv_chunks(conn, table, csv_path, chunk_size)
+    cols = next(chunks)
+    if not cols:
+        print(f'No matching columns for {csv_path} in table {table}')
+        return
+    prepare = row_stages(conn, table, cols, timestamps=timestamps, failures=failures)
+    _, encode_row = compile_row_encoder(conn, table, json_policy, codec, columns=cols)
+    insert_sql = build_insert_sql(table, cols) if staging is not None else None
+
+    def tuples():
+        for chunk in stats.timed_iter('read', chunks):
+            if prepare:
+                with stats.phase('convert'):
+                    prepare(chunk)
+            if staging is not None:
+                with stats.phase('insert'):
+                    write_chunk(staging, insert_sql, chunk)
+            with stats.phase('render'):
+                rendered = [encode_row(row) for row in chunk]
+            stats.add(rows=len(chunk))
+            yield from rendered
+
+    col_list_sql = ', '.join([f'"{c}"' for c in cols])
+    prefix = f'INSERT OR IGNORE INTO "{table}" ({col_list_sql}) VALUES '
+    if multi_row:
+        yield from pack_values(prefix, tuples(), len(cols), max_statement_bytes, max_values)
+    else:
+        for t in tuples():
+            yield f'{prefix}{t};', 1
+
+
+def open_schema(schema_path, db_path=None):
+    """Conexión con el esquema creado: la BD de staging `db_path` (nueva) o una en memoria."""
+    if db_path and os.path.exists(db_path):
+        raise SystemExit(f"'{db_path}' ya existe; el staging se crea desde cero.")
+    conn = sqlite3.connect(db_path or ':memory:')
+    with open(schema_path, 'r', encoding='utf8') as f:
+        conn.executescript(f.read())
+    return conn
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--schema', default='d1_schema.sql', help='Ruta a d1_schema.sql')
+    parser.add_argument('--csv-dir', required=True, help='Carpeta con los CSV (con encabezado, un archivo por tabla)')
+    parser.add_argument('--outdir', default='scripts/out', help='Directorio de salida para partes SQL')
+    parser.add_argument('--chunk-size', type=int, default=DEFAULT_CHUNK_SIZE, help='Filas por bloque entre etapas')
+    parser.add_argument('--batch-size', type=int, default=500, help='Cantidad máxima de INSERTs por archivo (0 = sin límite)')
+    parser.add_argument('--max-bytes', type=int, default=0, help='Tamaño objetivo máximo de cada archivo en bytes (0 = sin límite)')
+    parser.add_argument('--multi-row', action='store_true', help='Empaquetar varias filas por INSERT ... VALUES (...),(...)')
+    parser.add_argument('--max-statement-bytes', type=int, default=D1_MAX_STATEMENT_BYTES, help='Tamaño máximo de cada INSERT multi-fila (bytes)')
+    parser.add_argument('--max-values', type=int, default=0, help='Máximo de valores por INSERT multi-fila (0 = sin límite)')
+    parser.add_argument('--json-policy', choices=JSON_POLICIES, default='collapse', help='Cómo escribir las columnas JSON (ver sql_render.py)')
+    parser.add_argument('--timestamps', choices=TIMESTAMP_POLICIES, default='keep', help="'iso' reescribe las columnas *At en UTC ISO-8601 como el Worker")
+    parser.add_argument('--db', help='Guardar también las filas en esta BD SQLite nueva')
+    parser.add_argument('--sql', help='Escribir también todas las sentencias en este archivo')
+    instrument.add_arguments(parser)
+    args = parser.parse_args()
+    stats = instrument.current()
+
+    if not os.path.exists(args.schema):
+        raise SystemExit(f"No se encontró el esquema en '{args.schema}'.")
+    files = {table_from_filename(fp): fp for fp in sorted(find_csv_files(args.csv_dir))}
+    if not files:
+        raise SystemExit(f'No se encontraron CSV en {args.csv_dir}')
+
+    conn = open_schema(args.schema, args.db)
+    known = {r[0] for r in conn.execute("SELECT name FROM sqlite_master WHERE type='table'")}
+    for t in sorted(set(files) - known):
+        print(f'Se omite {files[t]}: la tabla {t} no está en el esquema')
+    try:
+        levels = fk_levels(conn, sorted(set(files) & known))
+    except ValueError as e:
+        raise SystemExit(f'No se pueden ordenar las tablas por FK: {e}')
+    print('Orden por FK: ' + ' | '.join(', '.join(level) for level in levels))
+
+    os.makedirs(args.outdir, exist_ok=True)
+    writer = PartWriter(args.outdir, 'inserts_part_{:03d}.sql', max_bytes=args.max_bytes,
+                        max_statements=args.batch_size)
+    sql_out = open(args.sql, 'w', encoding='utf8') if args.sql else None
+    # One codec for every table, so repeated payloads hit the same cache
+    codec = JsonCodec() if args.json_policy == 'minify' else None
+    failures = {}
+    staging = conn if args.db else None
+    total = 0
+    try:
+        with stats.profiled():
+            for level in levels:
+                # Parts never mix levels, so every part of a wave is independent of the others
+                writer.rotate()
+                for t in level:
+                    print(f'Procesando {files[t]} -> {t}')
+                    count = rows = 0
+                    statements = table_statements(conn, t, files[t], args.chunk_size, args.multi_row,
+                                                  args.max_statement_bytes, args.max_values, args.json_policy,
+                                                  codec, args.timestamps, failures, staging)
+                    for stmt, n in statements:
+                        with stats.phase('write'):
+                            writer.write(stmt, table=t, rows=n)
+                            if sql_out:
+                                sql_out.write(stmt + '\n')
+                        count += 1
+                        rows += n
+                    print(f'  -> {rows} filas, {count} INSERTs')
+                    total += count
+    finally:
+        parts = writer.close()
+        if sql_out:
+            sql_out.close()
+        conn.close()
+    stats.add(bytes_read=sum(os.path.getsize(files[t]) for level in levels for t in level),
+              bytes_written=sum(p['bytes'] for p in parts))
+
+    print(failures_summary(failures))
+    stats.count('conversion_failures', sum(failures.values()))
+    if codec:
+        print(codec.summary())
+        stats.count('json_malformed', sum(codec.malformed.values()))
+    if not total:
+        print('No se generaron INSERTs (CSV vacíos).')
+        return
+    for part in parts:
+        print(f"  -> escrito {os.path.join(args.outdir, part['file'])} ({part['statements']} inserts, {part['bytes']} bytes)")
+    waves = build_waves(levels, parts)
+    manifest_path = os.path.join(args.outdir, 'manifest.json')
+    writer.write_manifest(manifest_path, waves)
+    print(f'  -> manifest {manifest_path} ({len(waves)} olas)')
+    if args.db:
+        print(f'  -> BD de staging en {args.db}')
+    if args.sql:
+        print(f'  -> sentencias en {args.sql}')
+
+
+if __name__ == '__main__':
+    with instrument.session('d1_pipeline'):
+        main()
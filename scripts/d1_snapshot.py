@@ -0,0 +1,287 @@
+#!/usr/bin/env python3
+r"""
+Snapshot compacto de una BD SQLite: alternativa a los dumps SQL de texto.
+
+Uso:
+  python scripts/d1_snapshot.py save --db sag_d1.sqlite --out sag_d1.snap.gz
+  python scripts/d1_snapshot.py save --db sag_d1.sqlite --out sag_d1.snap.xz --compress lzma
+  python scripts/d1_snapshot.py load --in sag_d1.snap.gz --db restaurada.sqlite
+  python scripts/d1_snapshot.py info --in sag_d1.snap.gz
+
+El archivo es un flujo comprimido (gzip o lzma, detectado al leer) de líneas
+JSON:
+
+1. cabecera: formato, versión, y por tabla el CREATE TABLE, columnas, tipos
+   declarados y filas; además los CREATE INDEX/TRIGGER/VIEW
+2. bloques `[tabla, [[v1, v2, ...], ...]]` de hasta `--chunk-rows` filas
+3. cierre `{"end": true, "rows": {...}}` para detectar archivos truncados
+
+Los nombres de tabla y columna no se repiten por fila y los valores conservan
+su clase de almacenamiento (INTEGER, REAL, TEXT, NULL; los BLOB van como
+`{"$blob": base64}` y el bloque lo marca). json y zlib/lzma están en C, así
+que guardar y cargar es rápido y ninguna de las dos cosas carga la BD entera
+en memoria. Las tablas van en orden de FK y la carga crea los índices al final.
+
+`save` y `load` aceptan `--stats`/`--profile` (ver `instrument.py`): `save`
+mide read, render (json) y write (compresión y disco); `load` mide read
+(descompresión y json) e insert.
+"""
+import argparse
+import base64
+import gzip
+import json
+import lzma
+import os
+import sqlite3
+import time
+from datetime import datetime, timezone
+
+import instrument
+from d1_order import fk_levels
+
+FORMAT = 'sag-snapshot'
+VERSION = 1
+DEFAULT_CHUNK_ROWS = 5000
+COMPRESSORS = ('gzip', 'lzma')
+
+_GZIP_MAGIC = b'\x1f\x8b'
+_XZ_MAGIC = b'\xfd7zXZ\x00'
+
+
+def open_snapshot(path, mode, compress='gzip', level=None):
+    """Abre `path` como texto comprimido; al leer detecta gzip/lzma por los bytes mágicos."""
+    if 'r' in mode:
+        with open(path, 'rb') as f:
+            magic = f.read(6)
+        compress = 'lzma' if magic.startswith(_XZ_MAGIC) else 'gzip' if magic.startswith(_GZIP_MAGIC) else None
+        if compress is None:
+            raise ValueError(f'{path} is not a gzip/xz snapshot')
+    if compress == 'lzma':
+        return lzma.open(path, mode + 't', encoding='utf-8', preset=level if 'w' in mode else None)
+    return gzip.open(path, mode + 't', encoding='utf-8', compresslevel=level if level is not None else 6)
+
+
+def _encode_blobs(rows):
+    return [[{'$blob': base64.b64encode(v).decode('ascii')} if type(v) is bytes else v for v in r] for r in rows]
+
+
+def _decode_blobs(rows):
+    return [[base64.b64decode(v['$blob']) if type(v) is dict else v for v in r] for r in rows]
+
+
+def snapshot_header(conn, tables):
+    entries = []
+    for t in tables:
+        info = conn.execute(f"PRAGMA table_info('{t}')").fetchall()
+        sql = conn.execute("SELECT sql FROM sqlite_master WHERE type='table' AND name=?", (t,)).fetchone()[0]
+        entries.append({
+            'name': t,
+            'sql': None if t == 'sqlite_sequence' else sql,
+            'columns': [c[1] for c in info],
+            'types': [c[2] for c in info],
+            'rows': conn.execute(f'SELECT COUNT(*) FROM "{t}"').fetchone()[0],
+        })
+    extra = [r[0] for r in conn.execute(
+        "SELECT sql FROM sqlite_master WHERE type IN ('index', 'trigger', 'view') AND sql IS NOT NULL "
+        "ORDER BY type = 'view', type = 'trigger', name")]
+    return {'format': FORMAT, 'version': VERSION, 'created': datetime.now(timezone.utc).isoformat(timespec='seconds'),
+            'tables': entries, 'schema_extra': extra}
+
+
+def write_snapshot(conn, path, compress='gzip', level=None, chunk_rows=DEFAULT_CHUNK_ROWS):
+    """Escribe el snapshot de `conn` en `path`; devuelve la cabecera escrita."""
+    # Tables in FK order so a loader with foreign keys on never sees a child before its parent
+    tables = [t for level in fk_levels(conn) for t in level]
+    # AUTOINCREMENT counters go last, after the rows that would otherwise bump them
+    if conn.execute("SELECT 1 FROM sqlite_master WHERE name='sqlite_sequence'").fetchone():
+        tables.append('sqlite_sequence')
+    stats = instrument.current()
+    conn.execute('BEGIN')
+    try:
+        header = snapshot_header(conn, tables)
+        counts = {}
+        with open_snapshot(path, 'w', compress, level) as f:
+            f.write(json.dumps(header, ensure_ascii=False) + '\n')
+            for entry in header['tables']:
+                t = entry['name']
+                cur = conn.execute(f"SELECT {', '.join(chr(34) + c + chr(34) for c in entry['columns'])} FROM \"{t}\"")
+                n = 0
+                while True:
+                    with stats.phase('read'):
+                        rows = cur.fetchmany(chunk_rows)
+                    if not rows:
+                        break
+                    with stats.phase('render'):
+                        if any(type(v) is bytes for r in rows for v in r):
+                            line = json.dumps([t, _encode_blobs(rows), 1], ensure_ascii=False) + '\n'
+                        else:
+                            line = json.dumps([t, rows], ensure_ascii=False) + '\n'
+                    with stats.phase('write'):
+                        f.write(line)
+                    n += len(rows)
+                counts[t] = n
+                stats.add(rows=n)
+            f.write(json.dumps({'end': True, 'rows': counts}) + '\n')
+    finally:
+        conn.rollback()
+    return header
+
+
+def _check_header(path, header):
+    if header.get('format') != FORMAT:
+        raise ValueError(f'{path} is not a {FORMAT} file')
+    if header.get('version', 0) > VERSION:
+        raise ValueError(f"{path} has format version {header['version']}, newer than {VERSION}")
+    return header
+
+
+def read_header(path):
+    with open_snapshot(path, 'r') as f:
+        return _check_header(path, json.loads(f.readline()))
+
+
+def iter_snapshot(path):
+    """Produce la cabecera y luego (tabla, filas) por bloque; verifica el cierre del archivo."""
+    with open_snapshot(path, 'r') as f:
+        yield _check_header(path, json.loads(f.readline()))
+        for line in f:
+            item = json.loads(line)
+            if type(item) is dict:
+                if item.get('end'):
+                    return
+                continue
+            rows = _decode_blobs(item[1]) if len(item) > 2 and item[2] else item[1]
+            yield item[0], rows
+    raise ValueError(f'{path} is truncated (no end marker)')
+
+
+def load_snapshot(conn, path, replace=False):
+    """Carga el snapshot en `conn`. Crea las tablas que falten (o todas con `replace`).
+
+    Devuelve {tabla: filas cargadas}. Lanza ValueError si el archivo está
+    truncado o si las filas no coinciden con la cabecera.
+    """
+    stream = iter_snapshot(path)
+    header = next(stream)
+    expected = {}
+    columns = {}
+    conn.execute('BEGIN')
+    for entry in header['tables']:
+        t = entry['name']
+        expected[t] = entry['rows']
+        columns[t] = entry['columns']
+        if entry['sql'] is None:
+            continue
+        if replace:
+            conn.execute(f'DROP TABLE IF EXISTS "{t}"')
+        exists = conn.execute("SELECT 1 FROM sqlite_master WHERE type='table' AND name=?", (t,)).fetchone()
+        if not exists:
+            conn.execute(entry['sql'])
+    conn.commit()
+
+    sql = {t: f'INSERT INTO "{t}" ({", ".join(chr(34) + c + chr(34) for c in cols)}) VALUES '
+              f'({", ".join("?" * len(cols))})' for t, cols in columns.items()}
+    stats = instrument.current()
+    loaded = dict.fromkeys(expected, 0)
+    for t, rows in stats.timed_iter('read', stream):
+        with stats.phase('insert'):
+            conn.execute('BEGIN')
+            if t == 'sqlite_sequence':
+                # The inserts above already created counters; the snapshot's values replace them
+                conn.executemany('DELETE FROM sqlite_sequence WHERE name = ?', [(r[0],) for r in rows])
+            conn.executemany(sql[t], rows)
+            conn.commit()
+        loaded[t] += len(rows)
+        stats.add(rows=len(rows))
+
+    # Indexes after the data: building them once is cheaper than maintaining them per row
+    for stmt in header.get('schema_extra', []):
+        try:
+            conn.execute(stmt)
+        except sqlite3.OperationalError as e:
+            if 'already exists' not in str(e):
+                raise
+    conn.commit()
+    mismatched = {t: (loaded[t], n) for t, n in expected.items() if loaded[t] != n}
+    if mismatched:
+        raise ValueError('row counts differ from the header: ' +
+                         ', '.join(f'{t} {got}/{want}' for t, (got, want) in mismatched.items()))
+    return loaded
+
+
+def cmd_save(args):
+    if not os.path.exists(args.db):
+        raise SystemExit(f"No se encontró la BD en '{args.db}'.")
+    conn = sqlite3.connect(args.db, isolation_level=None)
+    stats = instrument.current()
+    started = time.perf_counter()
+    with stats.profiled():
+        header = write_snapshot(conn, args.out, args.compress, args.level, args.chunk_rows)
+    conn.close()
+    total = sum(t['rows'] for t in header['tables'])
+    size = os.path.getsize(args.out)
+    stats.add(bytes_read=os.path.getsize(args.db), bytes_written=size)
+    print(f'Escrito {args.out}: {len(header["tables"])} tablas, {total} filas, {size} bytes '
+          f'({os.path.getsize(args.db)} bytes la BD) en {time.perf_counter() - started:.2f}s')
+
+
+def cmd_load(args):
+    if os.path.exists(args.db) and not (args.append or args.replace):
+        raise SystemExit(f"'{args.db}' ya existe; usa --replace o --append.")
+    conn = sqlite3.connect(args.db, isolation_level=None)
+    stats = instrument.current()
+    started = time.perf_counter()
+    try:
+        with stats.profiled():
+            loaded = load_snapshot(conn, args.input, replace=args.replace)
+    except (ValueError, sqlite3.Error) as e:
+        conn.close()
+        raise SystemExit(f'Error cargando {args.input}: {e}')
+    conn.close()
+    stats.add(bytes_read=os.path.getsize(args.input))
+    for t, n in loaded.items():
+        print(f'  {t}: {n} filas')
+    print(f'Cargado {args.input} en {args.db} ({sum(loaded.values())} filas) en {time.perf_counter() - started:.2f}s')
+
+
+def cmd_info(args):
+    header = read_header(args.input)
+    print(f"{header['format']} v{header['version']}, creado {header['created']}")
+    for t in header['tables']:
+        print(f"  {t['name']}: {t['rows']} filas, columnas {', '.join(t['columns'])}")
+    for stmt in header.get('schema_extra', []):
+        print('  ' + ' '.join(stmt.split()))
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    sub = parser.add_subparsers(dest='command', required=True)
+
+    p = sub.add_parser('save', help='Escribir un snapshot de una BD')
+    p.add_argument('--db', default='sag_d1.sqlite')
+    p.add_argument('--out', required=True)
+    p.add_argument('--compress', choices=COMPRESSORS, default='gzip')
+    p.add_argument('--level', type=int, help='Nivel de compresión (gzip 1-9, lzma 0-9)')
+    p.add_argument('--chunk-rows', type=int, default=DEFAULT_CHUNK_ROWS, help='Filas por bloque')
+    instrument.add_arguments(p)
+    p.set_defaults(func=cmd_save)
+
+    p = sub.add_parser('load', help='Cargar un snapshot en una BD SQLite')
+    p.add_argument('--in', dest='input', required=True)
+    p.add_argument('--db', required=True)
+    p.add_argument('--replace', action='store_true', help='Borrar y recrear las tablas del snapshot')
+    p.add_argument('--append', action='store_true', help='Insertar en tablas existentes')
+    instrument.add_arguments(p)
+    p.set_defaults(func=cmd_load)
+
+    p = sub.add_parser('info', help='Mostrar la cabecera de un snapshot')
+    p.add_argument('--in', dest='input', required=True)
+    p.set_defaults(func=cmd_info)
+
+    args = parser.parse_args()
+    args.func(args)
+
+
+if __name__ == '__main__':
+    with instrument.session('d1_snapshot'):
+        main()
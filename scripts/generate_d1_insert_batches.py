@@ -10,62 +10,139 @@ El script lee todas las tablas presentes en la BD y crea
 correctamente escapadas ('' para comillas simples) y
 `INSERT OR IGNORE` para evitar errores por duplicados si la tabla
 ya contiene filas.
+
+Con `--multi-row` cada INSERT lleva varias filas (`VALUES (...),(...)`),
+tantas como quepan en `--max-statement-bytes` (100 KB por defecto, el límite
+de D1) y, si se indica, en `--max-values` valores por sentencia.
+
+Los archivos se cortan por `--batch-size` sentencias y/o por `--max-bytes`
+bytes (lo que ocurra primero). `manifest.json` en `--outdir` lista el tamaño,
+las filas y las tablas de cada parte. Las tablas se leen con fetchmany y cada
+parte se escribe a medida que se llena, así que la memoria no depende del
+tamaño de la BD.
+
+Con `--delta estado.json` solo se exportan las filas nuevas o modificadas
+desde la corrida anterior (marcas de agua por tabla sobre `id`/`updatedAt`)
+como `INSERT ... ON CONFLICT(id) DO UPDATE`.
+
+Con `--changes hashes.sqlite` la detección es por hash del contenido de cada
+fila (sirve para CourseBlocks/Enrollments/QuizResults, que no tienen
+`updatedAt`): salen UPSERTs para filas nuevas o cambiadas y DELETEs para las
+que desaparecieron.
+
+Las tablas se exportan en orden topológico según `PRAGMA foreign_key_list`
+(padres antes que hijas; `--tables` solo elige cuáles) y una parte nunca mezcla
+tablas de niveles distintos. `manifest.json` incluye `waves`: las partes de una
+misma ola se pueden aplicar en paralelo y las olas van en orden. Con `--changes`
+los DELETEs van en partes aparte, en olas finales de hijas a padres.
+
+`--stats`/`--profile` separan el tiempo de render (leer y codificar filas) del
+de write (escribir las partes); ver `instrument.py`.
 """
 import argparse
 import os
 import sqlite3
-import math
 import textwrap
 
+import instrument
+from d1_changes import HashManifest, delete_statement
+from d1_delta import delta_filter, load_state, save_state, upsert_clause
+from d1_order import build_waves, fk_levels
+from d1_parts import PartWriter
+from json_codec import JsonCodec
+from sql_render import JSON_POLICIES, compile_row_encoder, iter_rows
 
-def sql_escape(value):
-    if value is None:
-        return 'NULL'
-    if isinstance(value, (int, float)):
-        return str(value)
-    # Otherwise treat as text; ensure it's a Python str
-    s = str(value)
-    # Remove embedded NULs which can break some SQL processors
-    s = s.replace('\x00', '')
-    # Normalize whitespace and escape newlines so each INSERT is safer to pass via file/CLI
-    s = s.replace('\r', '')
-    s = s.replace('\n', '\\n')
-    # Collapse multiple spaces introduced by newlines into single spaces where appropriate
-    # (keep this simple to avoid changing intended content structure)
-    s = ' '.join(s.split())
-    # Escape single quotes for SQL literal
-    s = s.replace("'", "''")
-    return "'{}'".format(s)
-
-
-def generate_inserts_for_table(conn, table):
-    cur = conn.cursor()
-    # Get columns in order
-    cur.execute(f"PRAGMA table_info('{table}')")
-    cols_info = cur.fetchall()
-    cols = [c[1] for c in cols_info]
+# Límite de longitud de una sentencia SQL en D1 (100 KB)
+D1_MAX_STATEMENT_BYTES = 100_000
+
+
+def pack_values(prefix, tuples, n_cols, max_statement_bytes=D1_MAX_STATEMENT_BYTES, max_values=0, suffix=''):
+    """Empaqueta tuplas `(...)` ya renderizadas en INSERTs multi-fila.
+
+    Cada sentencia `prefix (..),(..) suffix;` se cierra antes de superar
+    `max_statement_bytes` (UTF-8) o `max_values` valores (0 = sin límite).
+    Una fila que por sí sola supera el límite va en su propia sentencia.
+    Produce (sentencia, filas) a medida que consume `tuples`.
+    """
+    rows_limit = max(1, max_values // n_cols) if max_values else None
+    prefix_bytes = len(prefix.encode('utf-8')) + len(suffix.encode('utf-8')) + 1  # + ';'
+    batch = []
+    size = prefix_bytes
+    for t in tuples:
+        t_bytes = len(t.encode('utf-8')) + 1  # + ','
+        if batch and (size + t_bytes > max_statement_bytes or (rows_limit and len(batch) >= rows_limit)):
+            yield prefix + ','.join(batch) + suffix + ';', len(batch)
+            batch = []
+            size = prefix_bytes
+        batch.append(t)
+        size += t_bytes
+    if batch:
+        yield prefix + ','.join(batch) + suffix + ';', len(batch)
+
+
+def generate_inserts_for_table(conn, table, multi_row=False, max_statement_bytes=D1_MAX_STATEMENT_BYTES, max_values=0,
+                               json_policy='collapse', where=None, params=(), upsert=False, manifest=None,
+                               deletes=True, codec=None):
+    """Produce los INSERTs de `table` como (sentencia, filas), leyendo la tabla por bloques.
+
+    `where`/`params` filtran las filas (modo delta); con `upsert` se emite
+    `INSERT ... ON CONFLICT(id) DO UPDATE` en lugar de `INSERT OR IGNORE`.
+    Con `manifest` (d1_changes.HashManifest) solo salen las filas cuyo hash
+    cambió, como UPSERT, seguidas de los DELETE de las filas que ya no existen
+    (salvo `deletes=False`, para emitirlos aparte con `manifest.deleted_ids`).
+    `codec` (json_codec.JsonCodec) se usa con `json_policy='minify'`.
+    """
+    # Columns in order, each with an encoder compiled from the schema
+    cols, encode_row = compile_row_encoder(conn, table, json_policy, codec)
     col_list_sql = ', '.join([f'"{c}"' for c in cols])
 
-    cur.execute(f"SELECT {', '.join(cols)} FROM '{table}'")
-    rows = cur.fetchall()
-    inserts = []
-    for row in rows:
-        vals = [sql_escape(v) for v in row]
-        vals_sql = ', '.join(vals)
-        stmt = f'INSERT OR IGNORE INTO "{table}" ({col_list_sql}) VALUES ({vals_sql});'
-        inserts.append(stmt)
-    return inserts
+    if manifest is not None:
+        upsert = True
+        rows = manifest.changed_rows(conn, table, cols)
+    else:
+        cur = conn.cursor()
+        if where:
+            cur.execute(f"SELECT {', '.join(cols)} FROM '{table}' WHERE {where} ORDER BY id", params)
+        else:
+            cur.execute(f"SELECT {', '.join(cols)} FROM '{table}'")
+        rows = iter_rows(cur)
+    tuples = (encode_row(row) for row in rows)
+    if upsert:
+        prefix = f'INSERT INTO "{table}" ({col_list_sql}) VALUES '
+        suffix = upsert_clause(cols)
+    else:
+        prefix = f'INSERT OR IGNORE INTO "{table}" ({col_list_sql}) VALUES '
+        suffix = ''
+    if multi_row:
+        yield from pack_values(prefix, tuples, len(cols), max_statement_bytes, max_values, suffix)
+    else:
+        for t in tuples:
+            yield f'{prefix}{t}{suffix};', 1
+    if manifest is not None and deletes:
+        for ids in manifest.deleted_ids(table):
+            yield delete_statement(table, ids), len(ids)
 
 
 def main():
     parser = argparse.ArgumentParser()
     parser.add_argument('--db', required=True, help='Ruta al archivo sqlite (ej. sag_d1.sqlite)')
     parser.add_argument('--outdir', default='scripts/out', help='Directorio de salida para partes SQL')
-    parser.add_argument('--batch-size', type=int, default=500, help='Cantidad máxima de INSERTs por archivo')
-    parser.add_argument('--tables', nargs='*', help='Lista opcional de tablas en el orden deseado')
+    parser.add_argument('--batch-size', type=int, default=500, help='Cantidad máxima de INSERTs por archivo (0 = sin límite)')
+    parser.add_argument('--max-bytes', type=int, default=0, help='Tamaño objetivo máximo de cada archivo en bytes (0 = sin límite)')
+    parser.add_argument('--tables', nargs='*', help='Lista opcional de tablas (se ordenan por dependencias de FK)')
     parser.add_argument('--no-transactions', action='store_true', help='No incluir PRAGMA/BEGIN/COMMIT en los archivos (útil para D1)')
+    parser.add_argument('--multi-row', action='store_true', help='Empaquetar varias filas por INSERT ... VALUES (...),(...)')
+    parser.add_argument('--max-statement-bytes', type=int, default=D1_MAX_STATEMENT_BYTES, help='Tamaño máximo de cada INSERT multi-fila (bytes)')
+    parser.add_argument('--max-values', type=int, default=0, help='Máximo de valores por INSERT multi-fila (0 = sin límite)')
+    parser.add_argument('--json-policy', choices=JSON_POLICIES, default='collapse', help='Cómo escribir las columnas JSON (ver sql_render.py)')
+    parser.add_argument('--delta', metavar='STATE_FILE', help='Exportar solo filas nuevas/modificadas desde la última corrida como UPSERT (ver d1_delta.py)')
+    parser.add_argument('--changes', metavar='MANIFEST', help='Exportar solo filas cuyo hash de contenido cambió, más DELETEs (ver d1_changes.py)')
+    instrument.add_arguments(parser)
     args = parser.parse_args()
+    stats = instrument.current()
 
+    if args.delta and args.changes:
+        parser.error('--delta y --changes son excluyentes')
     if not os.path.exists(args.db):
         raise SystemExit(f"No se encontró la BD en '{args.db}'. Genera primero 'sag_d1.sqlite'.")
 
@@ -79,41 +156,102 @@ def main():
     else:
         cur.execute("SELECT name FROM sqlite_master WHERE type='table' ORDER BY name;")
         tables = [r[0] for r in cur.fetchall()]
+    try:
+        levels = fk_levels(conn, tables)
+    except ValueError as e:
+        raise SystemExit(f'No se pueden ordenar las tablas por FK: {e}')
+    print('Orden por FK: ' + ' | '.join(', '.join(level) for level in levels))
 
-    all_inserts = []
-    for t in tables:
-        print(f'Leyendo tabla: {t}')
-        inserts = generate_inserts_for_table(conn, t)
-        print(f'  -> {len(inserts)} INSERTs generados')
-        all_inserts.extend(inserts)
+    header_lines = []
+    footer_lines = []
+    if not args.no_transactions:
+        header_lines = ['PRAGMA foreign_keys = OFF;', 'BEGIN TRANSACTION;']
+        footer_lines = ['COMMIT;']
+    writer = PartWriter(args.outdir, 'inserts_part_{:03d}.sql', max_bytes=args.max_bytes,
+                        max_statements=args.batch_size, header_lines=header_lines, footer_lines=footer_lines)
+    print(f'Escribiendo INSERTs en {args.outdir} (batch-size={args.batch_size}, max-bytes={args.max_bytes})')
 
-    if not all_inserts:
-        print('No se generaron INSERTs (BD vacía).')
-        return
+    state = load_state(args.delta)
+    manifest = HashManifest(args.changes) if args.changes else None
+    # One codec for every table, so repeated payloads hit the same cache
+    codec = JsonCodec() if args.json_policy == 'minify' else None
+    if args.delta or manifest:
+        # One read transaction so every table is filtered against the same snapshot
+        conn.execute('BEGIN')
+    total = 0
+    with stats.profiled():
+        for level in levels:
+            # Parts never mix levels, so every part of a wave is independent of the others
+            writer.rotate()
+            for t in level:
+                print(f'Leyendo tabla: {t}')
+                where, params = None, ()
+                if args.delta:
+                    delta = delta_filter(conn, t, state)
+                    if delta is None:
+                        print('  -> sin columna id, se omite en modo delta')
+                        continue
+                    where, params, state[t] = delta
+                elif manifest and 'id' not in [c[1] for c in conn.execute(f"PRAGMA table_info('{t}')")]:
+                    print('  -> sin columna id, se omite en modo --changes')
+                    continue
+                count = 0
+                statements = generate_inserts_for_table(conn, t, multi_row=args.multi_row,
+                                                        max_statement_bytes=args.max_statement_bytes,
+                                                        max_values=args.max_values,
+                                                        json_policy=args.json_policy,
+                                                        where=where, params=params, upsert=bool(args.delta),
+                                                        manifest=manifest, deletes=False, codec=codec)
+                for stmt, n in stats.timed_iter('render', statements):
+                    with stats.phase('write'):
+                        writer.write(stmt, table=t, rows=n)
+                    stats.add(rows=n)
+                    count += 1
+                print(f'  -> {count} INSERTs generados')
+                if manifest:
+                    print('     ' + ', '.join(f'{k}={v}' for k, v in manifest.stats[t].items()))
+                total += count
+        n_insert_parts = len(writer.parts)
 
-    total = len(all_inserts)
-    batches = math.ceil(total / args.batch_size)
-    print(f'Escribiendo {total} INSERTs en {batches} archivo(s) (batch-size={args.batch_size})')
-
-    for i in range(batches):
-        start = i * args.batch_size
-        end = min(start + args.batch_size, total)
-        part = all_inserts[start:end]
-        fname = os.path.join(args.outdir, f'inserts_part_{i+1:03d}.sql')
-        with open(fname, 'w', encoding='utf-8') as f:
-            header_lines = [f'-- inserts_part_{i+1:03d}.sql', f'-- Contiene INSERTs {start+1}..{end} de {total}']
-            if not args.no_transactions:
-                header_lines.append('PRAGMA foreign_keys = OFF;')
-                header_lines.append('BEGIN TRANSACTION;')
-            f.write('\n'.join(header_lines) + '\n')
-            for stmt in part:
-                f.write(stmt + '\n')
-            if not args.no_transactions:
-                f.write('COMMIT;\n')
-        print(f'  -> escrito {fname} ({len(part)} inserts)')
+        if manifest:
+            # Deletes run after every upsert, children before parents
+            for level in reversed(levels):
+                writer.rotate()
+                for t in level:
+                    if t not in manifest.stats:
+                        continue
+                    for ids in manifest.deleted_ids(t):
+                        writer.write(delete_statement(t, ids), table=t, rows=0, deleted=len(ids))
+                        total += 1
+
+        parts = writer.close()
+    stats.add(bytes_written=sum(p['bytes'] for p in parts))
+    if args.delta:
+        conn.commit()
+        save_state(args.delta, state)
+        print(f'  -> estado delta guardado en {args.delta}')
+    if manifest:
+        conn.commit()
+        manifest.commit()
+        manifest.close()
+        print(f'  -> manifest de hashes actualizado en {args.changes}')
+    if not total:
+        print('No se generaron INSERTs (BD vacía o sin cambios).')
+        return
+    for part in parts:
+        print(f"  -> escrito {os.path.join(args.outdir, part['file'])} ({part['statements']} inserts, {part['bytes']} bytes)")
+    waves = build_waves(levels, parts[:n_insert_parts])
+    waves += build_waves(levels, parts[n_insert_parts:], reverse=True, first_wave=len(waves) + 1)
+    manifest_path = os.path.join(args.outdir, 'manifest.json')
+    writer.write_manifest(manifest_path, waves)
+    print(f'  -> manifest {manifest_path} ({len(waves)} olas)')
+    if codec:
+        print('  -> ' + codec.summary())
+        stats.count('json_malformed', sum(codec.malformed.values()))
 
     conn.close()
 
 
 if __name__ == '__main__':
-    main()
+    with instrument.session('generate_d1_insert_batches'):
+        main()
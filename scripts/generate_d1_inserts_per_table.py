@@ -8,54 +8,217 @@ Uso:
 Cada archivo generado es `<outdir>/<table>_inserts.sql` y contiene únicamente
 una línea por INSERT (sin PRAGMA/BEGIN/COMMIT por defecto). Esto facilita
 ejecutar cada tabla por separado en D1 para aislar errores de FK.
+Las filas se leen con fetchmany y se escriben a medida que se generan.
+
+Con `--delta estado.json` cada archivo contiene solo las filas nuevas o
+modificadas desde la corrida anterior, como `INSERT ... ON CONFLICT(id) DO UPDATE`.
+Con `--changes hashes.sqlite` los cambios se detectan por hash del contenido de
+cada fila (útil en tablas sin `updatedAt`); los DELETEs de filas borradas van
+en `<table>_deletes.sql`.
+
+Las tablas se procesan en orden topológico según `PRAGMA foreign_key_list`
+(`--tables` solo elige cuáles) y `<outdir>/manifest.json` agrupa los archivos
+en olas (`waves`): los de una misma ola se pueden ejecutar en paralelo y las
+olas van en orden (los DELETEs al final, de hijas a padres).
+
+Con `--workers N` las tablas se generan en N procesos, cada uno con su propia
+conexión de solo lectura (`file:...?mode=ro`) con mmap. Las tablas con `id`
+INTEGER PRIMARY KEY de más de `--split-rows` filas (QuizResults,
+CourseBlocks) se parten además en rangos de `id` que se generan en paralelo y
+se concatenan en orden: los archivos y el manifest son idénticos byte a byte
+a los de una corrida en serie. No combina con `--delta`/`--changes`, que
+necesitan una única transacción.
+
+`--stats`/`--profile` separan el tiempo de render (leer y codificar filas; con
+`--workers`, la espera por los bloques) del de write; ver `instrument.py`.
 """
 import argparse
 import os
+import shutil
 import sqlite3
+import tempfile
 import textwrap
 
+import instrument
+from d1_changes import HashManifest, delete_statement
+from d1_delta import delta_filter, load_state, save_state, upsert_clause
+from d1_order import build_waves, fk_levels
+from csv_parallel import imap_ordered
+from d1_parts import write_manifest
+from json_codec import JsonCodec
+from sql_render import JSON_POLICIES, compile_row_encoder, iter_rows
+from sqlite_snapshot import open_readonly
 
-def sql_escape(value):
-    if value is None:
-        return 'NULL'
-    if isinstance(value, (int, float)):
-        return str(value)
-    s = str(value)
-    s = s.replace('\x00', '')
-    s = s.replace('\r', '')
-    s = s.replace('\n', '\\n')
-    s = ' '.join(s.split())
-    s = s.replace("'", "''")
-    return "'{}'".format(s)
+# Filas por rango de id al repartir una tabla grande entre workers
+DEFAULT_SPLIT_ROWS = 50_000
+# PRAGMA mmap_size de las conexiones de los workers (bytes)
+MMAP_SIZE = 256 * 1024 * 1024
 
 
-def generate_inserts_for_table(conn, table):
-    cur = conn.cursor()
-    cur.execute(f"PRAGMA table_info('{table}')")
-    cols_info = cur.fetchall()
-    if not cols_info:
-        return []
-    cols = [c[1] for c in cols_info]
+def generate_inserts_for_table(conn, table, json_policy='collapse', where=None, params=(), upsert=False, manifest=None,
+                               deletes=True, codec=None):
+    """Produce los INSERTs de `table` uno a uno, leyendo la tabla por bloques.
+
+    `where`/`params` filtran las filas (modo delta); con `upsert` se emite
+    `INSERT ... ON CONFLICT(id) DO UPDATE` en lugar de `INSERT OR IGNORE`.
+    Con `manifest` (d1_changes.HashManifest) solo salen las filas cuyo hash
+    cambió, como UPSERT, seguidas de los DELETE de las filas que ya no existen
+    (salvo `deletes=False`, para emitirlos aparte con `manifest.deleted_ids`).
+    `codec` (json_codec.JsonCodec) se usa con `json_policy='minify'`.
+    """
+    cols, encode_row = compile_row_encoder(conn, table, json_policy, codec)
+    if not cols:
+        return
     col_list_sql = ', '.join([f'"{c}"' for c in cols])
+    if manifest is not None:
+        upsert = True
+        rows = manifest.changed_rows(conn, table, cols)
+    else:
+        cur = conn.cursor()
+        if where:
+            cur.execute(f"SELECT {', '.join(cols)} FROM '{table}' WHERE {where} ORDER BY id", params)
+        else:
+            # Same order as the id-range chunks of the parallel export
+            order = ' ORDER BY id' if 'id' in cols else ''
+            cur.execute(f"SELECT {', '.join(cols)} FROM '{table}'{order}")
+        rows = iter_rows(cur)
+    verb = 'INSERT' if upsert else 'INSERT OR IGNORE'
+    suffix = upsert_clause(cols) if upsert else ''
 
-    cur.execute(f"SELECT {', '.join(cols)} FROM '{table}'")
-    rows = cur.fetchall()
-    inserts = []
     for row in rows:
-        vals = [sql_escape(v) for v in row]
-        vals_sql = ', '.join(vals)
-        stmt = f'INSERT OR IGNORE INTO "{table}" ({col_list_sql}) VALUES ({vals_sql});'
-        inserts.append(stmt)
-    return inserts
+        yield f'{verb} INTO "{table}" ({col_list_sql}) VALUES {encode_row(row)}{suffix};'
+    if manifest is not None and deletes:
+        for ids in manifest.deleted_ids(table):
+            yield delete_statement(table, ids)
+
+
+def count_rows(conn, table, where=None, params=()):
+    try:
+        if where:
+            return conn.execute(f"SELECT COUNT(*) FROM '{table}' WHERE {where}", params).fetchone()[0]
+        return conn.execute(f"SELECT COUNT(*) FROM '{table}'").fetchone()[0]
+    except sqlite3.OperationalError:
+        return 0
+
+
+def id_ranges(conn, table, split_rows):
+    """Rangos [lo, hi) de `id` de unas `split_rows` filas cada uno; hi None = hasta el final.
+
+    Solo se parte si `id` es el INTEGER PRIMARY KEY (alias del rowid): así el
+    recorrido por rangos devuelve las filas en el mismo orden que el completo.
+    Si no, devuelve [(None, None)] (la tabla entera).
+    """
+    info = conn.execute(f"PRAGMA table_info('{table}')").fetchall()
+    pk = [c for c in info if c[5]]
+    if split_rows <= 0 or len(pk) != 1 or pk[0][1] != 'id' or pk[0][2].upper() != 'INTEGER':
+        return [(None, None)]
+    lo = conn.execute(f'SELECT MIN(id) FROM "{table}"').fetchone()[0]
+    if lo is None:
+        return [(None, None)]
+    ranges = []
+    while True:
+        row = conn.execute(f'SELECT id FROM "{table}" WHERE id >= ? ORDER BY id LIMIT 1 OFFSET ?',
+                           (lo, split_rows)).fetchone()
+        if row is None:
+            ranges.append((lo, None))
+            return ranges
+        ranges.append((lo, row[0]))
+        lo = row[0]
+
+
+def render_range(db_path, table, json_policy, lo, hi, out_path):
+    """Worker: escribe en `out_path` los INSERTs de `table` con id en [lo, hi).
+
+    Devuelve (cuántos, contadores del codec JSON o None).
+    """
+    conn = open_readonly(db_path)
+    conn.execute(f'PRAGMA mmap_size = {MMAP_SIZE}')
+    if lo is None:
+        where, params = None, ()
+    elif hi is None:
+        where, params = 'id >= ?', (lo,)
+    else:
+        where, params = 'id >= ? AND id < ?', (lo, hi)
+    codec = JsonCodec() if json_policy == 'minify' else None
+    count = 0
+    with open(out_path, 'w', encoding='utf-8') as f:
+        for stmt in generate_inserts_for_table(conn, table, json_policy=json_policy, where=where, params=params,
+                                               codec=codec):
+            f.write(stmt + '\n')
+            count += 1
+    conn.close()
+    return count, codec.stats() if codec else None
+
+
+def export_parallel(conn, db_path, tables, outdir, json_policy='collapse', workers=2, split_rows=DEFAULT_SPLIT_ROWS,
+                    codec=None):
+    """Genera `<table>_inserts.sql` de cada tabla en un pool de procesos; devuelve las entradas del manifest.
+
+    Los contadores JSON de cada worker se suman en `codec`.
+    """
+    tmpdir = tempfile.mkdtemp(prefix='.chunks_', dir=outdir)
+    tasks = []
+    n_chunks = {}
+    for t in tables:
+        ranges = id_ranges(conn, t, split_rows)
+        n_chunks[t] = len(ranges)
+        for i, (lo, hi) in enumerate(ranges):
+            tasks.append((db_path, t, json_policy, lo, hi, os.path.join(tmpdir, f'{t}_{i:05d}.sql')))
+    print(f'{len(tasks)} bloques en {workers} procesos')
+
+    stats = instrument.current()
+    parts = []
+    counts = {}
+    try:
+        for task, (count, json_stats) in stats.timed_iter('render', imap_ordered(render_range, tasks, workers)):
+            t, chunk_path = task[1], task[5]
+            if codec is not None and json_stats:
+                codec.merge(json_stats)
+            fname = os.path.join(outdir, f'{t}_inserts.sql')
+            with stats.phase('write'):
+                if t not in counts:
+                    counts[t] = 0
+                    with open(fname, 'w', encoding='utf-8') as f:
+                        f.write(f'-- {t}_inserts.sql — {count_rows(conn, t)} inserts\n')
+                # Chunks were written in text mode like the serial path; append their bytes untouched
+                with open(fname, 'ab') as out, open(chunk_path, 'rb') as chunk:
+                    shutil.copyfileobj(chunk, out)
+                os.remove(chunk_path)
+            stats.add(rows=count)
+            counts[t] += count
+            n_chunks[t] -= 1
+            if not n_chunks[t]:
+                print(f'  -> escrito {fname} ({counts[t]} inserts)')
+                parts.append(file_part(fname, t, counts[t], counts[t]))
+    finally:
+        shutil.rmtree(tmpdir, ignore_errors=True)
+    return parts
+
+
+def file_part(path, table, statements, rows, deleted=0):
+    """Entrada de manifest (como las de d1_parts.PartWriter) para un archivo por tabla."""
+    return {'file': os.path.basename(path), 'bytes': os.path.getsize(path), 'statements': statements,
+            'rows': rows, 'deleted': deleted, 'tables': {table: rows}}
 
 
 def main():
     parser = argparse.ArgumentParser()
     parser.add_argument('--db', required=True, help='Ruta al archivo sqlite (ej. sag_d1.sqlite)')
     parser.add_argument('--outdir', default='scripts/out_tables', help='Directorio de salida para archivos por tabla')
-    parser.add_argument('--tables', nargs='*', help='Lista de tablas en el orden deseado')
+    parser.add_argument('--tables', nargs='*', help='Lista de tablas (se ordenan por dependencias de FK)')
+    parser.add_argument('--json-policy', choices=JSON_POLICIES, default='collapse', help='Cómo escribir las columnas JSON (ver sql_render.py)')
+    parser.add_argument('--delta', metavar='STATE_FILE', help='Exportar solo filas nuevas/modificadas desde la última corrida como UPSERT (ver d1_delta.py)')
+    parser.add_argument('--changes', metavar='MANIFEST', help='Exportar solo filas cuyo hash de contenido cambió, más DELETEs (ver d1_changes.py)')
+    parser.add_argument('--workers', type=int, default=0, help='Generar en N procesos con conexiones de solo lectura (0 = serie)')
+    parser.add_argument('--split-rows', type=int, default=DEFAULT_SPLIT_ROWS, help='Filas por rango de id con --workers (0 = no partir tablas)')
+    instrument.add_arguments(parser)
     args = parser.parse_args()
+    stats = instrument.current()
 
+    if args.delta and args.changes:
+        parser.error('--delta y --changes son excluyentes')
+    if args.workers and (args.delta or args.changes):
+        parser.error('--workers no se combina con --delta/--changes')
     if not os.path.exists(args.db):
         raise SystemExit(f"No se encontró la BD en '{args.db}'. Genera primero 'sag_d1.sqlite'.")
 
@@ -68,19 +231,98 @@ def main():
     else:
         cur.execute("SELECT name FROM sqlite_master WHERE type='table' ORDER BY name;")
         tables = [r[0] for r in cur.fetchall()]
+    try:
+        levels = fk_levels(conn, tables)
+    except ValueError as e:
+        raise SystemExit(f'No se pueden ordenar las tablas por FK: {e}')
+    print('Orden por FK: ' + ' | '.join(', '.join(level) for level in levels))
 
-    for t in tables:
-        print(f'Generando INSERTs para tabla: {t}')
-        inserts = generate_inserts_for_table(conn, t)
-        fname = os.path.join(args.outdir, f'{t}_inserts.sql')
-        with open(fname, 'w', encoding='utf-8') as f:
-            f.write(f'-- {t}_inserts.sql — {len(inserts)} inserts\n')
-            for stmt in inserts:
-                f.write(stmt + '\n')
-        print(f'  -> escrito {fname} ({len(inserts)} inserts)')
+    state = load_state(args.delta)
+    manifest = HashManifest(args.changes) if args.changes else None
+    # One codec for every table, so repeated payloads hit the same cache
+    codec = JsonCodec() if args.json_policy == 'minify' else None
+    if args.delta or manifest:
+        # One read transaction so every table is filtered against the same snapshot
+        conn.execute('BEGIN')
+    insert_parts = []
+    with stats.profiled():
+        if args.workers:
+            insert_parts = export_parallel(conn, args.db, [t for level in levels for t in level], args.outdir,
+                                           args.json_policy, args.workers, args.split_rows, codec)
+        else:
+            for t in [t for level in levels for t in level]:
+                print(f'Generando INSERTs para tabla: {t}')
+                where, params = None, ()
+                if args.delta:
+                    delta = delta_filter(conn, t, state)
+                    if delta is None:
+                        print('  -> sin columna id, se omite en modo delta')
+                        continue
+                    where, params, state[t] = delta
+                elif manifest and 'id' not in [c[1] for c in conn.execute(f"PRAGMA table_info('{t}')")]:
+                    print('  -> sin columna id, se omite en modo --changes')
+                    continue
+                fname = os.path.join(args.outdir, f'{t}_inserts.sql')
+                count = 0
+                with open(fname, 'w', encoding='utf-8') as f:
+                    if manifest:
+                        f.write(f'-- {t}_inserts.sql — cambios respecto a {os.path.basename(args.changes)}\n')
+                    else:
+                        # The header count comes from COUNT(*) so rows can be streamed straight to disk
+                        f.write(f'-- {t}_inserts.sql — {count_rows(conn, t, where, params)} inserts\n')
+                    statements = generate_inserts_for_table(conn, t, json_policy=args.json_policy,
+                                                            where=where, params=params, upsert=bool(args.delta),
+                                                            manifest=manifest, deletes=False, codec=codec)
+                    for stmt in stats.timed_iter('render', statements):
+                        with stats.phase('write'):
+                            f.write(stmt + '\n')
+                        count += 1
+                    if manifest:
+                        f.write('-- ' + ', '.join(f'{k}={v}' for k, v in manifest.stats[t].items()) + '\n')
+                print(f'  -> escrito {fname} ({count} sentencias)' if manifest else f'  -> escrito {fname} ({count} inserts)')
+                insert_parts.append(file_part(fname, t, count, count))
+                stats.add(rows=count)
+
+    delete_parts = []
+    if manifest:
+        # Deletes run after every upsert, children before parents
+        for t in [t for level in reversed(levels) for t in level if t in manifest.stats]:
+            fname = os.path.join(args.outdir, f'{t}_deletes.sql')
+            statements = deleted = 0
+            with open(fname, 'w', encoding='utf-8') as f:
+                f.write(f'-- {t}_deletes.sql — filas borradas respecto a {os.path.basename(args.changes)}\n')
+                for ids in manifest.deleted_ids(t):
+                    f.write(delete_statement(t, ids) + '\n')
+                    statements += 1
+                    deleted += len(ids)
+            if not statements:
+                # Only tables that actually lost rows get a deletes file
+                os.remove(fname)
+                continue
+            print(f'  -> escrito {fname} ({deleted} filas borradas)')
+            delete_parts.append(file_part(fname, t, statements, 0, deleted))
 
+    if args.delta:
+        conn.commit()
+        save_state(args.delta, state)
+        print(f'  -> estado delta guardado en {args.delta}')
+    if manifest:
+        conn.commit()
+        manifest.commit()
+        manifest.close()
+        print(f'  -> manifest de hashes actualizado en {args.changes}')
+    waves = build_waves(levels, insert_parts)
+    waves += build_waves(levels, delete_parts, reverse=True, first_wave=len(waves) + 1)
+    manifest_path = os.path.join(args.outdir, 'manifest.json')
+    write_manifest(manifest_path, insert_parts + delete_parts, waves)
+    print(f'  -> manifest {manifest_path} ({len(waves)} olas)')
+    stats.add(bytes_written=sum(p['bytes'] for p in insert_parts + delete_parts))
+    if codec:
+        print('  -> ' + codec.summary())
+        stats.count('json_malformed', sum(codec.malformed.values()))
     conn.close()
 
 
 if __name__ == '__main__':
-    main()
+    with instrument.session('generate_d1_inserts_per_table'):
+        main()
@@ -6,22 +6,51 @@ Uso:
 
 El archivo resultante contiene sentencias SQL (CREATE/INSERT) que pueden ejecutarse
 en el editor SQL de Cloudflare D1 o mediante `wrangler d1 execute`.
+
+Con `--snapshot backup|vacuum` primero se toma una copia puntual de la BD (ver
+`sqlite_snapshot.py`) y el volcado se genera desde la copia, así una BD en uso
+no queda con una transacción de lectura abierta durante todo el volcado.
+
+`--stats`/`--profile`: ver `instrument.py` (fases snapshot, render y write).
 """
 import sqlite3
 import argparse
+import os
+
+import instrument
+from sqlite_snapshot import SNAPSHOT_METHODS, snapshot_copy
 
 def main():
     parser = argparse.ArgumentParser()
     parser.add_argument('--db', default='sag_d1.sqlite')
     parser.add_argument('--out', default='data_dump.sql')
+    parser.add_argument('--snapshot', choices=SNAPSHOT_METHODS, help='Volcar desde una copia puntual de la BD')
+    instrument.add_arguments(parser)
     args = parser.parse_args()
+    stats = instrument.current()
 
-    con = sqlite3.connect(args.db)
-    with open(args.out, 'w', encoding='utf8') as f:
-        for line in con.iterdump():
-            f.write(f"{line}\n")
-    con.close()
+    temp = None
+    if args.snapshot:
+        with stats.phase('snapshot'):
+            con, temp = snapshot_copy(args.db, args.snapshot)
+    else:
+        con = sqlite3.connect(args.db)
+    rows = 0
+    try:
+        with open(args.out, 'w', encoding='utf8') as f, stats.profiled():
+            for line in stats.timed_iter('render', con.iterdump()):
+                with stats.phase('write'):
+                    f.write(f"{line}\n")
+                rows += 1
+        bytes_read = os.path.getsize(temp or args.db)
+    finally:
+        # The snapshot is a full copy of the DB: never leave it behind
+        con.close()
+        if temp:
+            os.remove(temp)
+    stats.add(rows=rows, bytes_read=bytes_read, bytes_written=os.path.getsize(args.out))
     print('Generated', args.out)
 
 if __name__ == '__main__':
-    main()
+    with instrument.session('generate_dump'):
+        main()
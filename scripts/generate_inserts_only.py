@@ -8,24 +8,51 @@ Uso:
 
 Este archivo es adecuado para ejecutar en D1 después de haber aplicado el esquema
 (`d1_schema.sql`). Evita CREATE TABLE/PRAGMA/BEGIN/COMMIT que pueden causar errores.
+
+Los INSERT se generan directamente (los mismos que daría `iterdump()`), sin
+volcar y filtrar la BD completa. Con `--snapshot backup|vacuum` se generan
+desde una copia puntual de la BD (ver `sqlite_snapshot.py`).
+
+`--stats`/`--profile`: ver `instrument.py` (fases snapshot, render y write).
 """
 import argparse
+import os
 import sqlite3
 
+import instrument
+from sqlite_snapshot import SNAPSHOT_METHODS, iter_inserts, snapshot_copy
+
 def main():
     parser = argparse.ArgumentParser()
     parser.add_argument('--db', default='sag_d1.sqlite')
     parser.add_argument('--out', default='inserts_only.sql')
+    parser.add_argument('--snapshot', choices=SNAPSHOT_METHODS, help='Generar desde una copia puntual de la BD')
+    instrument.add_arguments(parser)
     args = parser.parse_args()
+    stats = instrument.current()
 
-    con = sqlite3.connect(args.db)
-    with open(args.out, 'w', encoding='utf8') as f:
-        for line in con.iterdump():
-            # Keep only INSERT statements
-            if line.strip().upper().startswith('INSERT INTO'):
-                f.write(line + '\n')
-    con.close()
+    temp = None
+    if args.snapshot:
+        with stats.phase('snapshot'):
+            con, temp = snapshot_copy(args.db, args.snapshot)
+    else:
+        con = sqlite3.connect(args.db)
+    rows = 0
+    try:
+        with open(args.out, 'w', encoding='utf8') as f, stats.profiled():
+            for line in stats.timed_iter('render', iter_inserts(con)):
+                with stats.phase('write'):
+                    f.write(line + '\n')
+                rows += 1
+        bytes_read = os.path.getsize(temp or args.db)
+    finally:
+        # The snapshot is a full copy of the DB: never leave it behind
+        con.close()
+        if temp:
+            os.remove(temp)
+    stats.add(rows=rows, bytes_read=bytes_read, bytes_written=os.path.getsize(args.out))
     print('Wrote inserts to', args.out)
 
 if __name__ == '__main__':
-    main()
+    with instrument.session('generate_inserts_only'):
+        main()
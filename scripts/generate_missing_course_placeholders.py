@@ -1,14 +1,138 @@
 #!/usr/bin/env python3
-"""
-Extrae courseId únicos de `QuizResults_inserts.sql` y genera
-`missing_courses.sql` con INSERT OR IGNORE para crear marcadores.
+r"""
+Detecta referencias huérfanas directamente en `sag_d1.sqlite` y genera SQL para
+resolverlas: marcadores (placeholders) para los padres que faltan o limpieza de
+las filas hijas huérfanas.
 
 Uso:
+  python scripts/generate_missing_course_placeholders.py --db sag_d1.sqlite --out scripts/missing_courses.sql
+  python scripts/generate_missing_course_placeholders.py --db sag_d1.sqlite --mode cleanup --out scripts/orphans_cleanup.sql
+
+Las relaciones se leen de `PRAGMA foreign_key_list` (CourseBlocks, Enrollments y
+QuizResults -> Courses) más las referencias por `clerkId` a Users, que el
+esquema no declara como FK. En modo cleanup las filas hijas huérfanas se
+borran, salvo `Courses.creatorClerkId`, que es opcional y se pone en NULL (así
+no se pierden el curso ni sus bloques, inscripciones y resultados). Los padres faltantes se calculan con anti-joins
+(`NOT EXISTS`) que usan el índice de la clave del padre, sin reparsear SQL.
+
+Modo heredado (escaneo con regex de un QuizResults_inserts.sql ya generado):
   python scripts/generate_missing_course_placeholders.py --quiz-sql .\scripts\out_tables\QuizResults_inserts.sql --out scripts/missing_courses.sql
 """
 import argparse
 import re
 import os
+import sqlite3
+
+# Claves por sentencia INSERT/DELETE generada
+DEFAULT_BATCH_SIZE = 500
+
+# Referencias por clerkId: no son FK en d1_schema.sql pero el Worker las usa así
+IMPLICIT_REFERENCES = [
+    ('Enrollments', 'clerkId', 'Users', 'clerkId'),
+    ('QuizResults', 'clerkId', 'Users', 'clerkId'),
+    ('Courses', 'creatorClerkId', 'Users', 'clerkId'),
+]
+
+# Referencias opcionales: en modo cleanup se ponen en NULL en vez de borrar la fila
+# (un curso con creador desconocido sigue siendo válido y borrarlo arrastraría sus hijas)
+NULLABLE_REFERENCES = {('Courses', 'creatorClerkId')}
+
+
+def sql_literal(value):
+    if isinstance(value, (int, float)):
+        return str(value)
+    return "'{}'".format(str(value).replace("'", "''"))
+
+
+def course_placeholder(cid):
+    title = f"Imported placeholder course {cid}"
+    return ('(id, title, description, createdAt, updatedAt)',
+            f"({sql_literal(cid)}, {sql_literal(title)}, '', datetime('now'), datetime('now'))")
+
+
+def user_placeholder(clerk_id):
+    email = f"{clerk_id}@placeholder.invalid"
+    return ('(clerkId, email, role, createdAt, updatedAt)',
+            f"({sql_literal(clerk_id)}, {sql_literal(email)}, 'student', datetime('now'), datetime('now'))")
+
+
+# Cómo crear un marcador por (tabla padre, columna referenciada)
+PLACEHOLDERS = {
+    ('Courses', 'id'): course_placeholder,
+    ('Users', 'clerkId'): user_placeholder,
+}
+
+
+def table_names(conn):
+    return [r[0] for r in conn.execute(
+        "SELECT name FROM sqlite_master WHERE type='table' AND name NOT LIKE 'sqlite_%' ORDER BY name")]
+
+
+def primary_key(conn, table):
+    pk = [r[1] for r in conn.execute(f"PRAGMA table_info('{table}')") if r[5]]
+    return pk[0] if len(pk) == 1 else None
+
+
+def relationships(conn):
+    """(hija, columna, padre, columna del padre) de cada FK declarada más las implícitas."""
+    tables = set(table_names(conn))
+    rels = []
+    for table in sorted(tables):
+        for fk in conn.execute(f"PRAGMA foreign_key_list('{table}')").fetchall():
+            parent, child_col, parent_col = fk[2], fk[3], fk[4]
+            rels.append((table, child_col, parent, parent_col or primary_key(conn, parent)))
+    for rel in IMPLICIT_REFERENCES:
+        if rel[0] in tables and rel[2] in tables and rel not in rels:
+            rels.append(rel)
+    return rels
+
+
+def _anti_join(child, child_col, parent, parent_col):
+    return (f'SELECT DISTINCT c."{child_col}" FROM "{child}" c '
+            f'WHERE c."{child_col}" IS NOT NULL AND NOT EXISTS '
+            f'(SELECT 1 FROM "{parent}" p WHERE p."{parent_col}" = c."{child_col}")')
+
+
+def missing_keys(conn, children, parent, parent_col):
+    """Claves referenciadas desde `children` [(tabla, columna)] que no existen en `parent`, sin repetir y en orden."""
+    sql = ' UNION '.join(_anti_join(child, col, parent, parent_col) for child, col in children)
+    cur = conn.execute(sql + ' ORDER BY 1')
+    while True:
+        rows = cur.fetchmany(DEFAULT_BATCH_SIZE)
+        if not rows:
+            return
+        for r in rows:
+            yield r[0]
+
+
+def batched(iterable, size):
+    batch = []
+    for item in iterable:
+        batch.append(item)
+        if len(batch) >= size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+def placeholder_statements(parent, parent_col, keys, batch_size=DEFAULT_BATCH_SIZE):
+    make = PLACEHOLDERS.get((parent, parent_col))
+    if make is None:
+        return
+    for batch in batched(keys, batch_size):
+        rows = [make(k) for k in batch]
+        cols = rows[0][0]
+        yield f"INSERT OR IGNORE INTO {parent} {cols} VALUES {', '.join(v for _, v in rows)};", len(batch)
+
+
+def cleanup_statements(child, child_col, keys, batch_size=DEFAULT_BATCH_SIZE):
+    for batch in batched(keys, batch_size):
+        where = f'WHERE "{child_col}" IN ({", ".join(sql_literal(k) for k in batch)})'
+        if (child, child_col) in NULLABLE_REFERENCES:
+            yield f'UPDATE "{child}" SET "{child_col}" = NULL {where};', len(batch)
+        else:
+            yield f'DELETE FROM "{child}" {where};', len(batch)
 
 
 def extract_course_ids(quiz_sql_path):
@@ -19,12 +143,7 @@ def extract_course_ids(quiz_sql_path):
     return sorted({int(i) for i in ids})
 
 
-def main():
-    parser = argparse.ArgumentParser()
-    parser.add_argument('--quiz-sql', required=True, help='Ruta al SQL de QuizResults (generado)')
-    parser.add_argument('--out', default='scripts/missing_courses.sql', help='Archivo SQL de salida')
-    args = parser.parse_args()
-
+def legacy_main(args):
     if not os.path.exists(args.quiz_sql):
         raise SystemExit(f"No se encontró {args.quiz_sql}")
 
@@ -35,11 +154,9 @@ def main():
 
     lines = ["-- missing_courses.sql - placeholders for missing course IDs\n"]
     for cid in ids:
-        title = f"Imported placeholder course {cid}"
         # Insert with explicit id; use INSERT OR IGNORE to avoid duplicates
-        lines.append(
-            f"INSERT OR IGNORE INTO Courses (id, title, description, createdAt, updatedAt) VALUES ({cid}, '{title.replace("'","''")}', '', datetime('now'), datetime('now'));"
-        )
+        cols, values = course_placeholder(cid)
+        lines.append(f"INSERT OR IGNORE INTO Courses {cols} VALUES {values};")
 
     with open(args.out, 'w', encoding='utf-8') as f:
         f.write('\n'.join(lines) + '\n')
@@ -47,5 +164,62 @@ def main():
     print(f'Escrito {args.out} con {len(ids)} posibles courseId')
 
 
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--db', help='BD SQLite a revisar (ej. sag_d1.sqlite)')
+    parser.add_argument('--mode', choices=['placeholders', 'cleanup'], default='placeholders',
+                        help='placeholders: crear padres faltantes; cleanup: borrar filas hijas huérfanas '
+                             '(Courses.creatorClerkId se pone en NULL)')
+    parser.add_argument('--batch-size', type=int, default=DEFAULT_BATCH_SIZE, help='Claves por sentencia generada')
+    parser.add_argument('--quiz-sql', help='(heredado) Ruta al SQL de QuizResults generado')
+    parser.add_argument('--out', default='scripts/missing_courses.sql', help='Archivo SQL de salida')
+    args = parser.parse_args()
+
+    if not args.db:
+        if not args.quiz_sql:
+            parser.error('indica --db (o --quiz-sql para el modo heredado)')
+        legacy_main(args)
+        return
+    if not os.path.exists(args.db):
+        raise SystemExit(f"No se encontró la BD en '{args.db}'.")
+
+    conn = sqlite3.connect(args.db)
+    rels = relationships(conn)
+    if args.mode == 'placeholders':
+        # One pass per parent key: several children may reference the same missing parent
+        groups = {}
+        for child, child_col, parent, parent_col in rels:
+            groups.setdefault((parent, parent_col), []).append((child, child_col))
+        jobs = [(', '.join(f'{c}.{col}' for c, col in children) + f' -> {parent}.{parent_col}', children, parent, parent_col)
+                for (parent, parent_col), children in groups.items()]
+    else:
+        jobs = [(f'{child}.{child_col} -> {parent}.{parent_col}', [(child, child_col)], parent, parent_col)
+                for child, child_col, parent, parent_col in rels]
+
+    total = 0
+    with open(args.out, 'w', encoding='utf-8') as f:
+        f.write(f'-- {os.path.basename(args.out)} - {args.mode} for orphan references in {os.path.basename(args.db)}\n')
+        for label, children, parent, parent_col in jobs:
+            keys = missing_keys(conn, children, parent, parent_col)
+            if args.mode == 'placeholders':
+                if (parent, parent_col) not in PLACEHOLDERS:
+                    print(f'{label}: sin receta de marcador, se omite')
+                    continue
+                stmts = placeholder_statements(parent, parent_col, keys, args.batch_size)
+            else:
+                child, child_col = children[0]
+                stmts = cleanup_statements(child, child_col, keys, args.batch_size)
+            count = 0
+            for stmt, n in stmts:
+                if not count:
+                    f.write(f'-- {label}\n')
+                f.write(stmt + '\n')
+                count += n
+            print(f'{label}: {count} clave(s) faltante(s)')
+            total += count
+    conn.close()
+    print(f'Escrito {args.out} ({total} clave(s) en total)')
+
+
 if __name__ == '__main__':
     main()
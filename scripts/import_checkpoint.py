@@ -0,0 +1,87 @@
+#!/usr/bin/env python3
+"""
+Puntos de control (checkpoints) para importaciones CSV reanudables.
+
+Lo usan `create_sqlite_and_import.py` e `import_headerless_csvs.py` con
+`--checkpoint`/`--resume`: cada bloque de filas se inserta en una transacción
+que también actualiza la fila del archivo en `import_checkpoints` (offset en
+bytes del próximo registro, número de línea, filas importadas y una huella del
+archivo). Si el proceso muere, la BD queda con los bloques confirmados y su
+checkpoint coherente; `--resume` salta directo a ese offset.
+
+La huella es el tamaño más un hash del primer y el último MB: si el archivo
+cambió, no se reanuda sobre él. La tabla se borra al terminar bien todos los
+archivos (para que no llegue a los exportadores de D1), salvo
+`--keep-checkpoints`.
+"""
+import hashlib
+import os
+from datetime import datetime, timezone
+
+CHECKPOINT_TABLE = 'import_checkpoints'
+FINGERPRINT_BYTES = 1024 * 1024
+
+
+def file_fingerprint(path):
+    size = os.path.getsize(path)
+    h = hashlib.blake2b(digest_size=16)
+    with open(path, 'rb') as f:
+        h.update(f.read(FINGERPRINT_BYTES))
+        if size > FINGERPRINT_BYTES:
+            f.seek(max(FINGERPRINT_BYTES, size - FINGERPRINT_BYTES))
+            h.update(f.read(FINGERPRINT_BYTES))
+    return f'{size}:{h.hexdigest()}'
+
+
+def has_checkpoints(conn):
+    return conn.execute("SELECT 1 FROM sqlite_master WHERE type='table' AND name=?",
+                        (CHECKPOINT_TABLE,)).fetchone() is not None
+
+
+def ensure_checkpoint_table(conn):
+    conn.execute(f'CREATE TABLE IF NOT EXISTS {CHECKPOINT_TABLE} ('
+                 ' file TEXT PRIMARY KEY, tbl TEXT NOT NULL, fingerprint TEXT NOT NULL,'
+                 ' byte_offset INTEGER NOT NULL, line_no INTEGER NOT NULL, rows INTEGER NOT NULL,'
+                 ' done INTEGER NOT NULL DEFAULT 0, updatedAt TEXT)')
+    conn.commit()
+
+
+def checkpoint_key(path):
+    # The file name is the key: the table comes from it, and the CSV folder may move between runs
+    return os.path.basename(path)
+
+
+def read_checkpoint(conn, path):
+    """Último checkpoint confirmado de `path` como dict, o None."""
+    row = conn.execute(f'SELECT tbl, fingerprint, byte_offset, line_no, rows, done FROM {CHECKPOINT_TABLE} '
+                       'WHERE file = ?', (checkpoint_key(path),)).fetchone()
+    if row is None:
+        return None
+    return dict(zip(('table', 'fingerprint', 'offset', 'line', 'rows', 'done'), row))
+
+
+def write_checkpoint(conn, path, table, fingerprint, offset, line, rows, done=False):
+    """Registra el avance de `path`; no confirma: va en la misma transacción que las filas."""
+    conn.execute(f'INSERT OR REPLACE INTO {CHECKPOINT_TABLE} '
+                 '(file, tbl, fingerprint, byte_offset, line_no, rows, done, updatedAt) VALUES (?, ?, ?, ?, ?, ?, ?, ?)',
+                 (checkpoint_key(path), table, fingerprint, offset, line, rows, int(done),
+                  datetime.now(timezone.utc).isoformat(timespec='seconds')))
+
+
+def resume_point(conn, path, resume):
+    """(checkpoint o None, huella) para `path`; sale con error si no se puede reanudar sin duplicar."""
+    fingerprint = file_fingerprint(path)
+    cp = read_checkpoint(conn, path)
+    if cp is None:
+        return None, fingerprint
+    if not resume:
+        raise SystemExit(f'{path} already has a checkpoint in {CHECKPOINT_TABLE}; use --resume to continue it')
+    if cp['fingerprint'] != fingerprint:
+        raise SystemExit(f'{path} changed since its checkpoint ({cp["rows"]} rows imported); '
+                         f'restore the original file or start over with a new database')
+    return cp, fingerprint
+
+
+def drop_checkpoints(conn):
+    conn.execute(f'DROP TABLE IF EXISTS {CHECKPOINT_TABLE}')
+    conn.commit()
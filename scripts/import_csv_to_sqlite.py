@@ -4,15 +4,19 @@ Simple importer: toma archivos CSV con encabezado y los inserta en la tabla SQLi
 Uso: python scripts/import_csv_to_sqlite.py --db sag_d1.sqlite --table Users --csv path/to/Users.csv
 
 Requiere: Python 3 (viene en Windows 10+ opcionalmente), no requiere dependencias externas.
+`--stats`/`--profile`: ver `instrument.py` (fases read e insert).
 """
 import csv
 import sqlite3
 import argparse
 import os
 
+import instrument
+
 def import_csv(db_path, table, csv_path):
     if not os.path.exists(csv_path):
         raise SystemExit(f"CSV file not found: {csv_path}")
+    stats = instrument.current()
     conn = sqlite3.connect(db_path)
     cur = conn.cursor()
 
@@ -23,13 +27,16 @@ def import_csv(db_path, table, csv_path):
         col_list = ','.join(cols)
         sql = f'INSERT INTO {table} ({col_list}) VALUES ({placeholders})'
         rows = []
-        for r in reader:
-            # normalize keys: keep CSV header names as-is (assumes they match table columns)
-            vals = [r.get(c) for c in cols]
-            rows.append(vals)
+        with stats.phase('read'):
+            for r in reader:
+                # normalize keys: keep CSV header names as-is (assumes they match table columns)
+                vals = [r.get(c) for c in cols]
+                rows.append(vals)
         if rows:
-            cur.executemany(sql, rows)
-            conn.commit()
+            with stats.phase('insert'):
+                cur.executemany(sql, rows)
+                conn.commit()
+            stats.add(rows=len(rows), bytes_read=os.path.getsize(csv_path))
             print(f"Inserted {len(rows)} rows into {table} from {csv_path}")
         else:
             print(f"No rows found in {csv_path}")
@@ -41,8 +48,11 @@ def main():
     parser.add_argument('--db', required=True, help='sqlite db path (e.g. sag_d1.sqlite)')
     parser.add_argument('--table', required=True, help='table name in sqlite')
     parser.add_argument('--csv', required=True, help='path to csv file')
+    instrument.add_arguments(parser)
     args = parser.parse_args()
-    import_csv(args.db, args.table, args.csv)
+    with instrument.current().profiled():
+        import_csv(args.db, args.table, args.csv)
 
 if __name__ == '__main__':
-    main()
+    with instrument.session('import_csv_to_sqlite'):
+        main()
@@ -7,13 +7,40 @@ Uso:
     python scripts/import_headerless_csvs.py --db sag_d1.sqlite --csv-dir "C:/Users/jctib/Downloads/db"
 
 Este script no sobrescribe tablas existentes; inserta filas nuevas.
+Las filas se insertan por lotes (`--batch-size`); si un lote falla se divide
+a la mitad hasta aislar las filas inválidas, que se escriben en `--rejects`
+con el error, el número de línea del CSV y la fila como arreglo JSON (una
+sola columna `row`, tenga la tabla las columnas que tenga). El archivo se crea
+recién con el primer rechazo.
+Con `--workers N` el parseo se reparte entre N procesos (por archivo y por
+rangos de bytes) y esta conexión queda como único escritor.
+Con `--checkpoint` cada lote confirma también hasta qué byte del archivo se
+importó (ver `import_checkpoint.py`); `--resume` retoma una carga cortada
+desde ahí y agrega los rechazos al archivo existente.
+Los valores se convierten al tipo de cada columna antes del INSERT
+(`value_types.py`; `--no-convert` para desactivarlo, `--timestamps iso` para
+normalizar fechas) y se informa cuántos no se pudieron convertir.
+Con `--json-policy minify` las columnas JSON se guardan parseadas y
+minificadas (ver `json_codec.py`).
+`--stats`/`--profile` miden las fases read, convert e insert (ver
+`instrument.py`).
 """
 import argparse
 import csv
+import json
 import os
 import sqlite3
+from functools import partial
 from glob import glob
 
+import instrument
+
+from csv_parallel import imap_ordered, iter_record_chunks, parse_range, plan_ranges
+from import_checkpoint import (CHECKPOINT_TABLE, drop_checkpoints, ensure_checkpoint_table, has_checkpoints,
+                               resume_point, write_checkpoint)
+from json_codec import JsonCodec
+from value_types import TIMESTAMP_POLICIES, failures_summary, row_stages
+
 # Mapas de columnas por tabla (orden esperado en los CSV exportados)
 TABLE_COLUMN_ORDERS = {
     'Users': ['id','clerkId','email','firstName','lastName','role','createdAt','updatedAt'],
@@ -23,6 +50,10 @@ TABLE_COLUMN_ORDERS = {
     'QuizResults': ['id','courseId','clerkId','quizBlockId','score','answers','assignedBy','completedAt','attempts','maxAttempts']
 }
 
+# Filas por executemany; un lote que falla se divide hasta aislar las filas malas
+DEFAULT_BATCH_SIZE = 5000
+REJECTS_HEADER = ['file', 'line', 'table', 'error', 'row']
+
 def find_files(csv_dir):
     patterns = ['*.csv','*.csx']
     files = []
@@ -35,77 +66,311 @@ def table_name_from_file(path):
     name, _ = os.path.splitext(base)
     return name
 
-def import_file(conn, path, table):
+def normalize_row(table, cols, row):
+    """Ajusta una fila del CSV al número de columnas y aplica los defaults por tabla."""
+    # Trim or extend row to match cols length
+    if len(row) < len(cols):
+        row = row + [None] * (len(cols)-len(row))
+    elif len(row) > len(cols):
+        row = row[:len(cols)]
+    # Convert empty strings to None
+    row = [None if (isinstance(cell, str) and cell.strip()=='') else cell for cell in row]
+
+    # Table-specific defaults / fixes
+    if table == 'QuizResults':
+        # Ensure attempts and maxAttempts have defaults if missing
+        # QuizResults cols: ['id','courseId','clerkId','quizBlockId','score','answers','assignedBy','completedAt','attempts','maxAttempts']
+        # attempts index 8, maxAttempts index 9
+        if row[8] is None:
+            row[8] = 0
+        if row[9] is None:
+            row[9] = 1
+    return row
+
+
+def parse_row(table, cols, line_no, row):
+    """Devuelve (line_no, fila normalizada), o None para líneas vacías."""
+    # skip empty lines
+    if not row or all(not cell.strip() for cell in row):
+        return None
+    return line_no, normalize_row(table, cols, row)
+
+
+def iter_batches(path, table, cols, batch_size):
+    """Lee el CSV y produce listas de (line_no, row) de a lo sumo `batch_size` filas."""
+    with open(path, newline='', encoding='utf8') as f:
+        reader = csv.reader(f)
+        batch = []
+        for row in reader:
+            item = parse_row(table, cols, reader.line_num, row)
+            if item is None:
+                continue
+            batch.append(item)
+            if len(batch) >= batch_size:
+                yield batch
+                batch = []
+        if batch:
+            yield batch
+
+
+def insert_batch(conn, sql, batch, rejects):
+    """Inserta un lote con executemany; si falla, lo divide a la mitad hasta aislar las filas malas.
+
+    Cada intento va dentro de un SAVEPOINT para deshacer las filas parciales del
+    executemany fallido. Las filas rechazadas se agregan a `rejects` como
+    (line_no, row, error). Devuelve cuántas filas quedaron insertadas.
+    """
+    conn.execute('SAVEPOINT batch')
+    try:
+        conn.executemany(sql, [row for _, row in batch])
+    except sqlite3.Error as e:
+        conn.execute('ROLLBACK TO batch')
+        conn.execute('RELEASE batch')
+        if len(batch) == 1:
+            line_no, row = batch[0]
+            rejects.append((line_no, row, str(e)))
+            return 0
+        mid = len(batch) // 2
+        return insert_batch(conn, sql, batch[:mid], rejects) + insert_batch(conn, sql, batch[mid:], rejects)
+    conn.execute('RELEASE batch')
+    return len(batch)
+
+
+class RejectWriter:
+    """CSV de filas rechazadas que se abre recién con el primer rechazo."""
+
+    def __init__(self, path, append=False):
+        self.path = path
+        self.append = append
+        self.count = 0
+        self._f = None
+        self._writer = None
+
+    def write(self, path, line_no, table, error, row):
+        if self._writer is None:
+            self._f = open(self.path, 'a' if self.append else 'w', newline='', encoding='utf8')
+            self._writer = csv.writer(self._f)
+            if not self.append:
+                self._writer.writerow(REJECTS_HEADER)
+        self._writer.writerow([path, line_no, table, error, json.dumps(row, ensure_ascii=False)])
+        self.count += 1
+
+    def close(self):
+        if self._f is not None:
+            self._f.close()
+            self._f = None
+
+
+def build_insert_sql(table, cols):
+    placeholders = ','.join('?' for _ in cols)
+    col_list = ','.join(f'[{c}]' for c in cols)
+    return f'INSERT INTO [{table}] ({col_list}) VALUES ({placeholders})'
+
+
+def write_batch(conn, sql, batch, table, path, reject_writer=None, checkpoint=None, prepare=None):
+    """Inserta y confirma un lote; devuelve (insertadas, rechazadas).
+
+    `checkpoint(insertadas)` se llama antes de confirmar, dentro de la misma
+    transacción; `prepare` (value_types.row_stages) se aplica a las filas antes de insertar.
+    """
+    stats = instrument.current()
+    if prepare:
+        with stats.phase('convert'):
+            prepare([row for _, row in batch])
+    rejects = []
+    with stats.phase('insert'):
+        # An outer transaction, so releasing the savepoints does not commit on its own
+        if not conn.in_transaction:
+            conn.execute('BEGIN')
+        count = insert_batch(conn, sql, batch, rejects)
+        if checkpoint is not None:
+            checkpoint(count)
+        conn.commit()
+    stats.add(rows=count)
+    if rejects:
+        stats.count('rejected', len(rejects))
+    for line_no, row, error in rejects:
+        if reject_writer is None:
+            print(f'Error inserting row into {table} from {path} (line {line_no}):', error)
+        else:
+            reject_writer.write(path, line_no, table, error, row)
+    return count, len(rejects)
+
+
+def report(table, path, count, rejected):
+    print(f'Inserted {count} rows into {table} from {path}' + (f' ({rejected} rejected)' if rejected else ''))
+
+
+def import_file(conn, path, table, batch_size=DEFAULT_BATCH_SIZE, reject_writer=None, stages=None):
     if table not in TABLE_COLUMN_ORDERS:
         print(f'Skipping {path}: no column mapping for table {table}')
         return 0
     cols = TABLE_COLUMN_ORDERS[table]
-    placeholders = ','.join('?' for _ in cols)
-    col_list = ','.join(f'[{c}]' for c in cols)
-    sql = f'INSERT INTO [{table}] ({col_list}) VALUES ({placeholders})'
+    sql = build_insert_sql(table, cols)
+    prepare = stages(conn, table, cols) if stages else None
     count = 0
-    with open(path, newline='', encoding='utf8') as f:
-        reader = csv.reader(f)
-        for row in reader:
-            # skip empty lines
-            if not row or all(not cell.strip() for cell in row):
-                continue
-            # Trim or extend row to match cols length
-            if len(row) < len(cols):
-                row = row + [None] * (len(cols)-len(row))
-            elif len(row) > len(cols):
-                row = row[:len(cols)]
-            # Convert empty strings to None
-            row = [None if (isinstance(cell, str) and cell.strip()=='') else cell for cell in row]
-
-            # Table-specific defaults / fixes
-            if table == 'QuizResults':
-                # Ensure attempts and maxAttempts have defaults if missing
-                # QuizResults cols: ['id','courseId','clerkId','quizBlockId','score','answers','assignedBy','completedAt','attempts','maxAttempts']
-                try:
-                    # attempts index 8, maxAttempts index 9
-                    if row[8] is None or row[8] == '':
-                        row[8] = 0
-                    if row[9] is None or row[9] == '':
-                        row[9] = 1
-                except IndexError:
-                    # pad if needed
-                    while len(row) < 10:
-                        row.append(None)
-                    row[8] = row[8] or 0
-                    row[9] = row[9] or 1
-
-            try:
-                conn.execute(sql, row)
-                count += 1
-            except Exception as e:
-                print(f'Error inserting row into {table} from {path}:', e)
-                # continue with next row
-                continue
+    rejected = 0
+    stats = instrument.current()
+    for batch in stats.timed_iter('read', iter_batches(path, table, cols, batch_size)):
+        inserted, bad = write_batch(conn, sql, batch, table, path, reject_writer, prepare=prepare)
+        count += inserted
+        rejected += bad
+    stats.add(bytes_read=os.path.getsize(path))
+    report(table, path, count, rejected)
+    return count
+
+
+def import_file_checkpointed(conn, path, table, batch_size=DEFAULT_BATCH_SIZE, reject_writer=None, resume=False,
+                             stages=None):
+    """Como `import_file`, pero cada lote confirma también su checkpoint y se puede reanudar."""
+    if table not in TABLE_COLUMN_ORDERS:
+        print(f'Skipping {path}: no column mapping for table {table}')
+        return 0
+    cp, fingerprint = resume_point(conn, path, resume)
+    if cp and cp['done']:
+        print(f"Already imported {cp['rows']} rows into {table} from {path}, skipping")
+        return 0
+    offset, line, done_rows = (cp['offset'], cp['line'], cp['rows']) if cp else (0, 0, 0)
+    if cp:
+        print(f'Resuming {path} at line {line + 1} ({done_rows} rows already imported)')
+    cols = TABLE_COLUMN_ORDERS[table]
+    sql = build_insert_sql(table, cols)
+    row_fn = partial(parse_row, table, cols)
+    prepare = stages(conn, table, cols) if stages else None
+    stats = instrument.current()
+    first_offset = offset
+    count = 0
+    rejected = 0
+    for batch, offset, line in stats.timed_iter('read', iter_record_chunks(path, offset, line, batch_size, row_fn)):
+        def checkpoint(inserted, offset=offset, line=line):
+            write_checkpoint(conn, path, table, fingerprint, offset, line, done_rows + count + inserted)
+        inserted, bad = write_batch(conn, sql, batch, table, path, reject_writer, checkpoint, prepare)
+        count += inserted
+        rejected += bad
+    write_checkpoint(conn, path, table, fingerprint, offset, line, done_rows + count, done=True)
     conn.commit()
-    print(f'Inserted {count} rows into {table} from {path}')
+    stats.add(bytes_read=offset - first_offset)
+    report(table, path, count, rejected)
     return count
 
+
+def import_parallel(conn, files, batch_size=DEFAULT_BATCH_SIZE, reject_writer=None, workers=2, stages=None):
+    """Parsea los archivos (por rangos de bytes) en un pool de procesos; esta conexión es el único escritor."""
+    tasks = []
+    # table -> (INSERT, row stages), built once instead of per parsed range
+    writers = {}
+    for fp in files:
+        table = table_name_from_file(fp)
+        if table not in TABLE_COLUMN_ORDERS:
+            print(f'Skipping {fp}: no column mapping for table {table}')
+            continue
+        cols = TABLE_COLUMN_ORDERS[table]
+        if table not in writers:
+            writers[table] = (build_insert_sql(table, cols), stages(conn, table, cols) if stages else None)
+        row_fn = partial(parse_row, table, cols)
+        for start, end, first_line in plan_ranges(fp):
+            tasks.append((fp, start, end, first_line, row_fn))
+
+    stats = instrument.current()
+    counts = {}
+    # 'read' here is the time spent waiting for the workers' parsed ranges
+    for task, rows in stats.timed_iter('read', imap_ordered(parse_range, tasks, workers)):
+        fp = task[0]
+        stats.add(bytes_read=task[2] - task[1])
+        table = table_name_from_file(fp)
+        sql, prepare = writers[table]
+        count, rejected = counts.get(fp, (0, 0))
+        for i in range(0, len(rows), batch_size):
+            inserted, bad = write_batch(conn, sql, rows[i:i + batch_size], table, fp, reject_writer, prepare=prepare)
+            count += inserted
+            rejected += bad
+        counts[fp] = (count, rejected)
+    for fp, (count, rejected) in counts.items():
+        report(table_name_from_file(fp), fp, count, rejected)
+    return sum(c for c, _ in counts.values())
+
 def main():
     parser = argparse.ArgumentParser()
     parser.add_argument('--db', required=True)
     parser.add_argument('--csv-dir', required=True)
+    parser.add_argument('--batch-size', type=int, default=DEFAULT_BATCH_SIZE, help='Rows per executemany batch')
+    parser.add_argument('--rejects', help='CSV file for rejected rows (default: <db>_rejects.csv)')
+    parser.add_argument('--workers', type=int, default=0, help='Parse CSVs in N processes with a single writer (0 = serial)')
+    parser.add_argument('--checkpoint', action='store_true', help='Record per-file progress with each batch so the import can be resumed')
+    parser.add_argument('--resume', action='store_true', help='Continue an interrupted --checkpoint import (implies --checkpoint)')
+    parser.add_argument('--keep-checkpoints', action='store_true', help='Keep the checkpoint table after a complete import')
+    parser.add_argument('--json-policy', choices=['raw', 'minify'], default='raw', help='Store JSON columns as read or parsed and minified (see json_codec.py)')
+    parser.add_argument('--no-convert', action='store_true', help='Insert CSV values as text and let SQLite affinity convert them')
+    parser.add_argument('--timestamps', choices=TIMESTAMP_POLICIES, default='keep', help="'iso' rewrites *At columns as UTC ISO-8601 like the Worker writes them")
+    instrument.add_arguments(parser)
     args = parser.parse_args()
+    stats = instrument.current()
+    codec = JsonCodec() if args.json_policy == 'minify' else None
+    failures = {}
+    stages = partial(row_stages, codec=codec, convert=not args.no_convert, timestamps=args.timestamps,
+                     failures=failures)
+    checkpoint = args.checkpoint or args.resume
+    if checkpoint and args.workers > 0:
+        parser.error('--checkpoint/--resume import files serially; drop --workers')
 
     files = find_files(args.csv_dir)
     if not files:
         print('No CSV files found in', args.csv_dir)
         return
 
+    rejects_path = args.rejects or os.path.splitext(args.db)[0] + '_rejects.csv'
     conn = sqlite3.connect(args.db)
+    if args.resume and not (has_checkpoints(conn)
+                            and conn.execute(f'SELECT 1 FROM {CHECKPOINT_TABLE} LIMIT 1').fetchone()):
+        # A completed import drops its checkpoints: starting over would insert every row again
+        print(f'Nothing to resume: {args.db} has no checkpointed import in progress '
+              '(use --checkpoint to start a new one)')
+        conn.close()
+        return
+    if checkpoint:
+        ensure_checkpoint_table(conn)
     total = 0
-    for fp in files:
-        table = table_name_from_file(fp)
-        print('Processing', fp, '->', table)
-        total += import_file(conn, fp, table)
+    # A resumed run keeps the rejects of the batches that were already committed
+    append = args.resume and os.path.exists(rejects_path) and os.path.getsize(rejects_path) > 0
+    if not append and os.path.exists(rejects_path):
+        # A fresh run replaces the rejects of an earlier one, even if it has none
+        os.remove(rejects_path)
+    reject_writer = RejectWriter(rejects_path, append)
+    try:
+        with stats.profiled():
+            if args.workers > 0:
+                total = import_parallel(conn, files, batch_size=args.batch_size, reject_writer=reject_writer,
+                                        workers=args.workers, stages=stages)
+            else:
+                for fp in files:
+                    table = table_name_from_file(fp)
+                    print('Processing', fp, '->', table)
+                    if checkpoint:
+                        total += import_file_checkpointed(conn, fp, table, batch_size=args.batch_size,
+                                                          reject_writer=reject_writer, resume=args.resume,
+                                                          stages=stages)
+                    else:
+                        total += import_file(conn, fp, table, batch_size=args.batch_size,
+                                             reject_writer=reject_writer, stages=stages)
+    finally:
+        reject_writer.close()
 
+    if checkpoint and not args.keep_checkpoints:
+        # Every file finished: the bookkeeping table must not reach the D1 exports
+        drop_checkpoints(conn)
     conn.close()
     print('Total rows imported:', total)
+    if not args.no_convert:
+        print(failures_summary(failures))
+        stats.count('conversion_failures', sum(failures.values()))
+    if codec:
+        print(codec.summary())
+        stats.count('json_malformed', sum(codec.malformed.values()))
+    if reject_writer.count:
+        print(f'Rejected {reject_writer.count} rows written to {rejects_path}')
+    elif append:
+        print('Rejected rows from the interrupted run are in', rejects_path)
 
 if __name__ == '__main__':
-    main()
+    with instrument.session('import_headerless_csvs'):
+        main()
@@ -0,0 +1,228 @@
+#!/usr/bin/env python3
+"""
+Instrumentación común de los scripts de migración: `--stats` y `--profile`.
+
+Cada herramienta agrega las opciones a su parser con `add_arguments(parser)`
+y corre su `main()` dentro de una sesión, que lee esas mismas opciones de la
+línea de comandos:
+
+    if __name__ == '__main__':
+        with instrument.session('generate_dump'):
+            main()
+
+Dentro, el código usa `instrument.current()`, que devuelve la sesión activa o
+una inactiva (sin costo) si no se pidió `--stats`/`--profile`; así no hace
+falta pasar la sesión por cada función:
+
+    stats = instrument.current()
+    with stats.phase('render'):
+        ...
+    stats.add(rows=n, bytes_written=size)
+
+- `--stats RUTA`: al terminar agrega una línea JSON a RUTA (`-` para stderr)
+  con los segundos y llamadas de cada fase (read, convert, insert, render,
+  write, ...), filas y bytes leídos/escritos con sus tasas por
+  segundo, contadores propios de la herramienta, pico de RSS del proceso y de
+  sus hijos (workers), versión de Python/SQLite y si terminó bien. Todas las
+  líneas tienen las mismas claves para compararlas entre corridas.
+- `--profile RUTA`: corre cProfile solo alrededor del bucle principal
+  (`stats.profiled()`), guarda el resultado en RUTA (para `python -m pstats`
+  o snakeviz) e imprime en stderr las funciones más costosas.
+
+El pico de RSS sale de `resource.getrusage` y queda en null en Windows.
+"""
+import argparse
+import cProfile
+import io
+import json
+import os
+import platform
+import pstats
+import sqlite3
+import sys
+import time
+from contextlib import contextmanager, nullcontext
+from datetime import datetime, timezone
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+FORMAT_VERSION = 1
+# Funciones que se listan en stderr con --profile
+PROFILE_TOP = 20
+
+_NULL = nullcontext()
+
+
+def add_arguments(parser):
+    group = parser.add_argument_group('instrumentación')
+    # Always takes a value: an optional one would swallow a following positional argument
+    group.add_argument('--stats', metavar='PATH',
+                       help="Agregar una línea JSON con tiempos por fase, filas/s, bytes/s y RSS a PATH ('-' = stderr)")
+    group.add_argument('--profile', metavar='PATH', help='Perfilar el bucle principal con cProfile y guardar el resultado en PATH')
+    return group
+
+
+def peak_rss_mb(who='self'):
+    if resource is None:
+        return None
+    usage = resource.getrusage(resource.RUSAGE_SELF if who == 'self' else resource.RUSAGE_CHILDREN)
+    # ru_maxrss is KiB on Linux and bytes on macOS
+    return round(usage.ru_maxrss / (1024 * 1024 if sys.platform == 'darwin' else 1024), 1)
+
+
+class Stats:
+    """Tiempos por fase y contadores de una corrida; inactiva no mide nada."""
+
+    def __init__(self, tool=None, stats_path=None, profile_path=None):
+        self.tool = tool
+        self.stats_path = stats_path
+        self.profile_path = profile_path
+        self.enabled = bool(stats_path or profile_path)
+        self.phases = {}
+        self.rows = 0
+        self.bytes_read = 0
+        self.bytes_written = 0
+        self.counters = {}
+        self._profiler = cProfile.Profile() if profile_path else None
+        self._started = time.perf_counter()
+        self._started_at = datetime.now(timezone.utc).isoformat(timespec='seconds')
+
+    def phase(self, name):
+        """Context manager que suma el tiempo transcurrido a la fase `name`."""
+        if not self.enabled:
+            return _NULL
+        return self._timed(name)
+
+    @contextmanager
+    def _timed(self, name):
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            entry = self.phases.setdefault(name, [0.0, 0])
+            entry[0] += time.perf_counter() - started
+            entry[1] += 1
+
+    def timed_iter(self, name, iterable):
+        """Recorre `iterable` sumando a la fase `name` el tiempo de producir cada elemento."""
+        if not self.enabled:
+            return iterable
+        return self._timed_iter(name, iterable)
+
+    def _timed_iter(self, name, iterable):
+        it = iter(iterable)
+        entry = self.phases.setdefault(name, [0.0, 0])
+        while True:
+            started = time.perf_counter()
+            try:
+                item = next(it)
+            except StopIteration:
+                entry[0] += time.perf_counter() - started
+                return
+            entry[0] += time.perf_counter() - started
+            entry[1] += 1
+            yield item
+
+    def add(self, rows=0, bytes_read=0, bytes_written=0):
+        self.rows += rows
+        self.bytes_read += bytes_read
+        self.bytes_written += bytes_written
+
+    def count(self, name, n=1):
+        """Contador propio de la herramienta (rechazos, errores, ...)."""
+        self.counters[name] = self.counters.get(name, 0) + n
+
+    @contextmanager
+    def profiled(self):
+        """Activa cProfile (si se pidió `--profile`) alrededor del bucle principal."""
+        if self._profiler is None:
+            yield
+            return
+        self._profiler.enable()
+        try:
+            yield
+        finally:
+            self._profiler.disable()
+
+    def record(self, status):
+        wall = time.perf_counter() - self._started
+        return {
+            'format': FORMAT_VERSION,
+            'tool': self.tool,
+            'started': self._started_at,
+            'argv': sys.argv[1:],
+            'status': status,
+            'wall_s': round(wall, 4),
+            'phases': {k: {'seconds': round(s, 4), 'calls': n} for k, (s, n) in self.phases.items()},
+            'rows': self.rows,
+            'rows_per_s': round(self.rows / wall, 1) if wall else None,
+            'bytes_read': self.bytes_read,
+            'bytes_written': self.bytes_written,
+            'bytes_per_s': round((self.bytes_read + self.bytes_written) / wall, 1) if wall else None,
+            'counters': self.counters,
+            'peak_rss_mb': peak_rss_mb('self'),
+            'peak_rss_children_mb': peak_rss_mb('children'),
+            'python': platform.python_version(),
+            'sqlite': sqlite3.sqlite_version,
+        }
+
+    def finish(self, status='ok'):
+        if self._profiler is not None:
+            self._profiler.dump_stats(self.profile_path)
+            out = io.StringIO()
+            pstats.Stats(self._profiler, stream=out).sort_stats('cumulative').print_stats(PROFILE_TOP)
+            sys.stderr.write(out.getvalue())
+            sys.stderr.write(f'Perfil guardado en {self.profile_path}\n')
+        if self.stats_path:
+            line = json.dumps(self.record(status), ensure_ascii=False)
+            if self.stats_path == '-':
+                sys.stderr.write(line + '\n')
+            else:
+                with open(self.stats_path, 'a', encoding='utf-8') as f:
+                    f.write(line + '\n')
+
+
+_current = Stats()
+
+
+def check_stats_path(path):
+    """Rechaza un `--stats` que apunte a un archivo existente que no sea de líneas JSON (p.ej. un .sql de entrada)."""
+    if not path or path == '-' or not os.path.isfile(path) or not os.path.getsize(path):
+        return
+    with open(path, 'rb') as f:
+        first = f.read(1)
+    if first != b'{':
+        raise SystemExit(f"--stats {path}: el archivo existe y no es de líneas JSON de --stats; no se modifica")
+
+
+def current():
+    """La sesión activa (inactiva si el script no pidió --stats/--profile)."""
+    return _current
+
+
+@contextmanager
+def session(tool, argv=None):
+    """Activa una sesión para `tool` según `--stats`/`--profile` en `argv` y la escribe al salir."""
+    global _current
+    parser = argparse.ArgumentParser(add_help=False)
+    add_arguments(parser)
+    args, _ = parser.parse_known_args(sys.argv[1:] if argv is None else argv)
+    check_stats_path(args.stats)
+    stats = Stats(tool, args.stats, args.profile)
+    previous, _current = _current, stats
+    status = 'ok'
+    try:
+        yield stats
+    except SystemExit as e:
+        status = 'ok' if e.code in (None, 0) else f'exit {e.code if isinstance(e.code, int) else 1}'
+        raise
+    except BaseException as e:
+        status = f'error: {type(e).__name__}'
+        raise
+    finally:
+        _current = previous
+        if stats.enabled:
+            stats.finish(status)
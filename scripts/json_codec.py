@@ -0,0 +1,175 @@
+#!/usr/bin/env python3
+"""
+Etapa JSON compartida por importadores y exportadores: valida, minifica y
+deduplica los payloads de las columnas JSON (`Courses.resources`,
+`CourseBlocks.content`, `QuizResults.answers`; ver `sql_render.json_columns`).
+
+Cada payload se parsea una vez y se reescribe en forma canónica minificada
+(`json.dumps` sin espacios, conservando el orden de las claves y los
+caracteres no ASCII). Los textos que no son JSON válido se dejan tal cual y se
+cuentan por columna; los JSON válidos con números que no caben en un float
+(`1e400`) también quedan tal cual, pero se cuentan aparte (`kept_verbatim`). Los payloads repetidos (p.ej. los mismos conjuntos de
+opciones de un quiz) se resuelven con una caché LRU acotada en lugar de
+volver a parsearse; los mayores a `MAX_CACHED_CHARS` no se guardan, así la
+caché no crece con el tamaño de los datos.
+
+Lo usan `generate_d1_insert_batches.py` y `generate_d1_inserts_per_table.py`
+con `--json-policy minify` (ver `sql_render.py`) y los importadores con
+`--json-policy minify`.
+
+Uso (revisar las columnas JSON de una BD):
+  python scripts/json_codec.py --db sag_d1.sqlite
+"""
+import argparse
+import json
+import sqlite3
+from collections import OrderedDict
+from functools import partial
+
+# Payloads distintos que se recuerdan
+DEFAULT_CACHE_SIZE = 4096
+# Payloads más largos no se guardan en la caché
+MAX_CACHED_CHARS = 16 * 1024
+
+
+def _reject_constant(name):
+    # NaN/Infinity are accepted by json.loads but are not JSON
+    raise ValueError(f'{name} is not valid JSON')
+
+
+class JsonCodec:
+    """Minificador de JSON con caché LRU y contadores por columna."""
+
+    def __init__(self, cache_size=DEFAULT_CACHE_SIZE):
+        self.cache_size = cache_size
+        self._cache = OrderedDict()
+        self.parsed = 0
+        self.hits = 0
+        self.chars_in = 0
+        self.chars_out = 0
+        self.malformed = {}
+        self.kept_verbatim = {}
+
+    def _encode(self, text):
+        """(texto canónico, None) o (texto original, contador) si no se puede reescribir.
+
+        El contador es 'malformed' si no es JSON válido y 'kept_verbatim' si lo
+        es pero tiene números que desbordan un float.
+        """
+        try:
+            value = json.loads(text, parse_constant=_reject_constant)
+        except ValueError:
+            return text, 'malformed'
+        try:
+            # 1e400 parses as inf: re-emitting it would write Infinity, which is not JSON
+            out = json.dumps(value, ensure_ascii=False, separators=(',', ':'), allow_nan=False)
+            if not out.isascii():
+                try:
+                    out.encode('utf-8')
+                except UnicodeEncodeError:
+                    # Lone surrogates from \ud8xx escapes only survive as escapes
+                    out = json.dumps(value, separators=(',', ':'), allow_nan=False)
+        except ValueError:
+            return text, 'kept_verbatim'
+        return out, None
+
+    def minify(self, text, key=None):
+        """Forma minificada de `text`; el original si no se puede reescribir (contado bajo `key`).
+
+        Valores que no son texto y textos vacíos se devuelven sin tocar.
+        """
+        if type(text) is not str or not text.strip():
+            return text
+        self.chars_in += len(text)
+        cached = self._cache.get(text)
+        if cached is not None:
+            self._cache.move_to_end(text)
+            self.hits += 1
+            out, counter = cached
+        else:
+            self.parsed += 1
+            out, counter = self._encode(text)
+            if len(text) <= MAX_CACHED_CHARS:
+                self._cache[text] = (out, counter)
+                if len(self._cache) > self.cache_size:
+                    self._cache.popitem(last=False)
+        if counter is not None:
+            counts = self.malformed if counter == 'malformed' else self.kept_verbatim
+            counts[key] = counts.get(key, 0) + 1
+        self.chars_out += len(out)
+        return out
+
+    def stats(self):
+        return {'parsed': self.parsed, 'cache_hits': self.hits, 'chars_in': self.chars_in,
+                'chars_out': self.chars_out, 'malformed': dict(self.malformed),
+                'kept_verbatim': dict(self.kept_verbatim)}
+
+    def merge(self, stats):
+        """Suma los contadores de otro codec (p.ej. de un proceso worker)."""
+        self.parsed += stats['parsed']
+        self.hits += stats['cache_hits']
+        self.chars_in += stats['chars_in']
+        self.chars_out += stats['chars_out']
+        for key, n in stats['malformed'].items():
+            self.malformed[key] = self.malformed.get(key, 0) + n
+        for key, n in stats['kept_verbatim'].items():
+            self.kept_verbatim[key] = self.kept_verbatim.get(key, 0) + n
+
+    def summary(self):
+        total = self.parsed + self.hits
+        saved = self.chars_in - self.chars_out
+        line = (f'JSON: {total} payloads ({self.hits} desde la caché), '
+                f'{self.chars_in} -> {self.chars_out} caracteres ({saved} ahorrados)')
+        if self.malformed:
+            line += ', mal formados: ' + ', '.join(f'{k}={n}' for k, n in sorted(self.malformed.items(), key=str))
+        if self.kept_verbatim:
+            line += ', válidos sin reescribir (números fuera de rango): ' + ', '.join(
+                f'{k}={n}' for k, n in sorted(self.kept_verbatim.items(), key=str))
+        return line
+
+
+def json_positions(columns, json_cols, table):
+    """[(posición, 'tabla.columna')] de las columnas JSON dentro de `columns`."""
+    return [(i, f'{table}.{c}') for i, c in enumerate(columns) if c in json_cols]
+
+
+def minify_rows(codec, rows, positions):
+    """Minifica en el lugar las columnas `positions` de cada fila (listas); devuelve `rows`."""
+    minify = codec.minify
+    for row in rows:
+        for i, key in positions:
+            row[i] = minify(row[i], key)
+    return rows
+
+
+def row_minifier(codec, columns, json_cols, table):
+    """Función rows -> rows que minifica las columnas JSON de `columns`; None si no hay nada que hacer."""
+    positions = json_positions(columns, json_cols, table)
+    if codec is None or not positions:
+        return None
+    return partial(minify_rows, codec, positions=positions)
+
+
+def main():
+    # Imported here: sql_render imports this module
+    from sql_render import json_columns, iter_rows
+
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--db', default='sag_d1.sqlite')
+    parser.add_argument('--cache-size', type=int, default=DEFAULT_CACHE_SIZE)
+    args = parser.parse_args()
+
+    conn = sqlite3.connect(args.db)
+    codec = JsonCodec(args.cache_size)
+    tables = [r[0] for r in conn.execute(
+        "SELECT name FROM sqlite_master WHERE type='table' AND name NOT LIKE 'sqlite_%' ORDER BY name")]
+    for t in tables:
+        for c in sorted(json_columns(conn, t)):
+            for (v,) in iter_rows(conn.execute(f'SELECT "{c}" FROM "{t}"')):
+                codec.minify(v, f'{t}.{c}')
+    conn.close()
+    print(codec.summary())
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,58 @@
+#!/usr/bin/env python3
+r"""
+Punto de entrada único de los scripts de migración.
+
+Uso:
+  python scripts/migrate.py run --csv-dir "C:/Users/jctib/Downloads/db" --outdir scripts/out --multi-row
+  python scripts/migrate.py import --db sag_d1.sqlite --schema d1_schema.sql --csv-dir "C:/Users/jctib/Downloads/db"
+  python scripts/migrate.py apply --manifest scripts/out/manifest.json --db /tmp/d1_local.sqlite
+  python scripts/migrate.py parity --source sag_d1.sqlite --target /tmp/d1_local.sqlite --repair repair.sql
+  python scripts/migrate.py <comando> --help
+
+Cada comando es uno de los scripts de esta carpeta, con las mismas opciones
+(`run` es `d1_pipeline.py`: CSV -> partes para D1 en un solo proceso). El
+módulo del comando se importa recién al elegirlo, así `--help` y los comandos
+livianos no pagan la carga de los demás. `--stats`/`--profile` funcionan igual
+que en cada script (ver `instrument.py`).
+"""
+import argparse
+import importlib
+import sys
+
+# comando -> (módulo, descripción)
+COMMANDS = {
+    'run': ('d1_pipeline', 'CSV -> partes SQL para D1 en un solo proceso, sin archivos intermedios'),
+    'import': ('create_sqlite_and_import', 'CSV con encabezado -> BD SQLite'),
+    'import-headerless': ('import_headerless_csvs', 'CSV sin encabezado (pgAdmin) -> BD SQLite'),
+    'export': ('generate_d1_insert_batches', 'BD SQLite -> partes SQL con manifest y olas'),
+    'export-tables': ('generate_d1_inserts_per_table', 'BD SQLite -> un archivo SQL por tabla'),
+    'dump': ('generate_dump', 'BD SQLite -> volcado completo (iterdump)'),
+    'inserts': ('generate_inserts_only', 'BD SQLite -> solo los INSERT'),
+    'clean': ('prepare_d1_sql', 'Volcado -> sentencias aceptadas por D1, opcionalmente en partes'),
+    'snapshot': ('sqlite_snapshot', 'Copia puntual de la BD y salidas desde la copia'),
+    'pack': ('d1_snapshot', 'Snapshot comprimido de una BD (save/load/info)'),
+    'apply': ('d1_local_apply', 'Aplicar las partes sobre un SQLite local con los límites de D1'),
+    'parity': ('d1_parity', 'Verificar que dos BD coinciden (árbol de hashes por rangos de id) y generar la reparación'),
+    'synth': ('synth_data', 'CSV sintéticos para pruebas a escala'),
+}
+
+
+def main(argv=None):
+    argv = sys.argv[1:] if argv is None else argv
+    parser = argparse.ArgumentParser(
+        prog='migrate.py', formatter_class=argparse.RawDescriptionHelpFormatter,
+        epilog='comandos:\n' + '\n'.join(f'  {name:<18}{desc}' for name, (_, desc) in COMMANDS.items()))
+    parser.add_argument('command', choices=COMMANDS, metavar='comando')
+    # Only the command is parsed here; everything after it belongs to the command's own parser
+    args = parser.parse_args(argv[:1])
+    module_name = COMMANDS[args.command][0]
+    module = importlib.import_module(module_name)
+    import instrument
+
+    sys.argv = [f'migrate.py {args.command}'] + argv[1:]
+    with instrument.session(module_name, argv[1:]):
+        module.main()
+
+
+if __name__ == '__main__':
+    main()
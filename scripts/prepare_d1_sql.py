@@ -3,6 +3,8 @@
 Prepara un SQL dump para Cloudflare D1:
 - elimina sentencias no soportadas (BEGIN TRANSACTION / COMMIT / PRAGMA, sqlite_sequence, etc.)
 - opcional: divide el archivo en partes con un número máximo de statements por archivo
+  (`--split`) y/o un tamaño máximo en bytes (`--max-bytes`); con partes se escribe
+  además `<out>_manifest.json` con bytes, filas y tablas de cada parte
 
 Uso:
   python scripts/prepare_d1_sql.py --in data_dump.sql --out data_dump_clean.sql --split 200
@@ -10,12 +12,23 @@ Uso:
 Luego ejecutar con wrangler por partes:
   wrangler d1 execute sag_db --file part_001.sql --remote
   ...
+
+El dump se lee por bloques con un lexer que respeta comillas y comentarios, y
+cada sentencia se filtra y se escribe apenas se completa: la memoria no crece
+con el tamaño del archivo. Los filtros se aplican a la sentencia completa.
+
+`--stats`/`--profile` separan el tiempo de lectura y filtrado (read) del de
+escritura (write); ver `instrument.py`.
 """
 import argparse
 import re
 import os
+import sqlite3
 from pathlib import Path
 
+import instrument
+from d1_parts import PartWriter
+
 SKIP_PREFIXES = [
     'BEGIN TRANSACTION',
     'COMMIT',
@@ -29,9 +42,20 @@ SKIP_PATTERNS = [
     re.compile(r"^INSERT INTO \"sqlite_"),
 ]
 
-def should_skip(line):
-    s = line.strip()
-    if not s:
+# Tamaño de cada lectura del dump; la memoria no depende del tamaño del archivo
+CHUNK_SIZE = 1024 * 1024
+
+# Lexer states
+NORMAL, SINGLE_QUOTE, DOUBLE_QUOTE, BACKTICK, BRACKET, LINE_COMMENT, BLOCK_COMMENT = range(7)
+_OPENERS = {"'": SINGLE_QUOTE, '"': DOUBLE_QUOTE, '`': BACKTICK, '[': BRACKET, '--': LINE_COMMENT, '/*': BLOCK_COMMENT}
+_CLOSERS = {SINGLE_QUOTE: "'", DOUBLE_QUOTE: '"', BACKTICK: '`', BRACKET: ']', LINE_COMMENT: '\n', BLOCK_COMMENT: '*/'}
+_SPECIAL_RE = re.compile(r"[;'\"`\[]|--|/\*")
+_LEADING_COMMENTS_RE = re.compile(r'\A(?:\s+|--[^\n]*(?:\n|\Z)|/\*.*?\*/)*', re.DOTALL)
+
+
+def should_skip(stmt):
+    s = stmt.strip()
+    if not s or s == ';':
         return True
     for p in SKIP_PREFIXES:
         if s.upper().startswith(p):
@@ -42,65 +66,106 @@ def should_skip(line):
     return False
 
 
-def split_statements(sql_text):
-    # Very simple splitter: split on semicolon at line end. Keep statements ending with ';'
-    stmts = []
-    cur = []
-    for line in sql_text.splitlines():
-        cur.append(line)
-        if line.strip().endswith(';'):
-            stmt = '\n'.join(cur).strip()
-            if stmt:
-                stmts.append(stmt)
-            cur = []
-    # any trailing
-    if cur:
-        stmt = '\n'.join(cur).strip()
-        if stmt:
-            stmts.append(stmt)
-    return stmts
-
-
-def clean_sql_file(input_path, out_path, split=None):
+def _is_open_trigger(stmt):
+    # CREATE TRIGGER bodies contain ';' between BEGIN and END
+    head = _LEADING_COMMENTS_RE.sub('', stmt, count=1)[:64].upper().split()
+    return ('TRIGGER' in head[:4] and head[:1] == ['CREATE']
+            and not sqlite3.complete_statement(stmt))
+
+
+def iter_statements(f, chunk_size=CHUNK_SIZE):
+    """Lee `f` por bloques y produce las sentencias SQL completas una a una.
+
+    Sigue el estado de comillas ('...', "...", `...`, [...]) y comentarios
+    (-- y /* */), así que un ';' dentro de un literal no corta la sentencia.
+    Los comentarios iniciales de cada sentencia se descartan.
+    """
+    parts = []
+    state = NORMAL
+    carry = ''
+    while True:
+        chunk = f.read(chunk_size)
+        data = carry + chunk
+        i = start = 0
+        n = len(data)
+        while i < n:
+            if state == NORMAL:
+                m = _SPECIAL_RE.search(data, i)
+                if not m:
+                    break
+                tok = m.group()
+                i = m.end()
+                if tok != ';':
+                    state = _OPENERS[tok]
+                    continue
+                stmt = ''.join(parts) + data[start:i]
+                if _is_open_trigger(stmt):
+                    continue
+                parts = []
+                start = i
+                stmt = _LEADING_COMMENTS_RE.sub('', stmt, count=1).strip()
+                if stmt:
+                    yield stmt
+            else:
+                k = data.find(_CLOSERS[state], i)
+                if k == -1:
+                    break
+                i = k + len(_CLOSERS[state])
+                state = NORMAL
+        # An unconsumed trailing char that may start a two-char token (--, /*, */)
+        # is carried over and rescanned together with the next chunk.
+        carry = ''
+        if chunk and i < n and (
+                (state == NORMAL and data[-1] in '-/') or (state == BLOCK_COMMENT and data[-1] == '*')):
+            carry = data[-1]
+            n -= 1
+        parts.append(data[start:n])
+        if not chunk:
+            break
+    tail = _LEADING_COMMENTS_RE.sub('', ''.join(parts), count=1).strip()
+    if tail:
+        yield tail
+
+
+def iter_clean_statements(input_path, chunk_size=CHUNK_SIZE):
+    """Sentencias del dump ya filtradas por SKIP_PREFIXES/SKIP_PATTERNS."""
     with open(input_path, 'r', encoding='utf8') as f:
-        text = f.read()
-
-    # remove Windows style \r
-    text = text.replace('\r\n', '\n')
-
-    # Remove PRAGMA foreign_keys lines that might be at top
-    lines = text.splitlines()
-    cleaned_lines = []
-    for line in lines:
-        if should_skip(line):
-            continue
-        cleaned_lines.append(line)
+        for stmt in iter_statements(f, chunk_size):
+            if not should_skip(stmt):
+                yield stmt
 
-    cleaned_text = '\n'.join(cleaned_lines)
 
-    # Split statements
-    stmts = split_statements(cleaned_text)
+def clean_sql_file(input_path, out_path, split=None, max_bytes=None):
+    stats = instrument.current()
+    stats.add(bytes_read=os.path.getsize(input_path))
+    stmts = stats.timed_iter('read', iter_clean_statements(input_path))
 
-    if not split:
+    if not split and not max_bytes:
+        count = 0
         with open(out_path, 'w', encoding='utf8') as f:
             for s in stmts:
-                f.write(s.rstrip() + '\n')
-        print('Wrote', out_path, 'with', len(stmts), 'statements')
+                with stats.phase('write'):
+                    f.write(s.rstrip() + '\n')
+                count += 1
+        stats.add(rows=count, bytes_written=os.path.getsize(out_path))
+        print('Wrote', out_path, 'with', count, 'statements')
         return [out_path]
 
     # write parts
     out_dir = Path(out_path).parent
     base = Path(out_path).stem
-    part_files = []
-    for i in range(0, len(stmts), split):
-        chunk = stmts[i:i+split]
-        idx = i // split + 1
-        fname = out_dir / f"{base}_part_{idx:03d}.sql"
-        with open(fname, 'w', encoding='utf8') as f:
-            for s in chunk:
-                f.write(s.rstrip() + '\n')
-        part_files.append(str(fname))
-    print('Wrote', len(part_files), 'part files, total statements', len(stmts))
+    writer = PartWriter(str(out_dir), f"{base}_part_{{:03d}}.sql", max_bytes=max_bytes or 0, max_statements=split or 0,
+                        name_comment=False)
+    count = 0
+    for s in stmts:
+        with stats.phase('write'):
+            writer.write(s)
+        count += 1
+    parts = writer.close()
+    stats.add(rows=count, bytes_written=sum(p['bytes'] for p in parts))
+    writer.write_manifest(str(out_dir / f"{base}_manifest.json"))
+    part_files = [str(out_dir / p['file']) for p in parts]
+    print('Wrote', len(part_files), 'part files, total statements', count)
     return part_files
 
 
@@ -109,11 +174,15 @@ def main():
     parser.add_argument('--in', dest='input', required=True)
     parser.add_argument('--out', required=True)
     parser.add_argument('--split', type=int, default=0, help='Statements per output file (0 = single file)')
+    parser.add_argument('--max-bytes', type=int, default=0, help='Target max bytes per output file (0 = no byte limit)')
+    instrument.add_arguments(parser)
     args = parser.parse_args()
 
-    parts = clean_sql_file(args.input, args.out, split=args.split or None)
+    with instrument.current().profiled():
+        parts = clean_sql_file(args.input, args.out, split=args.split or None, max_bytes=args.max_bytes or None)
     for p in parts:
         print('->', p)
 
 if __name__ == '__main__':
-    main()
+    with instrument.session('prepare_d1_sql'):
+        main()
@@ -0,0 +1,227 @@
+#!/usr/bin/env python3
+"""
+Renderizado de filas SQLite como literales SQL, compartido por los exportadores.
+
+`compile_row_encoder` lee `PRAGMA table_info` una vez por tabla y arma un
+codificador por columna: INTEGER/REAL van directo a `str`, TEXT comprueba con
+`str.isprintable()` si hace falta limpiar espacios/NUL y solo entonces hace el
+reemplazo (str.translate con reemplazos de varios caracteres resultó más lento
+que esto en CPython), y las columnas JSON siguen una política explícita
+(`--json-policy`):
+
+- `collapse`: igual que TEXT (comportamiento histórico de `sql_escape`)
+- `raw`: conserva el texto tal cual, solo escapa comillas y quita NULs
+- `minify`: parsea el JSON y lo escribe minificado (`json_codec.JsonCodec`,
+  con caché de payloads repetidos); los textos que no son JSON van como `raw`
+  y se cuentan
+
+El resultado es idéntico al de `sql_escape` para la política `collapse`.
+
+Uso (benchmark contra `sql_escape`):
+  python scripts/sql_render.py --db sag_d1.sqlite --table CourseBlocks --repeat 200
+"""
+import argparse
+import re
+import sqlite3
+import time
+
+from json_codec import JsonCodec
+
+# Filas por fetchmany al recorrer cada tabla
+FETCH_SIZE = 1000
+
+JSON_POLICIES = ('collapse', 'raw', 'minify')
+
+# Columnas JSON del esquema de D1 (d1_schema.sql las marca con `-- JSON string`)
+KNOWN_JSON_COLUMNS = {
+    'Courses': {'resources'},
+    'CourseBlocks': {'content'},
+    'QuizResults': {'answers'},
+}
+
+_JSON_COMMENT_RE = re.compile(r'^\s*"?(\w+)"?\s+[^\n]*--[^\n]*\bJSON\b', re.IGNORECASE | re.MULTILINE)
+
+
+def sql_escape(value):
+    """Codificador genérico (histórico): cualquier valor a literal SQL."""
+    if value is None:
+        return 'NULL'
+    if isinstance(value, (int, float)):
+        return str(value)
+    # Otherwise treat as text; ensure it's a Python str
+    s = str(value)
+    # Remove embedded NULs which can break some SQL processors
+    s = s.replace('\x00', '')
+    # Normalize whitespace and escape newlines so each INSERT is safer to pass via file/CLI
+    s = s.replace('\r', '')
+    s = s.replace('\n', '\\n')
+    # Collapse multiple spaces introduced by newlines into single spaces where appropriate
+    # (keep this simple to avoid changing intended content structure)
+    s = ' '.join(s.split())
+    # Escape single quotes for SQL literal
+    s = s.replace("'", "''")
+    return "'{}'".format(s)
+
+
+def encode_number(v):
+    if v is None:
+        return 'NULL'
+    t = type(v)
+    if t is int or t is float:
+        return str(v)
+    return sql_escape(v)
+
+
+def encode_text(v):
+    if type(v) is not str:
+        return sql_escape(v)
+    # sql_escape only changes a string beyond its quotes if it has NUL or
+    # whitespace other than ' ' (both make isprintable() False), double spaces
+    # or spaces at the ends; clean strings skip the split/join entirely.
+    if not v.isprintable() or '  ' in v or v[:1] == ' ' or v[-1:] == ' ':
+        v = ' '.join(v.replace('\x00', '').replace('\r', '').replace('\n', '\\n').split())
+    if "'" in v:
+        v = v.replace("'", "''")
+    return "'" + v + "'"
+
+
+def encode_json_raw(v):
+    if type(v) is not str:
+        return sql_escape(v)
+    if '\x00' in v:
+        v = v.replace('\x00', '')
+    if "'" in v:
+        v = v.replace("'", "''")
+    return "'" + v + "'"
+
+
+def json_minify_encoder(codec, key):
+    """Codificador de una columna JSON que pasa por `codec.minify` (contando bajo `key`)."""
+    minify = codec.minify
+
+    def encode_json_minify(v):
+        if type(v) is not str:
+            return sql_escape(v)
+        return encode_json_raw(minify(v, key))
+    return encode_json_minify
+
+
+def column_affinity(decl_type):
+    """Afinidad SQLite de un tipo declarado (reglas de https://sqlite.org/datatype3.html)."""
+    t = (decl_type or '').upper()
+    if 'INT' in t:
+        return 'INTEGER'
+    if 'CHAR' in t or 'CLOB' in t or 'TEXT' in t:
+        return 'TEXT'
+    if 'BLOB' in t or not t:
+        return 'BLOB'
+    if 'REAL' in t or 'FLOA' in t or 'DOUB' in t:
+        return 'REAL'
+    return 'NUMERIC'
+
+
+def json_columns(conn, table):
+    """Columnas JSON de `table`: las conocidas más las marcadas con `-- JSON` en su CREATE TABLE."""
+    cols = set(KNOWN_JSON_COLUMNS.get(table, ()))
+    row = conn.execute("SELECT sql FROM sqlite_master WHERE type='table' AND name=?", (table,)).fetchone()
+    if row and row[0]:
+        cols.update(_JSON_COMMENT_RE.findall(row[0]))
+    return cols
+
+
+def table_columns(conn, table):
+    """(nombre, tipo declarado) de cada columna, en orden."""
+    return [(c[1], c[2]) for c in conn.execute(f"PRAGMA table_info('{table}')").fetchall()]
+
+
+def column_encoders(conn, table, json_policy='collapse', codec=None):
+    """Lista de (columna, codificador) compilada desde el esquema de `table`.
+
+    Con `json_policy='minify'` las columnas JSON usan `codec` (uno nuevo si es
+    None); pasar el mismo codec a todas las tablas junta caché y contadores.
+    """
+    if json_policy not in JSON_POLICIES:
+        raise ValueError(f'json_policy must be one of {JSON_POLICIES}')
+    if json_policy == 'minify' and codec is None:
+        codec = JsonCodec()
+    json_cols = json_columns(conn, table)
+    encoders = []
+    for name, decl_type in table_columns(conn, table):
+        affinity = column_affinity(decl_type)
+        if name in json_cols and json_policy == 'minify':
+            enc = json_minify_encoder(codec, f'{table}.{name}')
+        elif name in json_cols and json_policy == 'raw':
+            enc = encode_json_raw
+        elif affinity in ('INTEGER', 'REAL'):
+            enc = encode_number
+        elif affinity == 'TEXT' or name in json_cols:
+            enc = encode_text
+        else:
+            enc = sql_escape
+        encoders.append((name, enc))
+    return encoders
+
+
+def compile_row_encoder(conn, table, json_policy='collapse', codec=None, columns=None):
+    """Devuelve (columnas, encode_row) donde encode_row(row) -> '(v1, v2, ...)'.
+
+    Con `columns` las filas traen solo esas columnas, en ese orden (p.ej. las
+    de un CSV); si no, todas las de la tabla. Si la tabla no existe devuelve ([], None).
+    """
+    encoders = column_encoders(conn, table, json_policy, codec)
+    if columns is not None:
+        by_name = dict(encoders)
+        encoders = [(c, by_name[c]) for c in columns]
+    cols = [name for name, _ in encoders]
+    encs = [enc for _, enc in encoders]
+    if not encs:
+        return cols, None
+    # Unrolled per table: one call per column, no zip/loop per row
+    args = ', '.join(f'e{i}' for i in range(len(encs)))
+    body = ' + ", " + '.join(f'e{i}(row[{i}])' for i in range(len(encs)))
+    namespace = {}
+    exec(f'def encode_row(row, {args}):\n    return "(" + {body} + ")"\n', namespace)
+    fn = namespace['encode_row']
+    fn.__defaults__ = tuple(encs)
+    return cols, fn
+
+
+def iter_rows(cur, size=FETCH_SIZE):
+    """Recorre el resultado de `cur` con fetchmany para no materializar la tabla."""
+    while True:
+        rows = cur.fetchmany(size)
+        if not rows:
+            return
+        yield from rows
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--db', default='sag_d1.sqlite')
+    parser.add_argument('--table', required=True)
+    parser.add_argument('--repeat', type=int, default=100, help='Veces que se renderiza la tabla')
+    parser.add_argument('--json-policy', choices=JSON_POLICIES, default='collapse')
+    args = parser.parse_args()
+
+    conn = sqlite3.connect(args.db)
+    cols, encode_row = compile_row_encoder(conn, args.table, args.json_policy)
+    rows = conn.execute(f"SELECT {', '.join(cols)} FROM '{args.table}'").fetchall()
+    conn.close()
+    if not rows:
+        print('Tabla vacía:', args.table)
+        return
+
+    def legacy(row):
+        return '(' + ', '.join(sql_escape(v) for v in row) + ')'
+
+    for name, fn in (('sql_escape', legacy), ('compiled', encode_row)):
+        started = time.perf_counter()
+        for _ in range(args.repeat):
+            for row in rows:
+                fn(row)
+        elapsed = time.perf_counter() - started
+        print(f'{name:>10}: {len(rows) * args.repeat / elapsed:,.0f} rows/s')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,147 @@
+#!/usr/bin/env python3
+r"""
+Copia puntual (point-in-time) de una BD SQLite y generación de salidas desde
+esa copia.
+
+Uso:
+  python scripts/sqlite_snapshot.py --db sag_d1.sqlite --dump data_dump.sql --inserts inserts_only.sql
+  python scripts/sqlite_snapshot.py --db sag_d1.sqlite --method vacuum --keep sag_d1_copy.sqlite
+
+La copia se toma con la API de backup de SQLite (`--method backup`, página a
+página en un solo paso) o con `VACUUM INTO` (`--method vacuum`, además
+compacta). En ambos casos la BD original se abre en solo lectura y la
+transacción de lectura dura lo que tarda la copia, no lo que tarda generar
+las salidas; quien esté escribiendo en la BD solo espera esa copia.
+
+Desde la copia se generan únicamente las salidas pedidas, cada una en una
+pasada: `--dump` equivale a `generate_dump.py` y `--inserts` a
+`generate_inserts_only.py` (mismo contenido, byte a byte), pero los INSERT se
+arman directamente en SQLite sin volcar y filtrar la BD completa.
+
+`--stats`/`--profile`: ver `instrument.py` (fases snapshot, render y write).
+"""
+import argparse
+import os
+import sqlite3
+import tempfile
+import time
+from pathlib import Path
+
+import instrument
+
+SNAPSHOT_METHODS = ('backup', 'vacuum')
+
+
+def open_readonly(db_path):
+    return sqlite3.connect(Path(db_path).resolve().as_uri() + '?mode=ro', uri=True)
+
+
+def snapshot_copy(db_path, method='backup', dest=None):
+    """Copia puntual de `db_path`; devuelve (conexión a la copia, ruta temporal a borrar o None).
+
+    `dest` None crea un archivo temporal; ':memory:' deja la copia en memoria
+    (solo con `backup`).
+    """
+    if method not in SNAPSHOT_METHODS:
+        raise ValueError(f'method must be one of {SNAPSHOT_METHODS}')
+    temp = None
+    if dest is None:
+        fd, temp = tempfile.mkstemp(suffix='.sqlite', prefix='snapshot_')
+        os.close(fd)
+        os.remove(temp)
+        dest = temp
+    elif dest != ':memory:' and os.path.exists(dest):
+        os.remove(dest)
+    src = open_readonly(db_path)
+    try:
+        if method == 'backup':
+            copy = sqlite3.connect(dest)
+            # pages=-1: one step, so the source is read-locked only for the copy itself
+            src.backup(copy, pages=-1)
+        else:
+            if dest == ':memory:':
+                raise ValueError('VACUUM INTO needs a file destination')
+            src.execute('VACUUM INTO ?', (dest,))
+            copy = sqlite3.connect(dest)
+    finally:
+        src.close()
+    return copy, temp
+
+
+def iter_inserts(conn):
+    """Las sentencias INSERT que `conn.iterdump()` produciría, en el mismo orden, sin el resto del volcado."""
+    cu = conn.cursor()
+    tables = cu.execute(
+        'SELECT "name", "sql" FROM "sqlite_master" WHERE "sql" NOT NULL AND "type" == \'table\' ORDER BY "name"'
+    ).fetchall()
+    sequence = []
+    for name, sql in tables:
+        if name == 'sqlite_sequence':
+            sequence = cu.execute('SELECT * FROM "sqlite_sequence";').fetchall()
+            continue
+        if name.startswith('sqlite_') and name != 'sqlite_stat1':
+            continue
+        if sql.startswith('CREATE VIRTUAL TABLE'):
+            yield ("INSERT INTO sqlite_master(type,name,tbl_name,rootpage,sql)"
+                   "VALUES('table','{0}','{0}',0,'{1}');".format(name.replace("'", "''"), sql.replace("'", "''")))
+        ident = name.replace('"', '""')
+        cols = [str(r[1]) for r in cu.execute(f'PRAGMA table_info("{ident}")').fetchall()]
+        # Same query iterdump uses: rows are rendered by SQLite's quote(), not in Python
+        q = """SELECT 'INSERT INTO "{0}" VALUES({1})' FROM "{0}";""".format(
+            ident, ",".join("""'||quote("{0}")||'""".format(c.replace('"', '""')) for c in cols))
+        for row in cu.execute(q):
+            yield row[0] + ';'
+    for row in sequence:
+        yield f'INSERT INTO "sqlite_sequence" VALUES(\'{row[0]}\',{row[1]});'
+
+
+def write_lines(path, lines):
+    stats = instrument.current()
+    count = 0
+    with open(path, 'w', encoding='utf8') as f:
+        for line in stats.timed_iter('render', lines):
+            with stats.phase('write'):
+                f.write(f'{line}\n')
+            count += 1
+    stats.add(rows=count, bytes_written=os.path.getsize(path))
+    return count
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--db', default='sag_d1.sqlite')
+    parser.add_argument('--method', choices=SNAPSHOT_METHODS, default='backup', help='Cómo tomar la copia')
+    parser.add_argument('--keep', metavar='PATH', help='Guardar la copia en PATH (por defecto temporal y se borra)')
+    parser.add_argument('--dump', metavar='PATH', help='Escribir el volcado completo (como generate_dump.py)')
+    parser.add_argument('--inserts', metavar='PATH', help='Escribir solo los INSERT (como generate_inserts_only.py)')
+    instrument.add_arguments(parser)
+    args = parser.parse_args()
+    stats = instrument.current()
+
+    if not os.path.exists(args.db):
+        raise SystemExit(f"No se encontró la BD en '{args.db}'.")
+    started = time.perf_counter()
+    with stats.phase('snapshot'):
+        copy, temp = snapshot_copy(args.db, args.method, args.keep)
+    stats.add(bytes_read=os.path.getsize(args.db))
+    print(f'Copia puntual ({args.method}) en {time.perf_counter() - started:.3f}s' +
+          (f' -> {args.keep}' if args.keep else ''))
+    try:
+        with stats.profiled():
+            if args.dump:
+                started = time.perf_counter()
+                n = write_lines(args.dump, copy.iterdump())
+                print(f'Generated {args.dump} ({n} statements, {time.perf_counter() - started:.3f}s)')
+            if args.inserts:
+                started = time.perf_counter()
+                n = write_lines(args.inserts, iter_inserts(copy))
+                print(f'Wrote inserts to {args.inserts} ({n} statements, {time.perf_counter() - started:.3f}s)')
+    finally:
+        copy.close()
+        if temp and os.path.exists(temp):
+            os.remove(temp)
+
+
+if __name__ == '__main__':
+    with instrument.session('sqlite_snapshot'):
+        main()
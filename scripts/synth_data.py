@@ -0,0 +1,242 @@
+#!/usr/bin/env python3
+r"""
+Genera CSV sintéticos (Users, Courses, CourseBlocks, Enrollments, QuizResults)
+con una semilla fija, para probar y medir los scripts de migración a escala.
+
+Uso:
+  python scripts/synth_data.py --outdir synth/csv --seed 1 --scale 10
+  python scripts/synth_data.py --outdir synth/csv_nh --no-header --users 1000000 --quiz-results 20000000
+
+Los archivos se llaman `<Tabla>.csv`, como los que esperan
+`create_sqlite_and_import.py` (con encabezado) e `import_headerless_csvs.py`
+(`--no-header`, columnas en el orden de su `TABLE_COLUMN_ORDERS`). Las filas se
+escriben a medida que se generan, así que la memoria no depende del tamaño.
+
+Los datos imitan los de la plataforma: `clerkId` con formato de Clerk, fechas
+como las exporta Postgres, bloques `text`/`video`/`quiz` con el JSON que arma
+el CourseBuilder, `answers` con `selectedIndex` y textos en español con comas,
+comillas y saltos de línea para ejercitar el parseo CSV. Las referencias son
+válidas: cada `courseId` existe, cada `quizBlockId` es un bloque quiz del curso
+y cada `clerkId` es de un usuario generado.
+
+Con la misma semilla y los mismos tamaños la salida es idéntica byte a byte.
+`<outdir>/synth.json` guarda la semilla, las filas y los bytes de cada archivo.
+`--stats`/`--profile` separan el tiempo de generar las filas (render) del de
+escribirlas (write); ver `instrument.py`.
+"""
+import argparse
+import base64
+import csv
+import hashlib
+import json
+import os
+import random
+from datetime import datetime, timedelta
+
+import instrument
+from import_headerless_csvs import TABLE_COLUMN_ORDERS
+
+# Tamaños por defecto (se multiplican por --scale)
+DEFAULT_USERS = 10_000
+DEFAULT_COURSES = 200
+DEFAULT_BLOCKS_PER_COURSE = 20
+DEFAULT_ENROLLMENTS = 50_000
+DEFAULT_QUIZ_RESULTS = 200_000
+
+# Cada QUIZ_EVERY bloques de un curso, el último es un quiz
+QUIZ_EVERY = 4
+# Uno de cada TEACHER_EVERY usuarios es docente (y puede crear cursos)
+TEACHER_EVERY = 25
+
+FIRST_NAMES = ['Juan', 'María', 'Camilo', 'Laura', 'Andrés', 'Valentina', 'José', 'Daniela', 'Carlos', 'Natalia',
+               'Luis', 'Paula', 'Jorge', 'Sofía', 'Diego', 'Ana María', 'Felipe', 'Carolina', 'Sebastián', 'Ángela']
+LAST_NAMES = ['Rodríguez', 'Gómez', 'González', 'Martínez', 'García', 'López', 'Hernández', 'Sánchez', 'Ramírez',
+              'Pérez', 'Díaz', 'Muñoz', 'Rojas', 'Moreno', 'Jiménez', 'Vargas', 'Castro', 'Ortiz', 'Tibaduiza', 'Peña']
+DOMAINS = ['gmail.com', 'hotmail.com', 'outlook.com', 'saviare.com', 'yahoo.es']
+WORDS = ('seguridad operacional gestión del riesgo reporte de eventos aeronave mantenimiento procedimiento '
+         'inspección plataforma tripulación cabina pasajeros emergencia evacuación extintor peligro control '
+         'salud trabajo prevención accidente incidente auditoría indicador cumplimiento norma RAC capacitación '
+         'responsabilidad política objetivo cultura mejora continua protección elementos personal vuelo').split()
+TOPICS = ['Inducción SMS', 'SG-SST', 'Mercancías peligrosas', 'Factores humanos', 'Seguridad en plataforma',
+          'Plan de emergencias', 'Primeros auxilios', 'AVSEC', 'Manejo de combustible', 'Reporte de eventos']
+
+EPOCH = datetime(2024, 1, 1)
+SPAN_SECONDS = 2 * 365 * 24 * 3600
+
+
+def clerk_id(seed, i):
+    """clerkId estable para el usuario `i` (user_ + 27 caracteres alfanuméricos, como Clerk)."""
+    digest = hashlib.blake2b(f'{seed}:{i}'.encode(), digest_size=21).digest()
+    return 'user_' + base64.b64encode(digest, b'xY').decode()[:27]
+
+
+def timestamp(rng):
+    t = EPOCH + timedelta(seconds=rng.randrange(SPAN_SECONDS), milliseconds=rng.randrange(1000))
+    return t.strftime('%Y-%m-%d %H:%M:%S.') + f'{t.microsecond // 1000:03d}+00'
+
+
+def sentence(rng, n_min=6, n_max=18):
+    words = rng.choices(WORDS, k=rng.randint(n_min, n_max))
+    return words[0].capitalize() + ' ' + ' '.join(words[1:]) + '.'
+
+
+def paragraph(rng, n_min=1, n_max=4):
+    text = ' '.join(sentence(rng) for _ in range(rng.randint(n_min, n_max)))
+    # Commas, quotes and line breaks like the real course texts, to exercise CSV quoting
+    r = rng.random()
+    if r < 0.3:
+        text = text.replace('. ', ', ', 1)
+    elif r < 0.4:
+        text = text.replace(' ', ' "' + rng.choice(TOPICS) + '" ', 1)
+    elif r < 0.5:
+        text = text.replace('. ', '.\n', 1)
+    return text
+
+
+def course_role(i):
+    if i == 1:
+        return 'admin'
+    return 'teacher' if i % TEACHER_EVERY == 0 else 'student'
+
+
+def gen_users(rng, seed, n):
+    for i in range(1, n + 1):
+        first, last = rng.choice(FIRST_NAMES), rng.choice(LAST_NAMES)
+        email = f"{first.split()[0].lower()}.{last.lower()}{i}@{rng.choice(DOMAINS)}"
+        created = timestamp(rng)
+        yield [i, clerk_id(seed, i), email, first, last, course_role(i), created, created]
+
+
+def gen_courses(rng, seed, n, n_users):
+    teachers = max(1, n_users // TEACHER_EVERY)
+    for i in range(1, n + 1):
+        title = f'{rng.choice(TOPICS)} {i}'
+        resources = []
+        if rng.random() < 0.4:
+            resources = [{'type': 'link', 'url': f'https://recursos.saviare.com/cursos/{i}/{k}.pdf'}
+                         for k in range(rng.randint(1, 3))]
+        image = f'https://img.saviare.com/cursos/{i}.jpg' if rng.random() < 0.5 else ''
+        creator = clerk_id(seed, rng.randint(1, teachers) * TEACHER_EVERY if n_users >= TEACHER_EVERY else 1)
+        created = timestamp(rng)
+        yield [i, title, paragraph(rng, 2, 5), image, json.dumps(resources, ensure_ascii=False), creator,
+               created, created]
+
+
+def block_id(course, position, per_course):
+    return (course - 1) * per_course + position + 1
+
+
+def is_quiz(position, per_course):
+    return position % QUIZ_EVERY == QUIZ_EVERY - 1 or per_course < QUIZ_EVERY and position == per_course - 1
+
+
+def quiz_content(rng, bid):
+    questions = []
+    for q in range(rng.randint(1, 5)):
+        options = [sentence(rng, 2, 6) for _ in range(rng.randint(2, 4))]
+        questions.append({'id': f'{bid}-{q}', 'question': sentence(rng, 6, 14).rstrip('.') + '?',
+                          'options': options, 'correct': rng.randrange(len(options))})
+    return {'questions': questions}
+
+
+def gen_blocks(rng, n_courses, per_course):
+    for course in range(1, n_courses + 1):
+        for pos in range(per_course):
+            bid = block_id(course, pos, per_course)
+            if is_quiz(pos, per_course):
+                btype, content = 'quiz', quiz_content(rng, bid)
+            elif rng.random() < 0.25:
+                btype = 'video'
+                content = {'text': sentence(rng), 'url': f'https://www.youtube.com/watch?v={clerk_id(bid, pos)[5:16]}'}
+            else:
+                btype, content = 'text', {'text': paragraph(rng), 'url': ''}
+            yield [bid, course, btype, json.dumps(content, ensure_ascii=False), pos]
+
+
+def gen_enrollments(rng, seed, n, n_courses, n_users):
+    for i in range(1, n + 1):
+        yield [i, rng.randint(1, n_courses), clerk_id(seed, rng.randint(1, n_users)), timestamp(rng)]
+
+
+def gen_quiz_results(rng, seed, n, n_courses, n_users, per_course):
+    quiz_positions = [p for p in range(per_course) if is_quiz(p, per_course)]
+    teachers = max(1, n_users // TEACHER_EVERY)
+    for i in range(1, n + 1):
+        course = rng.randint(1, n_courses)
+        selected = rng.randrange(4)
+        correct = rng.random() < 0.7
+        max_attempts = rng.choice((1, 1, 1, 3))
+        completed = timestamp(rng)
+        yield [i, course, clerk_id(seed, rng.randint(1, n_users)),
+               block_id(course, rng.choice(quiz_positions), per_course),
+               1.0 if correct else 0.0, json.dumps({'selectedIndex': selected}),
+               clerk_id(seed, rng.randint(1, teachers) * TEACHER_EVERY if n_users >= TEACHER_EVERY else 1),
+               completed, rng.randint(1, max_attempts), max_attempts]
+
+
+def write_table(outdir, table, rows, header=True):
+    stats = instrument.current()
+    path = os.path.join(outdir, f'{table}.csv')
+    count = 0
+    with open(path, 'w', newline='', encoding='utf-8') as f:
+        writer = csv.writer(f)
+        if header:
+            writer.writerow(TABLE_COLUMN_ORDERS[table])
+        for row in stats.timed_iter('render', rows):
+            with stats.phase('write'):
+                writer.writerow(row)
+            count += 1
+    stats.add(rows=count, bytes_written=os.path.getsize(path))
+    return path, count
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--outdir', required=True, help='Carpeta de salida para los CSV')
+    parser.add_argument('--seed', type=int, default=1)
+    parser.add_argument('--scale', type=float, default=1.0, help='Multiplicador de los tamaños por defecto')
+    parser.add_argument('--users', type=int)
+    parser.add_argument('--courses', type=int)
+    parser.add_argument('--blocks-per-course', type=int, default=DEFAULT_BLOCKS_PER_COURSE)
+    parser.add_argument('--enrollments', type=int)
+    parser.add_argument('--quiz-results', type=int)
+    parser.add_argument('--no-header', action='store_true', help='CSV sin encabezado (para import_headerless_csvs.py)')
+    instrument.add_arguments(parser)
+    args = parser.parse_args()
+
+    def size(value, default):
+        return value if value is not None else max(1, int(default * args.scale))
+
+    n_users = size(args.users, DEFAULT_USERS)
+    n_courses = size(args.courses, DEFAULT_COURSES)
+    per_course = max(1, args.blocks_per_course)
+    n_enrollments = size(args.enrollments, DEFAULT_ENROLLMENTS)
+    n_quiz = size(args.quiz_results, DEFAULT_QUIZ_RESULTS)
+
+    os.makedirs(args.outdir, exist_ok=True)
+    # One generator per table, seeded separately, so changing one size leaves the other files identical
+    jobs = [
+        ('Users', lambda rng: gen_users(rng, args.seed, n_users)),
+        ('Courses', lambda rng: gen_courses(rng, args.seed, n_courses, n_users)),
+        ('CourseBlocks', lambda rng: gen_blocks(rng, n_courses, per_course)),
+        ('Enrollments', lambda rng: gen_enrollments(rng, args.seed, n_enrollments, n_courses, n_users)),
+        ('QuizResults', lambda rng: gen_quiz_results(rng, args.seed, n_quiz, n_courses, n_users, per_course)),
+    ]
+    summary = {'seed': args.seed, 'header': not args.no_header, 'tables': {}}
+    for table, make_rows in jobs:
+        rng = random.Random(f'{args.seed}:{table}')
+        with instrument.current().profiled():
+            path, count = write_table(args.outdir, table, make_rows(rng), header=not args.no_header)
+        summary['tables'][table] = {'file': os.path.basename(path), 'rows': count, 'bytes': os.path.getsize(path)}
+        print(f'{path}: {count} filas, {os.path.getsize(path)} bytes')
+    summary['rows'] = sum(t['rows'] for t in summary['tables'].values())
+    summary['bytes'] = sum(t['bytes'] for t in summary['tables'].values())
+    with open(os.path.join(args.outdir, 'synth.json'), 'w', encoding='utf-8') as f:
+        json.dump(summary, f, indent=2)
+        f.write('\n')
+    print(f"Total: {summary['rows']} filas, {summary['bytes']} bytes")
+
+
+if __name__ == '__main__':
+    with instrument.session('synth_data'):
+        main()
@@ -0,0 +1,194 @@
+#!/usr/bin/env python3
+"""
+Conversión tipada de los valores de los CSV antes de insertarlos.
+
+Lo usan `create_sqlite_and_import.py` e `import_headerless_csvs.py`.
+`compile_row_converter` lee `PRAGMA table_info` una vez por tabla y arma un
+conversor por columna según su afinidad (ver `sql_render.column_affinity`):
+
+- INTEGER: entero, aceptando también reales enteros (`"3.0"`)
+- REAL: real finito
+- NUMERIC: entero si se puede, si no real finito
+- TEXT/BLOB: sin cambios
+
+Solo se aceptan números en notación decimal ASCII (`-12`, `3.5`, `1e-3`):
+`int()`/`float()` solos aceptarían también `1_000`, dígitos de otros
+alfabetos (`٣`), `nan`, `inf` o `1e400` (que desborda a infinito).
+
+Una celda vacía en una columna no TEXT pasa a NULL, o al DEFAULT de la
+columna si es NOT NULL. Un valor que no se puede convertir se deja como texto
+(lo mismo que haría la afinidad de SQLite) y se cuenta por `tabla.columna`,
+para encontrar los datos sucios en lugar de descubrirlos en un JOIN lento.
+
+Con `timestamps='iso'` las columnas de fecha (`createdAt`, `updatedAt`,
+`assignedAt`, `completedAt`: TEXT terminadas en `At`) se llevan al formato que
+escribe el Worker (`Date.toISOString()`, UTC con milisegundos y `Z`); el
+formato de pgAdmin (`2025-10-31 00:52:21.567+00`) ordena distinto que ese. Las
+fechas sin zona horaria se toman como UTC.
+"""
+import math
+import re
+from datetime import datetime, timezone
+
+from json_codec import row_minifier
+from sql_render import column_affinity, json_columns
+
+TIMESTAMP_POLICIES = ('keep', 'iso')
+
+_TIMESTAMP_COLUMN_RE = re.compile(r'At$')
+_INT_RE = re.compile(r'[+-]?[0-9]+')
+_REAL_RE = re.compile(r'[+-]?(?:[0-9]+\.?[0-9]*|\.[0-9]+)(?:[eE][+-]?[0-9]+)?')
+
+
+def to_real(v):
+    if not _REAL_RE.fullmatch(v):
+        raise ValueError(f'not a decimal number: {v!r}')
+    f = float(v)
+    if not math.isfinite(f):
+        raise ValueError(f'out of range: {v!r}')
+    return f
+
+
+def to_int(v):
+    if _INT_RE.fullmatch(v):
+        return int(v)
+    f = to_real(v)
+    if not f.is_integer():
+        raise ValueError(f'not an integer: {v!r}')
+    return int(f)
+
+
+def to_numeric(v):
+    if _INT_RE.fullmatch(v):
+        return int(v)
+    return to_real(v)
+
+
+def to_iso_timestamp(v):
+    dt = datetime.fromisoformat(v)
+    if dt.tzinfo is None:
+        dt = dt.replace(tzinfo=timezone.utc)
+    else:
+        dt = dt.astimezone(timezone.utc)
+    return f'{dt:%Y-%m-%dT%H:%M:%S}.{dt.microsecond // 1000:03d}Z'
+
+
+AFFINITY_CONVERTERS = {'INTEGER': to_int, 'REAL': to_real, 'NUMERIC': to_numeric}
+
+
+def empty_value(notnull, default):
+    """Valor para una celda vacía: NULL, o el DEFAULT literal si la columna es NOT NULL."""
+    if not notnull or default is None:
+        return None
+    if default[:1] == "'" and default[-1:] == "'":
+        return default[1:-1].replace("''", "'")
+    try:
+        return to_numeric(default)
+    except ValueError:
+        # An expression default (CURRENT_TIMESTAMP, ...) cannot be computed here
+        return None
+
+
+def compile_row_converter(conn, table, columns, timestamps='keep', failures=None):
+    """Devuelve convert_rows(rows), que convierte en el lugar las filas (listas) de `table`.
+
+    `columns` es el orden de las columnas en las filas. Los valores que no se
+    pudieron convertir se suman en `failures` ({'tabla.columna': n}). Devuelve
+    None si ninguna columna necesita conversión.
+    """
+    if timestamps not in TIMESTAMP_POLICIES:
+        raise ValueError(f'timestamps must be one of {TIMESTAMP_POLICIES}')
+    if failures is None:
+        failures = {}
+    info = {c[1]: c for c in conn.execute(f"PRAGMA table_info('{table}')").fetchall()}
+    plan = []
+    for i, name in enumerate(columns):
+        col = info.get(name)
+        if col is None:
+            continue
+        affinity = column_affinity(col[2])
+        conv = AFFINITY_CONVERTERS.get(affinity)
+        if conv is None and timestamps == 'iso' and affinity == 'TEXT' and _TIMESTAMP_COLUMN_RE.search(name):
+            conv = to_iso_timestamp
+        if conv is None:
+            continue
+        # Empty cells only become NULL/DEFAULT outside TEXT columns, where '' is a value
+        empty = empty_value(col[3], col[4]) if affinity != 'TEXT' else ''
+        plan.append((i, conv, empty, f'{table}.{name}'))
+    if not plan:
+        return None
+
+    def convert_slow(row):
+        for i, conv, empty, key in plan:
+            v = row[i]
+            if type(v) is not str:
+                continue
+            if not v or v.isspace():
+                if empty != '':
+                    row[i] = empty
+                continue
+            try:
+                row[i] = conv(v.strip())
+            except ValueError:
+                failures[key] = failures.get(key, 0) + 1
+
+    # Unrolled per table like sql_render.compile_row_encoder: clean rows go
+    # through int()/float() straight from C; an empty cell, a padded None or a
+    # bad value raises and only that row takes the checked path (converted
+    # cells are no longer str, so redoing the row is harmless). For ASCII
+    # text without '_', int() and a finite float() accept exactly what
+    # _INT_RE/_REAL_RE do (plus surrounding blanks), at a fraction of a regex.
+    lines = []
+    for n, (i, conv, _, _) in enumerate(plan):
+        if conv is to_int or conv is to_real:
+            lines.append(f"            if '_' in row[{i}] or not row[{i}].isascii():\n"
+                         f"                raise ValueError")
+        if conv is to_int:
+            lines.append(f'            row[{i}] = int(row[{i}])')
+        elif conv is to_real:
+            lines.append(f'            row[{i}] = x = float(row[{i}])\n'
+                         f'            if not isfinite(x):\n'
+                         f'                raise ValueError')
+        else:
+            lines.append(f'            row[{i}] = c{n}(row[{i}])')
+    body = '\n'.join(lines)
+    fast = [conv for _, conv, _, _ in plan]
+    args = ', '.join(['isfinite'] + [f'c{n}' for n in range(len(plan))])
+    namespace = {}
+    exec(f'def convert_rows(rows, slow, {args}):\n'
+         f'    for row in rows:\n'
+         f'        try:\n{body}\n'
+         f'        except (ValueError, TypeError):\n'
+         f'            slow(row)\n'
+         f'    return rows\n', namespace)
+    fn = namespace['convert_rows']
+    fn.__defaults__ = (convert_slow, math.isfinite) + tuple(fast)
+    return fn
+
+
+def chain_stages(*stages):
+    """Une funciones rows -> rows (las None se omiten) en una sola; None si no queda ninguna."""
+    stages = [s for s in stages if s is not None]
+    if not stages:
+        return None
+    if len(stages) == 1:
+        return stages[0]
+
+    def run(rows):
+        for stage in stages:
+            stage(rows)
+        return rows
+    return run
+
+
+def failures_summary(failures):
+    if not failures:
+        return 'Type conversion: OK'
+    return 'Type conversion failures (kept as text): ' + ', '.join(f'{k}={n}' for k, n in sorted(failures.items()))
+
+
+def row_stages(conn, table, columns, codec=None, convert=True, timestamps='keep', failures=None):
+    """Preparación en el lugar de las filas de `table` antes del INSERT: tipos y luego JSON (json_codec)."""
+    return chain_stages(
+        compile_row_converter(conn, table, columns, timestamps, failures) if convert else None,
+        row_minifier(codec, columns, json_columns(conn, table), table) if codec else None)